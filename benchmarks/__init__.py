@@ -0,0 +1,6 @@
+"""性能基准
+
+不依赖stralib、数据库和plasma store即可运行：_stralib_shim模块提供cheetah用到的stralib的替身，synthetic模块生成数据表和分红送配数据的替身，
+memory_store模块在无法启动plasma store时提供进程内的替身。
+运行方法：python -m benchmarks.run --sizes small medium --output result.json
+"""
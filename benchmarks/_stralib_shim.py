@@ -0,0 +1,98 @@
+"""stralib的最小替身，使基准在没有stralib（及其数据库、交易日历配置）的环境中也能运行
+
+cheetah是stralib的子包，部分模块在模块级从上级包导入交易日历、数据读取函数等。install()构造一个替身上级包，
+把cheetah作为它的子包加载，再以cheetah.*的名称登记到sys.modules，之后`from cheetah.xxx import ...`得到的就是替身上级包中的模块。
+交易日历按工作日计算，与synthetic.trade_days一致；get_series_data缺省返回synthetic生成的分红送配数据，场景可以换成与其规模一致的SyntheticTables。
+"""
+import importlib
+import importlib.util
+import os
+import pkgutil
+import sys
+import types
+from datetime import datetime
+from typing import Iterable, Set, Tuple
+
+import pandas as pd
+
+from .synthetic import SyntheticTables
+
+PARENT = "_stralib_shim"
+CHEETAH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cheetah")
+
+
+class FastTdate(object):
+    """按工作日计算的交易日历"""
+
+    @staticmethod
+    def is_tdate(day: datetime) -> bool:
+        return pd.Timestamp(day).weekday() < 5
+
+    @staticmethod
+    def last_tdate(day: datetime) -> datetime:
+        """day之前（不含）的最后一个交易日"""
+        return (pd.Timestamp(day).normalize() - pd.offsets.BDay()).to_pydatetime()
+
+    @staticmethod
+    def query_all_tdates(start: datetime, end: datetime, include_stop: bool = True) -> list:
+        days = pd.bdate_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())
+        if not include_stop:
+            days = days[days < pd.Timestamp(end)]
+        return list(days.strftime("%Y%m%d"))
+
+
+def tdates_2_tdate_ranges(tdates: Iterable[str]) -> Set[Tuple[datetime, datetime]]:
+    """把交易日（%Y%m%d）合并为连续的区间"""
+    ranges = set()
+    start = previous = None
+    for day in sorted(pd.Timestamp(day) for day in tdates):
+        if previous is None or day != previous + pd.offsets.BDay():
+            if previous is not None:
+                ranges.add((start.to_pydatetime(), previous.to_pydatetime()))
+            start = day
+        previous = day
+    if previous is not None:
+        ranges.add((start.to_pydatetime(), previous.to_pydatetime()))
+    return ranges
+
+
+DEFAULT_TABLES = SyntheticTables(n_symbols=100, n_columns=1)
+
+
+def get_series_data(name: str, start: str, end: str, cols=None) -> pd.DataFrame:
+    """缺省规模（100只证券）的合成分红（equ_div）和配股（equ_allot）数据，见SyntheticTables.series_data"""
+    return DEFAULT_TABLES.series_data(name, start, end, cols)
+
+
+def get_config(key: str):
+    return None  # 替身没有配置，基准总是显式传入store名称
+
+
+def _module(name: str, package: bool = False, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    if package:
+        module.__path__ = []
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    """登记替身上级包并加载cheetah的所有模块，cheetah已经导入时不做任何事"""
+    if "cheetah" in sys.modules:
+        return
+    parent = _module(PARENT, package=True, FastTdate=FastTdate, get_series_data=get_series_data)
+    _module(f"{PARENT}.fb", package=True)
+    _module(f"{PARENT}.fb.date_time", tdates_2_tdate_ranges=tdates_2_tdate_ranges)
+    _module(f"{PARENT}.loader", get_config=get_config)
+    spec = importlib.util.spec_from_file_location(f"{PARENT}.cheetah", os.path.join(CHEETAH_DIR, "__init__.py"), submodule_search_locations=[CHEETAH_DIR])
+    cheetah = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = parent.cheetah = cheetah
+    spec.loader.exec_module(cheetah)
+    sys.modules[f"{PARENT}.singleton"] = importlib.import_module(f"{PARENT}.cheetah.singleton")
+    sys.modules["cheetah"] = cheetah
+    for module in pkgutil.iter_modules([CHEETAH_DIR]):
+        try:
+            sys.modules[f"cheetah.{module.name}"] = importlib.import_module(f"{PARENT}.cheetah.{module.name}")
+        except ImportError:
+            pass  # 依赖数据库驱动等替身没有提供的模块（如data_config），用到时再报错
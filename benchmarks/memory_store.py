@@ -0,0 +1,79 @@
+"""plasma客户端的进程内替身
+
+实现cheetah用到的plasma客户端接口（create/seal、get_buffers、put/get、put_raw_buffer、contains、delete、list、store_capacity），
+数据保存在本进程内存中，用于无法启动plasma store的环境。没有跨进程共享和引用计数，测得的是cheetah本身的开销。
+"""
+import threading
+from typing import Dict, List, Tuple
+
+import pyarrow as pa
+from pyarrow import plasma
+from pyarrow.plasma import ObjectNotAvailable, PlasmaObjectExists, PlasmaStoreFull
+
+
+class MemoryStore(object):
+    def __init__(self, capacity: int):
+        """
+        :param capacity: 容量（字节），超过时与plasma一样抛出PlasmaStoreFull
+        """
+        self.capacity = capacity
+        self._objects: Dict[plasma.ObjectID, Tuple[bytes, pa.Buffer]] = {}
+        self._unsealed: Dict[plasma.ObjectID, Tuple[bytes, pa.Buffer]] = {}
+        self._lock = threading.Lock()
+
+    def _used(self) -> int:
+        return sum(len(metadata) + buffer.size for metadata, buffer in list(self._objects.values()) + list(self._unsealed.values()))
+
+    def create(self, object_id: plasma.ObjectID, data_size: int, metadata: bytes = b"") -> pa.Buffer:
+        with self._lock:
+            if object_id in self._objects or object_id in self._unsealed:
+                raise PlasmaObjectExists(f"对象已存在：{object_id}")
+            if self._used() + data_size + len(metadata) > self.capacity:
+                raise PlasmaStoreFull(f"容量不足，无法写入{data_size}字节")
+            buffer = pa.allocate_buffer(data_size)
+            self._unsealed[object_id] = (metadata, buffer)
+            return buffer
+
+    def seal(self, object_id: plasma.ObjectID):
+        with self._lock:
+            self._objects[object_id] = self._unsealed.pop(object_id)
+
+    def put_raw_buffer(self, value, object_id: plasma.ObjectID = None, metadata: bytes = b"", memcopy_threads: int = 6) -> plasma.ObjectID:
+        object_id = object_id or plasma.ObjectID.from_random()
+        data = pa.py_buffer(value)
+        pa.FixedSizeBufferWriter(self.create(object_id, data.size, metadata)).write(data)
+        self.seal(object_id)
+        return object_id
+
+    def put(self, value, object_id: plasma.ObjectID = None, memcopy_threads: int = 6, serialization_context=None) -> plasma.ObjectID:
+        return self.put_raw_buffer(pa.serialize(value, context=serialization_context).to_buffer(), object_id)
+
+    def get_buffers(self, object_ids: List[plasma.ObjectID], timeout_ms: int = -1, with_meta: bool = False) -> list:
+        with self._lock:
+            items = [self._objects.get(object_id, (None, None)) for object_id in object_ids]
+        return items if with_meta else [buffer for _, buffer in items]
+
+    def get(self, object_ids, timeout_ms: int = -1, serialization_context=None):
+        single = isinstance(object_ids, plasma.ObjectID)
+        results = []
+        for buffer in self.get_buffers([object_ids] if single else object_ids, timeout_ms):
+            results.append(ObjectNotAvailable if buffer is None else pa.deserialize(buffer, context=serialization_context))
+        return results[0] if single else results
+
+    def contains(self, object_id: plasma.ObjectID) -> bool:
+        return object_id in self._objects
+
+    def delete(self, object_ids: List[plasma.ObjectID]):
+        with self._lock:
+            for object_id in object_ids:
+                self._objects.pop(object_id, None)
+
+    def list(self) -> Dict[plasma.ObjectID, dict]:
+        with self._lock:
+            return {object_id: {"data_size": buffer.size, "metadata_size": len(metadata), "state": "sealed"} for object_id, (metadata, buffer) in self._objects.items()}
+
+    def store_capacity(self) -> int:
+        return self.capacity
+
+    def disconnect(self):
+        pass
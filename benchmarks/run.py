@@ -0,0 +1,286 @@
+"""运行性能基准，结果以JSON输出，便于比较不同版本
+
+场景：
+- cold_backfill：从数据表全量获取数据并按列分片写入store
+- incremental_refresh：已有历史数据，获取最新一个交易日的数据，合并后写入新的一代
+- cache_roundtrip：CaihuiTableOperator.to_cache/from_cache的HDF5缓存读写
+- hishty_build：构建分红送配信息Hishty
+- client_get：DataClient读取Arrow IPC格式的整个数据框
+- client_get_data：DataClient从按列分片的数据中读取若干列
+
+用法：python -m benchmarks.run --sizes small medium --repeat 3 --output result.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import plasma
+
+from . import _stralib_shim
+
+_stralib_shim.install()  # cheetah的部分模块需要stralib，没有stralib时使用替身
+
+from cheetah import hishty  # noqa: E402
+from cheetah.arrow_store import put_table, dataframe_to_table  # noqa: E402
+from cheetah.client import DataClient  # noqa: E402
+from cheetah.connection_pool import PlasmaConnectionPool  # noqa: E402
+from cheetah.hishty import Hishty  # noqa: E402
+from cheetah.plasma_store import start_plasma_store, generation_object_id  # noqa: E402
+from cheetah.publication import PublishedPointers  # noqa: E402
+from cheetah.super_dataframe import SuperDataFrameMan  # noqa: E402
+
+from .memory_store import MemoryStore  # noqa: E402
+from .synthetic import SyntheticTables, trade_days
+
+Size = namedtuple("Size", ["n_symbols", "n_days", "n_columns"])
+
+SIZES = {
+    "small": Size(100, 250, 10),
+    "medium": Size(1000, 500, 20),
+    "large": Size(4000, 1000, 40),
+}
+
+END_DATE = datetime(2020, 12, 31)
+COLUMNS_PER_TABLE = 5
+
+
+@contextmanager
+def open_store(work_dir: str, capacity: int, use_plasma: bool = True):
+    """启动plasma store，无法启动时使用进程内的MemoryStore
+
+    :return: (store名称, 客户端, 类型)
+    """
+    store_name = os.path.join(work_dir, "plasma")
+    proc = None
+    if use_plasma:
+        try:
+            store_name, proc = start_plasma_store(store_name, capacity)
+            time.sleep(0.5)
+            if proc.poll() is not None:
+                raise RuntimeError(f"plasma store启动失败，返回码{proc.returncode}")
+            client = plasma.connect(store_name, num_retries=20)
+        except Exception:
+            logging.warning("无法启动plasma store，使用进程内的MemoryStore", exc_info=True)
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+            proc = None
+    if proc is None:
+        client = MemoryStore(capacity)
+    try:
+        yield store_name, client, "plasma" if proc is not None else "memory"
+    finally:
+        client.disconnect()
+        if proc is not None:
+            proc.kill()
+
+
+def make_client(store_name: str, store_client) -> DataClient:
+    """创建读取基准用的DataClient，使用MemoryStore时连接池直接借出这个进程内的store"""
+    pool = PlasmaConnectionPool(store_name, connect=lambda _: store_client) if isinstance(store_client, MemoryStore) else None
+    return DataClient(store_name, pool=pool)
+
+
+def measure(work, repeat: int, setup=None, teardown=None) -> dict:
+    """重复执行work，setup和teardown不计时
+
+    :return: {"seconds": [...], "best":..., "median":...}
+    """
+    seconds = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        result = work(state)
+        seconds.append(time.perf_counter() - start)
+        if teardown:
+            teardown(state, result)
+    return {"seconds": seconds, "best": min(seconds), "median": statistics.median(seconds)}
+
+
+def stored_bytes(store_client, object_ids) -> int:
+    object_dict = store_client.list()
+    return sum(object_dict[object_id]["data_size"] + object_dict[object_id]["metadata_size"] for object_id in object_ids if object_id in object_dict)
+
+
+class Benchmark(object):
+    def __init__(self, size_name: str, size: Size, work_dir: str, store_name: str, store_client, repeat: int):
+        self.size_name = size_name
+        self.size = size
+        self.work_dir = work_dir
+        self.store_name = store_name
+        self.store_client = store_client
+        self.repeat = repeat
+        self.tables = SyntheticTables(size.n_symbols, size.n_columns, max(1, size.n_columns // COLUMNS_PER_TABLE))
+        self.days = trade_days(END_DATE, size.n_days)
+        self.start, self.end = self.days[0].to_pydatetime(), self.days[-1].to_pydatetime()
+        metadata_file = os.path.join(work_dir, f"metadata_{size_name}.yaml")
+        self.tables.write_metadata(metadata_file)
+        self.sdf_man = SuperDataFrameMan(metadata_file, start=self.start, table_operator=self.tables)
+        self._generation = 0
+
+    def result(self, scenario: str, **values) -> dict:
+        return {"scenario": scenario, "size": self.size_name, **self.size._asdict(), "rows": self.size.n_symbols * self.size.n_days, **values}
+
+    def next_object_id(self) -> plasma.ObjectID:
+        self._generation += 1
+        return generation_object_id(f"bench_{self.size_name}", self._generation)
+
+    def delete(self, object_ids):
+        self.store_client.delete(list(object_ids))
+
+    def cold_backfill(self) -> dict:
+        sizes = []
+
+        def work(object_id):
+            df = self.sdf_man.fetch_data(self.start, self.end)
+            return self.sdf_man.store(self.store_client, df, object_id)
+
+        def teardown(object_id, _):
+            object_ids = self.sdf_man.object_ids(object_id)
+            sizes.append(stored_bytes(self.store_client, object_ids))
+            self.delete(object_ids)
+
+        timing = measure(work, self.repeat, self.next_object_id, teardown)
+        return self.result("cold_backfill", bytes=sizes[-1], **timing)
+
+    def incremental_refresh(self) -> dict:
+        last_day = self.end
+        history = self.sdf_man.fetch_data(self.start, self.days[-2].to_pydatetime())
+        base_id = self.sdf_man.store(self.store_client, history, self.next_object_id())
+
+        def work(object_id):
+            stored = self.sdf_man.load(self.store_client, base_id)
+            merged = self.sdf_man.merge_data(stored, self.sdf_man.fetch_data(last_day, last_day))
+            return self.sdf_man.store(self.store_client, merged, object_id)
+
+        timing = measure(work, self.repeat, self.next_object_id, lambda object_id, _: self.delete(self.sdf_man.object_ids(object_id)))
+        self.delete(self.sdf_man.object_ids(base_id))
+        return self.result("incremental_refresh", **timing)
+
+    def cache_roundtrip(self) -> dict:
+        try:
+            from cheetah.data_config import CaihuiTableOperator
+            import tables  # noqa: F401  HDF5缓存需要pytables
+        except ImportError as e:
+            return self.result("cache_roundtrip", skipped=f"无法导入：{e}")
+        cache_dir = os.path.join(self.work_dir, f"cache_{self.size_name}")
+        os.makedirs(cache_dir, exist_ok=True)
+        with mock.patch.object(CaihuiTableOperator, "hdf5_path", cache_dir), mock.patch.dict(CaihuiTableOperator.table_dict):
+            CaihuiTableOperator._init_caihui_table(self.tables.table_definitions())
+            CaihuiTableOperator._CaihuiTableOperator__compile()
+            table_name = next(iter(self.tables.tables))
+            start, end = self.start.strftime("%Y%m%d"), self.end.strftime("%Y%m%d")
+            df = self.tables.query(table_name, start, end)
+
+            def remove_cache(*_):
+                file_name = os.path.join(cache_dir, f"{table_name}.hdf5")
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+
+            write = measure(lambda _: CaihuiTableOperator.to_cache(df, table_name, start, end), self.repeat, remove_cache)
+            CaihuiTableOperator.to_cache(df, table_name, start, end)
+            read = measure(lambda _: CaihuiTableOperator.from_cache(table_name, start, end), self.repeat)
+            remove_cache()
+        return self.result("cache_roundtrip", to_cache=write, from_cache=read, best=write["best"] + read["best"])
+
+    def hishty_build(self) -> dict:
+        start, end = self.start.strftime("%Y%m%d"), self.end.strftime("%Y%m%d")
+        with mock.patch.object(hishty, "get_series_data", self.tables.series_data):
+            timing = measure(lambda _: Hishty(start, end), self.repeat)
+        return self.result("hishty_build", **timing)
+
+    def client_get(self) -> dict:
+        equipment_id = f"bench_frame_{self.size_name}"
+        df = self.sdf_man.fetch_data(self.start, self.end)
+        pointers = PublishedPointers(self.store_name)
+        object_id = put_table(self.store_client, dataframe_to_table(df.reset_index()), generation_object_id(equipment_id, 1))
+        pointers.publish(equipment_id, 1)
+        client = make_client(self.store_name, self.store_client)
+        timing = measure(lambda _: client.get_dataframe(equipment_id), self.repeat)
+        pointers.unpublish(equipment_id)
+        self.delete([object_id])
+        return self.result("client_get", bytes=df.memory_usage(deep=True).sum().item(), **timing)
+
+    def client_get_data(self) -> dict:
+        equipment_id = SuperDataFrameMan.__SUPER_DATA_FRAME_OBJECT_ID__
+        df = self.sdf_man.fetch_data(self.start, self.end)
+        object_id = self.sdf_man.store(self.store_client, df, generation_object_id(equipment_id, 1))
+        pointers = PublishedPointers(self.store_name)
+        pointers.publish(equipment_id, 1)
+        client = make_client(self.store_name, self.store_client)
+        cols = list(df.columns[: max(1, len(df.columns) // 4)])  # 读取四分之一的列、后一半的日期
+        middle = self.days[len(self.days) // 2].to_pydatetime()
+        timing = measure(lambda _: client.get_data(middle, self.end, cols, self.sdf_man), self.repeat)
+        pointers.unpublish(equipment_id)
+        self.delete(self.sdf_man.object_ids(object_id))
+        return self.result("client_get_data", read_columns=len(cols), **timing)
+
+    SCENARIOS = ["cold_backfill", "incremental_refresh", "cache_roundtrip", "hishty_build", "client_get", "client_get_data"]
+
+    def run(self, scenarios) -> list:
+        results = []
+        for scenario in scenarios:
+            logging.info(f"{self.size_name}: {scenario}...")
+            try:
+                results.append(getattr(self, scenario)())
+            except Exception as e:
+                logging.exception(f"{self.size_name}: {scenario}出错")
+                results.append(self.result(scenario, error=repr(e)))
+        return results
+
+
+def git_version() -> str or None:
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="cheetah性能基准")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(SIZES), help="数据规模，缺省small medium")
+    parser.add_argument("--scenarios", nargs="+", default=Benchmark.SCENARIOS, choices=Benchmark.SCENARIOS, help="运行的场景，缺省全部")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景的重复次数，缺省3")
+    parser.add_argument("--store-memory", type=int, default=4000, help="store的容量（M），缺省4000")
+    parser.add_argument("--no-plasma", action="store_true", help="不启动plasma store，直接使用进程内的MemoryStore")
+    parser.add_argument("--output", help="结果文件，缺省输出到标准输出")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cheetah_bench_") as work_dir:
+        with open_store(work_dir, int(args.store_memory * 1e6), use_plasma=not args.no_plasma) as (store_name, store_client, store_type):
+            for size_name in args.sizes:
+                results.extend(Benchmark(size_name, SIZES[size_name], work_dir, store_name, store_client, args.repeat).run(args.scenarios))
+    report = {
+        "version": git_version(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+        "store": store_type,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            file.write(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""合成数据
+
+SyntheticTables是CaihuiTableOperator的进程内替身，按(交易日 × 证券 × 列)生成数据，同一天的数据每次生成都相同，
+因此分段获取和一次获取得到的数据一致，可以用来测量全量回补和每日增量更新。
+"""
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from ruamel.yaml import YAML
+
+INDEX_NAMES = ["date", "证券代码"]  # 与CaihuiTableOperator.query返回的索引一致
+
+
+def trade_days(end: datetime, periods: int) -> pd.DatetimeIndex:
+    """用工作日近似交易日"""
+    return pd.bdate_range(end=end, periods=periods)
+
+
+class SyntheticTables(object):
+    def __init__(self, n_symbols: int, n_columns: int, n_tables: int = 1, seed: int = 0):
+        """
+        :param n_symbols: 证券数量
+        :param n_columns: 所有数据表的列数之和
+        :param n_tables: 数据表数量，列平均分到各表
+        :param seed: 随机数种子
+        """
+        self.symbols = np.array([f"{600000 + i:06d}.CNSESH" for i in range(n_symbols)])
+        self.seed = seed
+        self.tables: Dict[str, List[str]] = {f"SYN{t}": [] for t in range(max(1, n_tables))}
+        table_names = list(self.tables)
+        for c in range(n_columns):
+            self.tables[table_names[c % len(table_names)]].append(f"COL{c}")
+
+    def query(self, table_name: str, start_datetime: str = None, end_datetime: str = None) -> pd.DataFrame:
+        """与CaihuiTableOperator.query的参数和返回格式相同：以(date, 证券代码)为索引的数据框"""
+        cols = self.tables[table_name]
+        days = pd.bdate_range(start_datetime, end_datetime)
+        n = len(self.symbols)
+        values = np.empty((len(days) * n, len(cols)))
+        for i, day in enumerate(days):
+            rng = np.random.default_rng([self.seed, int(table_name[3:]), int(day.strftime("%Y%m%d"))])
+            values[i * n : (i + 1) * n] = rng.standard_normal((n, len(cols)))
+        index = pd.MultiIndex.from_arrays([np.repeat(days.values, n), np.tile(self.symbols, len(days))], names=INDEX_NAMES)
+        return pd.DataFrame(values, index=index, columns=cols)
+
+    def factor_name(self, col: str) -> str:
+        """合成数据的Factor统一名称，与数据表列名不同，用alias对应"""
+        return f"因子{col[3:]}"
+
+    def write_metadata(self, file_name: str):
+        """生成SuperDataFrameMan使用的metadata.yaml"""
+        factors = {}
+        for table_name, cols in self.tables.items():
+            for col in cols:
+                factors[self.factor_name(col)] = {"dtype": "f8", "description": f"合成数据{col}", "belong_to": table_name, "alias": [col]}
+        with open(file_name, "w", encoding="utf8") as file:
+            YAML().dump({"Factors": factors}, file)
+
+    def table_definitions(self) -> dict:
+        """CaihuiTableOperator._init_caihui_table使用的数据表定义"""
+        return {
+            table_name: {
+                "type": "single_time_series_table",
+                "datetime_index": "date",
+                "other_indices": ["证券代码"],
+                "other_cols": cols,
+                "ch_index": "date",
+                "ch_keys": ["证券代码"],
+                "ch_other_cols": cols,
+                "sql": "",
+                "parse_dates": [],
+                "docs": "合成数据",
+            }
+            for table_name, cols in self.tables.items()
+        }
+
+    def series_data(self, name: str, start: str, end: str, cols: List[str] = None) -> pd.DataFrame:
+        """get_series_data的替身，生成Hishty需要的分红（equ_div）和配股（equ_allot）数据，每只证券每年约一次分红、每十年约一次配股"""
+        days = pd.bdate_range(start, end)
+        rng = np.random.default_rng([self.seed, len(days), 1 if name == "equ_div" else 2])
+        n_events = len(self.symbols) * max(1, len(days) // (250 if name == "equ_div" else 2500))
+        symbols = rng.choice(self.symbols, n_events)
+        dates = rng.choice(days.values, n_events)
+        if name == "equ_div":
+            return pd.DataFrame(
+                {
+                    "SYMBOL": symbols,
+                    "EX_DIV_DATE": pd.to_datetime(dates),
+                    "PER_CASH_DIV": np.round(rng.uniform(0, 1, n_events), 3),
+                    "PER_SHARE_DIV_RATIO": np.where(rng.random(n_events) < 0.2, 0.1, np.nan),
+                    "PER_SHARE_TRANS_RATIO": np.where(rng.random(n_events) < 0.1, 0.3, np.nan),
+                }
+            )
+        if name == "equ_allot":
+            return pd.DataFrame(
+                {"SYMBOL": symbols, "EX_RIGHTS_DATE": pd.to_datetime(dates), "ALLOTMENT_RATIO": 0.3, "ALLOTMENT_PRICE": np.round(rng.uniform(2, 20, n_events), 2)}
+            )
+        raise KeyError(f"合成数据中没有{name}")
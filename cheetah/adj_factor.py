@@ -0,0 +1,189 @@
+"""复权因子
+
+每个需要复权价格的进程都从分红送配信息逐条计算复权比例。AdjFactorMan在服务端每次刷新时计算一次，
+发布为按(symbol, div_date)排序的累计复权因子表，客户端用adjust_prices对整个价格面板做一次向量化计算。
+
+一个除权除息日对价格的影响与Hishty.div_signal相同（先送转股、再分红、最后配股），是价格的线性变换：
+    除权后价格 = scale * 除权前价格 + shift
+    scale = 1 / ((1 + share_div) * (1 + pg_rate))，shift = (pg_price * pg_rate - cash_div) / (1 + pg_rate)
+线性变换的复合仍是线性变换，因子表保存每只证券从第一个除权除息日起到各除权除息日（含）的累计变换，
+不需要除权前的收盘价，结果是精确的：
+- 后复权：(价格 - shift) / scale；
+- 前复权（到该证券最后一个除权除息日）：scale_last / scale * (价格 - shift) + shift_last。
+新的除权除息日只追加新的行，已有的行不变，所以刷新时只计算新增的除权除息日，再接在每只证券已有的最后一个累计变换之后。
+"""
+import logging
+from datetime import datetime
+from typing import Set, Tuple
+
+import numpy as np
+import pandas as pd
+from pyarrow.lib import SerializationContext
+from pyarrow.plasma import ObjectNotAvailable
+
+from .hishty import Hishty, HishtyMan
+from .partitioned_store import PartitionedData
+from .service import DataMan, STORAGE_ARROW
+
+ADJ_FACTOR_COLUMNS = ["symbol", "div_date", "scale", "shift"]
+FORWARD = "forward"  # 前复权
+BACKWARD = "backward"  # 后复权
+
+
+def empty_factors() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "symbol": pd.Series(dtype=object),
+            "div_date": pd.Series(dtype="datetime64[ns]"),
+            "scale": pd.Series(dtype="float64"),
+            "shift": pd.Series(dtype="float64"),
+        }
+    )
+
+
+def event_transforms(table: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """每个除权除息日对价格的线性变换(scale, shift)，table的列见hishty.HISHTY_COLUMNS"""
+    share_div = table["share_div"].to_numpy(dtype="float64")
+    cash_div = table["cash_div"].to_numpy(dtype="float64")
+    pg_price = table["pg_price"].to_numpy(dtype="float64")
+    pg_rate = np.where(pg_price > 0, table["pg_rate"].to_numpy(dtype="float64"), 0.0)  # 与div_signal相同，配股比例和配股价都有时才配股
+    scale = 1 / ((1 + share_div) * (1 + pg_rate))
+    shift = (pg_price * pg_rate - cash_div) / (1 + pg_rate)
+    return scale, shift
+
+
+def cumulative_factors(table: pd.DataFrame) -> pd.DataFrame:
+    """由分红送配信息计算每只证券到各除权除息日（含）的累计变换，从table中第一个除权除息日开始累计
+
+    :param table: 分红送配信息，见Hishty.table
+    :return: 按(symbol, div_date)排序的因子表，列见ADJ_FACTOR_COLUMNS
+    """
+    if table.empty:
+        return empty_factors()
+    table = table.sort_values(["symbol", "div_date"], kind="stable", ignore_index=True)
+    step_scale, step_shift = event_transforms(table)
+    symbols = table["symbol"].to_numpy(dtype=object)
+    # 依次复合：scale_i = k_i * scale_(i-1)，shift_i = k_i * shift_(i-1) + h_i，展开后shift_i = scale_i * sum(h_j / scale_j)
+    scale = pd.Series(step_scale).groupby(symbols, sort=False).cumprod().to_numpy()
+    shift = scale * pd.Series(step_shift / scale).groupby(symbols, sort=False).cumsum().to_numpy()
+    return pd.DataFrame({"symbol": symbols, "div_date": pd.to_datetime(table["div_date"], format="%Y%m%d").to_numpy(), "scale": scale, "shift": shift})
+
+
+def _locate(factors: pd.DataFrame, dates: np.ndarray, symbols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """每个(日期, 证券)的累计变换：该证券在这一天（含）之前最后一个除权除息日的变换，没有时为恒等变换
+
+    :param factors: 因子表，见cumulative_factors
+    :param dates: 一维datetime64[ns]数组
+    :param symbols: 一维证券代码数组
+    :return: 形状为(len(dates), len(symbols))的(scale, shift)
+    """
+    shape = (len(dates), len(symbols))
+    if factors.empty:
+        return np.ones(shape), np.zeros(shape)
+    codes = pd.Index(pd.unique(np.concatenate([factors["symbol"].to_numpy(dtype=object), symbols])))
+    div_dates = factors["div_date"].to_numpy(dtype="datetime64[ns]")
+    all_dates = np.unique(np.concatenate([div_dates, dates]))
+    width = len(all_dates)
+    # (证券, 日期)编码为一个整数，日期用在所有日期中的排名，一次二分查找找到每个格子之前最后一个除权除息日
+    keys = codes.get_indexer(factors["symbol"].to_numpy(dtype=object)).astype(np.int64) * width + np.searchsorted(all_dates, div_dates)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    grid = codes.get_indexer(symbols).astype(np.int64)[None, :] * width + np.searchsorted(all_dates, dates)[:, None]
+    positions = np.maximum(np.searchsorted(keys, grid, side="right") - 1, 0)
+    found = (keys[positions] <= grid) & (keys[positions] // width == grid // width)
+    rows = order[positions]
+    return np.where(found, factors["scale"].to_numpy(dtype="float64")[rows], 1.0), np.where(found, factors["shift"].to_numpy(dtype="float64")[rows], 0.0)
+
+
+def adjustment(factors: pd.DataFrame, dates, symbols, method: str = FORWARD) -> Tuple[np.ndarray, np.ndarray]:
+    """价格面板的复权系数(a, b)，复权价格 = 价格 * a + b
+
+    :param factors: 因子表，见cumulative_factors、DataClient.get_adj_factors
+    :param dates: 面板的行（交易日）
+    :param symbols: 面板的列（证券代码）
+    :param method: FORWARD（前复权，到各证券最后一个除权除息日）或BACKWARD（后复权）
+    :return: 形状为(len(dates), len(symbols))的两个数组
+    """
+    dates = pd.DatetimeIndex(dates).to_numpy(dtype="datetime64[ns]")
+    symbols = np.asarray(symbols, dtype=object)
+    scale, shift = _locate(factors, dates, symbols)
+    if method == BACKWARD:
+        return 1 / scale, -shift / scale
+    if method != FORWARD:
+        raise ValueError(f"不支持的复权方式：{method}")
+    last_scale, last_shift = _locate(factors, np.array([np.datetime64("2262-01-01", "ns")]), symbols)
+    a = last_scale / scale
+    return a, last_shift - a * shift
+
+
+def adjust_prices(prices: pd.DataFrame, factors: pd.DataFrame, method: str = FORWARD) -> pd.DataFrame:
+    """对以交易日为行、证券代码为列的价格面板复权，见adjustment"""
+    a, b = adjustment(factors, prices.index, prices.columns, method)
+    return pd.DataFrame(prices.to_numpy(dtype="float64") * a + b, index=prices.index, columns=prices.columns)
+
+
+class AdjFactorMan(DataMan):
+    __ADJ_FACTOR_OBJECT_ID__ = "adj_factor__________"
+    depends_on = (HishtyMan.__HISHTY_OBJECT_ID__,)
+    # 与分红送配信息同时刷新，本轮先刷新分红送配信息
+    refresh_policy = HishtyMan.refresh_policy
+    storage_format = STORAGE_ARROW
+
+    def __init__(self, start: datetime = datetime(2010, 1, 1), today_toggle=False):
+        super().__init__(self.__ADJ_FACTOR_OBJECT_ID__, "复权因子", start, today_toggle)
+
+    def _hishty(self, start: datetime or str = None, end: datetime or str = None) -> Hishty or None:
+        """服务中当前发布的分红送配信息，按年分区保存时只读取[start, end]所在的分区"""
+        data = self.dependency(HishtyMan.__HISHTY_OBJECT_ID__)
+        if data is ObjectNotAvailable:
+            return None
+        if isinstance(data, PartitionedData):
+            data = data.materialize(Hishty.concat, start, end)
+        return data if start is None else data.slice(start, end or "99991231")
+
+    def fetch_data(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """[start, end]内的除权除息日从start开始累计的变换，merge_data再接到已有的因子之后"""
+        hishty = self._hishty(start, end)
+        return empty_factors() if hishty is None else cumulative_factors(hishty.table)
+
+    @staticmethod
+    def merge_data(old_data: pd.DataFrame, insert_data: pd.DataFrame) -> pd.DataFrame:
+        """新数据中第一个除权除息日及之后的已有因子被替换，新数据的累计变换接在每只证券此前最后一个累计变换之后"""
+        if insert_data.empty:
+            return old_data
+        old = old_data[old_data["div_date"] < insert_data["div_date"].min()]
+        last = old.groupby("symbol", sort=False)[["scale", "shift"]].last()
+        base_scale = last["scale"].reindex(insert_data["symbol"]).fillna(1.0).to_numpy()
+        base_shift = last["shift"].reindex(insert_data["symbol"]).fillna(0.0).to_numpy()
+        scale = insert_data["scale"].to_numpy()
+        rebased = insert_data.assign(scale=scale * base_scale, shift=scale * base_shift + insert_data["shift"].to_numpy())
+        merged = pd.concat([old, rebased], ignore_index=True)
+        return merged.sort_values(["symbol", "div_date"], kind="stable", ignore_index=True)
+
+    def check_data(self, data: pd.DataFrame or ObjectNotAvailable) -> Set[Tuple[datetime, datetime]]:
+        """与当前发布的分红送配信息比较，只计算已有因子最后一个除权除息日（含）之后的部分"""
+        covered = None if data is ObjectNotAvailable or data is None or data.empty else data["div_date"].max().to_pydatetime()
+        hishty = self._hishty(covered)
+        if hishty is None:
+            logging.info(f"{self.数据名称}: 分红送配信息还没有发布，暂不计算。")
+            return set()
+        if hishty.table.empty:
+            return set()
+        start = covered or datetime.strptime(hishty.table["div_date"].iloc[0], "%Y%m%d")
+        end = datetime.strptime(hishty.table["div_date"].iloc[-1], "%Y%m%d")
+        if covered is not None and end == covered and (data["div_date"] == covered).sum() == len(hishty.table):
+            return set()  # 没有新的除权除息日，最后一天的记录也没有变化
+        return {(start, end)}
+
+    # 复权因子表以STORAGE_ARROW格式保存，读写都经过to_arrow/from_arrow，不使用SerializationContext，以下方法不会被调用
+    @classmethod
+    def get_serialization_context(cls) -> SerializationContext:
+        raise NotImplementedError(f"{cls.__name__}以Arrow IPC格式保存，不使用SerializationContext")
+
+    @staticmethod
+    def serialize(data):
+        raise NotImplementedError("复权因子表以Arrow IPC格式保存，不需要序列化")
+
+    @staticmethod
+    def deserialize(data):
+        raise NotImplementedError("复权因子表以Arrow IPC格式保存，不需要反序列化")
@@ -0,0 +1,110 @@
+"""以Arrow IPC格式在plasma store中保存数据框
+
+SerializationContext方式保存的对象，每次读取都要反序列化出完整的python对象；Arrow IPC格式保存的是列式内存布局，
+读者直接把共享内存映射为pyarrow.Table，数值列转换为pandas时也不需要复制数据。
+"""
+from typing import List
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import plasma
+from pyarrow.plasma import ObjectNotAvailable
+
+# 写入plasma对象的metadata，用于区分Arrow IPC格式和SerializationContext格式的对象
+ARROW_IPC_METADATA = b"arrow.ipc"
+
+
+def put_table(plasma_client, table: pa.Table, object_id: plasma.ObjectID, compression: str = None) -> plasma.ObjectID:
+    """把pyarrow.Table以Arrow IPC流格式写入plasma store
+
+    :param plasma_client: plasma客户端
+    :param table: 欲保存的表
+    :param object_id: 保存的object_id
+    :param compression: 压缩buffer的算法（lz4、zstd），缺省不压缩；压缩后读者读取时要解压，不能直接引用共享内存
+    :return: object_id
+    """
+    if compression is not None:
+        sink = pa.BufferOutputStream()  # 压缩的结果只计算一次，再复制到plasma store
+        with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)) as writer:
+            writer.write_table(table)
+        data = sink.getvalue()
+        buffer = plasma_client.create(object_id, data.size, metadata=ARROW_IPC_METADATA)
+        pa.FixedSizeBufferWriter(buffer).write(data)
+        plasma_client.seal(object_id)
+        return object_id
+    sink = pa.MockOutputStream()  # 先计算需要的空间
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    buffer = plasma_client.create(object_id, sink.size(), metadata=ARROW_IPC_METADATA)
+    with pa.ipc.new_stream(pa.FixedSizeBufferWriter(buffer), table.schema) as writer:
+        writer.write_table(table)
+    plasma_client.seal(object_id)
+    return object_id
+
+
+def copy_object(plasma_client, source: plasma.ObjectID, target: plasma.ObjectID) -> plasma.ObjectID:
+    """把一个对象的原始字节（含metadata）复制为另一个对象，压缩的对象不解压
+
+    :raise KeyError: 没有source这个对象
+    """
+    [(metadata, data)] = plasma_client.get_buffers([source], timeout_ms=0, with_meta=True)
+    if data is None:
+        raise KeyError(f"plasma store中没有{source}")
+    buffer = plasma_client.create(target, data.size, metadata=metadata)
+    pa.FixedSizeBufferWriter(buffer).write(data)
+    plasma_client.seal(target)
+    return target
+
+
+def get_table(plasma_client, object_id: plasma.ObjectID, timeout_ms: int = 0) -> pa.Table or ObjectNotAvailable:
+    """读取Arrow IPC格式的对象，返回的表直接引用共享内存，不复制数据
+
+    :return: pyarrow.Table，对象不存在时返回ObjectNotAvailable
+    """
+    [(metadata, buffer)] = plasma_client.get_buffers([object_id], timeout_ms=timeout_ms, with_meta=True)
+    if buffer is None:
+        return ObjectNotAvailable
+    if metadata != ARROW_IPC_METADATA:
+        raise TypeError(f"对象{object_id}不是Arrow IPC格式")
+    return pa.ipc.open_stream(buffer).read_all()
+
+
+def decode_object(metadata: bytes, buffer, serialization_context=None):
+    """把get_buffers(with_meta=True)读取到的对象还原：Arrow IPC格式返回pyarrow.Table，其他格式用serialization_context反序列化
+
+    :return: 还原的数据，buffer为None（对象不存在）时返回ObjectNotAvailable
+    """
+    if buffer is None:
+        return ObjectNotAvailable
+    if metadata == ARROW_IPC_METADATA:
+        return pa.ipc.open_stream(buffer).read_all()
+    return pa.deserialize(buffer, serialization_context)  # 与plasma_client.get的反序列化方式相同
+
+
+def get_objects(plasma_client, object_ids: List[plasma.ObjectID], serialization_contexts: list = None, timeout_ms: int = 0) -> list:
+    """在一次store请求中读取多个任意格式的对象
+
+    :param serialization_contexts: 与object_ids一一对应的SerializationContext，缺省都为None
+    :return: 与object_ids一一对应的数据，对象不存在时为ObjectNotAvailable
+    """
+    items = plasma_client.get_buffers(object_ids, timeout_ms=timeout_ms, with_meta=True)
+    contexts = serialization_contexts or [None] * len(object_ids)
+    return [decode_object(metadata, buffer, context) for (metadata, buffer), context in zip(items, contexts)]
+
+
+def get_object(plasma_client, object_id: plasma.ObjectID, serialization_context=None, timeout_ms: int = 0):
+    """读取任意格式的对象：Arrow IPC格式返回pyarrow.Table，其他格式用serialization_context反序列化
+
+    :return: 读取到的数据，对象不存在时返回ObjectNotAvailable
+    """
+    return get_objects(plasma_client, [object_id], [serialization_context], timeout_ms)[0]
+
+
+def dataframe_to_table(df: pd.DataFrame) -> pa.Table:
+    """pandas数据框转换为pyarrow.Table，保留索引（RangeIndex只保存在元数据中）"""
+    return pa.Table.from_pandas(df)
+
+
+def table_to_dataframe(table: pa.Table) -> pd.DataFrame:
+    """pyarrow.Table转换为pandas数据框，没有空值的数值列不复制数据（只读视图）"""
+    return table.to_pandas(split_blocks=True)
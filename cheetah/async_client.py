@@ -0,0 +1,73 @@
+"""asyncio程序使用的数据客户端
+
+DataClient的读取是阻塞的，等待还没有发布的数据时会占住调用线程。AsyncDataClient把一次读取放到线程池执行，
+没有读到的数据用asyncio.sleep退避后再检查，等待期间事件循环可以继续处理其他任务。
+"""
+import asyncio
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Iterable, Dict, Any
+
+import pandas as pd
+from pyarrow import plasma
+
+from .arrow_store import table_to_dataframe
+from .client import DataClient, POLL_INTERVAL, MAX_POLL_INTERVAL
+from .hishty import Hishty, HishtyMan
+
+
+class AsyncDataClient(object):
+    def __init__(self, client: DataClient = None, executor: Executor = None):
+        """
+        :param client: 实际读取数据的DataClient，缺省为DataClient()
+        :param executor: 执行阻塞读取的线程池，缺省为事件循环的默认线程池
+        """
+        self.client = client or DataClient()
+        self.executor = executor
+
+    async def get_many(self, equipment_ids: Iterable[str], serialization_context=None, timeout: float = None) -> Dict[str, Any]:
+        """读取多个对象，有数据还没有发布时等待
+
+        :param serialization_context: 所有对象共用的SerializationContext，或{数据标识符: SerializationContext}
+        :param timeout: 最多等待的秒数，缺省一直等待，0表示不等待
+        :return: {数据标识符: 数据}，timeout为0时没有的数据为ObjectNotAvailable
+        :raise asyncio.TimeoutError: 超时仍有数据没有发布
+        """
+        equipment_ids = list(dict.fromkeys(equipment_ids))
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        results, missing, delay, first = {}, equipment_ids, POLL_INTERVAL, True
+        while True:
+            results.update(await loop.run_in_executor(self.executor, self.client.read_many, missing, serialization_context, first))
+            missing = [key for key in missing if results[key] is plasma.ObjectNotAvailable]
+            if not missing or timeout == 0:
+                return results
+            if deadline is not None and loop.time() >= deadline:
+                raise asyncio.TimeoutError(f"{timeout}秒内没有等到数据：{missing}")
+            await asyncio.sleep(delay if deadline is None else min(delay, deadline - loop.time()))
+            delay, first = min(delay * 2, MAX_POLL_INTERVAL), False
+
+    async def get(self, equipment_id, serialization_context=None, timeout: float = None):
+        """读取一个对象，见get_many"""
+        return (await self.get_many([equipment_id], serialization_context, timeout))[equipment_id]
+
+    async def get_dataframe(self, equipment_id, timeout: float = None) -> pd.DataFrame or None:
+        """读取Arrow IPC格式保存的数据框，timeout为0且没有数据时返回None"""
+        table = await self.get(equipment_id, timeout=timeout)
+        if table is plasma.ObjectNotAvailable:
+            return None
+        return table_to_dataframe(table)
+
+    async def get_hishty(self, start: datetime, end: datetime, timeout: float = None) -> Hishty or None:
+        """获取[start, end]的分红数据，数据还没有发布时等待，timeout为0且没有数据时返回None"""
+        equipment_id = HishtyMan.__HISHTY_OBJECT_ID__
+        manifest = await self.get(equipment_id, timeout=timeout)
+        if manifest is plasma.ObjectNotAvailable:
+            return None
+        loop = asyncio.get_running_loop()
+        parts = await loop.run_in_executor(
+            self.executor, self.client.read_partitions, equipment_id, manifest, start, end, HishtyMan.get_serialization_context()
+        )
+        if parts is plasma.ObjectNotAvailable:
+            return None
+        return Hishty.concat(parts).slice(start, end)
@@ -0,0 +1,189 @@
+"""plasma store的容量管理
+
+客户端用AccessRecorder记录每个对象的访问次数、最后访问时间和未命中次数，定期写到与plasma store的socket放在一起的目录中，
+每个进程一个文件；服务端用CapacityManager汇总访问记录和各对象的大小，在内存紧张时按LRU或LFU淘汰最冷的对象，
+拒绝写入放不下的数据，并在客户端再次需要被淘汰的对象时重新加载。
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Set, Iterable
+
+# 访问统计：访问次数、最后访问时间（time.time()）、未命中次数、最后未命中时间
+AccessStat = namedtuple("AccessStat", ["count", "last_access", "misses", "last_miss"])
+
+POLICY_LRU = "lru"
+POLICY_LFU = "lfu"
+
+
+def access_dir_name(plasma_store_name: str) -> str:
+    return f"{plasma_store_name}.access"
+
+
+class AccessRecorder(object):
+    """客户端的访问记录，每个进程写一个文件，未命中时立即写出，以便服务端尽快重新加载"""
+
+    def __init__(self, plasma_store_name: str, flush_interval: int = 10):
+        """
+        :param plasma_store_name: plasma store的socket名称
+        :param flush_interval: 写出访问记录的间隔（秒），缺省10秒
+        """
+        self.dir_name = access_dir_name(plasma_store_name)
+        self.flush_interval = flush_interval
+        self._stats: Dict[str, List] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, equipment_id: str, hit: bool):
+        now = time.time()
+        with self._lock:
+            stat = self._stats.setdefault(equipment_id, [0, 0, 0, 0])
+            if hit:
+                stat[0] += 1
+                stat[1] = now
+            else:
+                stat[2] += 1
+                stat[3] = now
+        if not hit or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把访问记录写到 {plasma_store_name}.access/{pid}.json"""
+        with self._lock:
+            stats = json.dumps(self._stats)
+            self._last_flush = time.monotonic()
+        try:
+            os.makedirs(self.dir_name, exist_ok=True)
+            file_name = os.path.join(self.dir_name, f"{os.getpid()}.json")
+            with open(f"{file_name}.tmp", "w", encoding="utf8") as file:
+                file.write(stats)
+            os.replace(f"{file_name}.tmp", file_name)
+        except OSError:
+            logging.warning(f"写入访问记录失败：{self.dir_name}", exc_info=True)
+
+
+def read_access_stats(plasma_store_name: str) -> Dict[str, AccessStat]:
+    """汇总所有客户端进程的访问记录"""
+    result: Dict[str, AccessStat] = {}
+    for file_name in glob.glob(os.path.join(access_dir_name(plasma_store_name), "*.json")):
+        try:
+            with open(file_name, "r", encoding="utf8") as file:
+                stats = json.load(file)
+        except (OSError, ValueError):
+            continue  # 文件可能正在被替换，下次再读
+        for equipment_id, (count, last_access, misses, last_miss) in stats.items():
+            old = result.get(equipment_id, AccessStat(0, 0, 0, 0))
+            result[equipment_id] = AccessStat(old.count + count, max(old.last_access, last_access), old.misses + misses, max(old.last_miss, last_miss))
+    return result
+
+
+class CapacityManager(object):
+    """服务端的容量管理：记录各对象大小和访问情况，决定淘汰哪些对象、是否允许写入新数据"""
+
+    def __init__(self, plasma_store_name: str, policy: str = POLICY_LRU, high_watermark: float = 0.9, low_watermark: float = 0.8):
+        """
+        :param plasma_store_name: plasma store的socket名称
+        :param policy: 淘汰策略，POLICY_LRU（最久未访问的先淘汰）或POLICY_LFU（访问次数最少的先淘汰）
+        :param high_watermark: 使用率超过该值时开始淘汰，缺省0.9
+        :param low_watermark: 淘汰到使用率低于该值为止，缺省0.8
+        """
+        if policy not in (POLICY_LRU, POLICY_LFU):
+            raise ValueError(f"不支持的淘汰策略：{policy}")
+        self.plasma_store_name = plasma_store_name
+        self.policy = policy
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.sizes: Dict[str, int] = {}
+        self.access: Dict[str, AccessStat] = {}
+        self.evicted: Dict[str, float] = {}  # {数据标识符: 淘汰时间}
+        self.reserved = 0  # 已允许写入但还没有写完的字节数
+        self._lock = threading.Lock()
+
+    def refresh_access(self):
+        self.access = read_access_stats(self.plasma_store_name)
+
+    def update_size(self, equipment_id: str, size: int):
+        self.sizes[equipment_id] = size
+
+    def coldness(self, equipment_id: str):
+        """冷度排序键，越小越冷，未命中也说明客户端需要这个对象，同样计入访问"""
+        stat = self.access.get(equipment_id, AccessStat(0, 0, 0, 0))
+        count, last_access = stat.count + stat.misses, max(stat.last_access, stat.last_miss)
+        if self.policy == POLICY_LFU:
+            return count, last_access
+        return last_access, count
+
+    def select_victims(self, need_bytes: int, candidates: Iterable[str], colder_than: str = None) -> List[str] or None:
+        """从候选对象中选出最冷的若干个，使其大小之和不小于need_bytes
+
+        :param need_bytes: 需要腾出的字节数
+        :param candidates: 可以淘汰的数据标识符
+        :param colder_than: 只淘汰比这个对象更冷的对象，避免为了写入冷数据而淘汰热数据
+        :return: 需要淘汰的数据标识符，无法腾出足够空间时返回None
+        """
+        if need_bytes <= 0:
+            return []
+        limit = self.coldness(colder_than) if colder_than is not None else None
+        victims, freed = [], 0
+        for equipment_id in sorted(candidates, key=self.coldness):
+            if limit is not None and self.coldness(equipment_id) >= limit:
+                break
+            if self.sizes.get(equipment_id, 0) <= 0:
+                continue
+            victims.append(equipment_id)
+            freed += self.sizes[equipment_id]
+            if freed >= need_bytes:
+                return victims
+        return None
+
+    def pressure_victims(self, used: int, capacity: int, candidates: Iterable[str]) -> List[str]:
+        """使用率超过high_watermark时，选出需要淘汰的对象使使用率降到low_watermark以下
+
+        全部候选对象都淘汰也降不到low_watermark时不淘汰任何对象，此时内存被不能淘汰的数据占用，淘汰也无济于事，由写入前的容量检查拒绝写入
+        """
+        if capacity <= 0 or used <= capacity * self.high_watermark:
+            return []
+        need_bytes = used - int(capacity * self.low_watermark)
+        victims = self.select_victims(need_bytes, candidates)
+        if victims is None:
+            logging.warning(f"内存使用率{used / capacity:.0%}，可以淘汰的数据不足以降到{self.low_watermark:.0%}以下，不淘汰。")
+            return []
+        return victims
+
+    def admit(self, size: int, used: int, capacity: int) -> int:
+        """登记一次写入，返回还需要腾出的字节数（0表示可以直接写入）"""
+        with self._lock:
+            shortage = used + self.reserved + size - capacity
+            if shortage <= 0:
+                self.reserved += size
+                return 0
+            return shortage
+
+    def reserve(self, size: int):
+        with self._lock:
+            self.reserved += size
+
+    def release(self, size: int):
+        """写入完成（或失败）后释放登记的字节数"""
+        with self._lock:
+            self.reserved = max(0, self.reserved - size)
+
+    def mark_evicted(self, equipment_id: str):
+        self.evicted[equipment_id] = time.time()
+        self.sizes.pop(equipment_id, None)
+
+    def demanded(self) -> Set[str]:
+        """被淘汰后又被客户端访问（未命中）的对象，需要重新加载"""
+        result = set()
+        for equipment_id, evicted_at in self.evicted.items():
+            stat = self.access.get(equipment_id)
+            if stat is not None and max(stat.last_access, stat.last_miss) > evicted_at:
+                result.add(equipment_id)
+        return result
+
+    def readmit(self, equipment_id: str):
+        self.evicted.pop(equipment_id, None)
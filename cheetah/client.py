@@ -1,36 +1,275 @@
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from typing import List, Dict, Iterable, Any
 
+import pandas as pd
+import pyarrow as pa
 from pyarrow import plasma
 
+from .arrow_store import get_objects, table_to_dataframe
+from .capacity import AccessRecorder
+from .connection_pool import PlasmaConnectionPool
+from .metrics import REGISTRY
+from .object_cache import ObjectCache
+from .partitioned_store import PartitionedData, is_manifest
+from .adj_factor import AdjFactorMan, adjust_prices, FORWARD
 from .hishty import Hishty, HishtyMan
-from .plasma_store import equipment_id_to_object_id, object_id_to_equipment_id
+from .lazy_query import LazyQuery
+from .plasma_store import equipment_id_to_object_id, generation_object_id
+from .publication import PublishedPointers
+from .super_dataframe import SuperDataFrameMan
 from ..singleton import Singleton
 from ..loader import get_config
 
+BATCH_OBJECT = "batch"  # 一次读取多个对象时GET_SECONDS的object标签，整批的用时无法分摊到每个对象
+GET_SECONDS = REGISTRY.histogram("cheetah_client_get_seconds", "DataClient读取数据的用时，一次读取多个对象时object为batch", ("object",))
+GET_TOTAL = REGISTRY.counter("cheetah_client_get_total", "DataClient读取数据的次数，result为hit或miss", ("object", "result"))
+CACHE_TOTAL = REGISTRY.counter("cheetah_client_cache_total", "DataClient反序列化对象缓存的命中次数，result为hit或miss", ("object", "result"))
+CACHE_BYTES = REGISTRY.gauge("cheetah_client_cache_bytes", "DataClient反序列化对象缓存占用的字节数")
+
+# 等待还没有发布的数据时，检查间隔从POLL_INTERVAL秒开始加倍，最长MAX_POLL_INTERVAL秒
+POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.5
+# 分区在反序列化对象缓存中的键为"{数据标识符}#{分区名}"，按分区的object_id缓存，各代之间沿用
+PARTITION_SEPARATOR = "#"
+
 
 class DataClient(Singleton):
-    def __init__(self, plasma_store_name: str = None):
+    def __init__(self, plasma_store_name: str = None, pool: PlasmaConnectionPool = None, cache_bytes: int = 256 * 1024 * 1024):
+        """
+        :param plasma_store_name: plasma store的socket名称，缺省为配置中的DATA_SERVICE_NAME
+        :param pool: 与其他组件共用的连接池，缺省新建一个，多线程读取时每个线程借用一个连接
+        :param cache_bytes: 反序列化对象缓存的字节预算，缺省256M，0表示不缓存
+        """
         self.plasma_store_name = plasma_store_name or get_config("DATA_SERVICE_NAME")
-        self.__plasma_client__ = plasma.connect(plasma_store_name)
+        self.pool = pool or PlasmaConnectionPool(self.plasma_store_name)
+        with self.pool.connection():
+            pass  # 立即建立一个连接，plasma store不可用时尽早报错
+        self.pointers = PublishedPointers(self.plasma_store_name)
+        self.access_recorder = AccessRecorder(self.plasma_store_name)  # 服务端据此决定淘汰和重新加载哪些数据
+        self.cache = ObjectCache(cache_bytes)
         logging.info("plasma服务器连接成功！")
 
-    def get(self, equipment_id, serialization_context):
-        """获取共享内存中的数据"""
-        object_id = equipment_id_to_object_id(equipment_id)
-        result = self.__plasma_client__.get(object_id, timeout_ms=0, serialization_context=serialization_context)
-        return result
+    def resolve(self, equipment_id) -> plasma.ObjectID:
+        """根据发布指针找到装备当前一代数据的object_id，没有发布指针的按老的规则转换"""
+        generation = self.pointers.resolve(equipment_id)
+        if generation is None:
+            return equipment_id_to_object_id(equipment_id)
+        return generation_object_id(equipment_id, generation)
+
+    def get(self, equipment_id, serialization_context=None, timeout_ms: int = 0):
+        """获取共享内存中的数据，Arrow IPC格式的数据返回pyarrow.Table（直接引用共享内存），其他数据用serialization_context反序列化
+
+        反序列化得到的对象会被缓存，发布指针仍指向同一代数据时直接返回缓存的实例，调用者不要修改返回的对象。
+        :param timeout_ms: 数据还没有发布时等待的毫秒数，缺省不等待，-1表示一直等待；异步程序请使用AsyncDataClient
+        :return: 数据，没有数据时返回ObjectNotAvailable
+        """
+        return self.get_many([equipment_id], serialization_context, timeout_ms)[equipment_id]
+
+    def get_many(self, equipment_ids: Iterable[str], serialization_context=None, timeout_ms: int = 0) -> Dict[str, Any]:
+        """一次读取多个对象，缓存中没有的对象在一次store请求中读取
+
+        :param equipment_ids: 数据标识符
+        :param serialization_context: 所有对象共用的SerializationContext，或{数据标识符: SerializationContext}
+        :param timeout_ms: 有数据还没有发布时等待的毫秒数，缺省不等待，-1表示一直等待
+        :return: {数据标识符: 数据}，没有的数据为ObjectNotAvailable
+        """
+        equipment_ids = list(dict.fromkeys(equipment_ids))
+        deadline = None if timeout_ms < 0 else time.monotonic() + timeout_ms / 1000
+        results = self.read_many(equipment_ids, serialization_context)
+        delay = POLL_INTERVAL
+        missing = [key for key in equipment_ids if results[key] is plasma.ObjectNotAvailable]
+        while missing and (deadline is None or time.monotonic() < deadline):
+            time.sleep(delay if deadline is None else min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+            results.update(self.read_many(missing, serialization_context, record_misses=False))
+            missing = [key for key in missing if results[key] is plasma.ObjectNotAvailable]
+        return results
+
+    def read_many(self, equipment_ids: List[str], serialization_context=None, record_misses: bool = True) -> Dict[str, Any]:
+        """不等待地读取多个对象，参数见get_many
+
+        :param record_misses: 是否记录未命中，重复检查等待中的数据时不再重复记录
+        """
+        start = time.perf_counter()
+        instance = self._drop_stale_cache()
+        results, pending = {}, {}
+        for equipment_id in equipment_ids:
+            object_id = self.resolve(equipment_id)
+            cached = self.cache.get(equipment_id, (instance, object_id))
+            if cached is plasma.ObjectNotAvailable:
+                pending[equipment_id] = object_id
+            else:
+                CACHE_TOTAL.inc(object=equipment_id, result="hit")
+                results[equipment_id] = cached
+        if pending:
+            with self.pool.connection() as plasma_client:
+                fetched = self._fetch(plasma_client, pending, serialization_context)
+                # 解析指针和读取之间旧的一代可能刚被回收，重新解析一次
+                retry = {key: self.resolve(key) for key, value in fetched.items() if value is plasma.ObjectNotAvailable}
+                retry = {key: object_id for key, object_id in retry.items() if object_id != pending[key]}
+                if retry:
+                    fetched.update(self._fetch(plasma_client, retry, serialization_context))
+                    pending.update(retry)
+                self._cache_fetched(plasma_client, pending, fetched, instance)
+            results.update(fetched)
+        GET_SECONDS.observe(time.perf_counter() - start, object=equipment_ids[0] if len(equipment_ids) == 1 else BATCH_OBJECT)
+        for equipment_id in equipment_ids:
+            hit = results[equipment_id] is not plasma.ObjectNotAvailable
+            if hit or record_misses:
+                self._record(equipment_id, hit=hit)
+        return results
+
+    @staticmethod
+    def _fetch(plasma_client, object_ids: Dict[str, plasma.ObjectID], serialization_context) -> Dict[str, Any]:
+        keys = list(object_ids)
+        if isinstance(serialization_context, dict):
+            contexts = [serialization_context.get(key) for key in keys]
+        else:
+            contexts = [serialization_context] * len(keys)
+        return dict(zip(keys, get_objects(plasma_client, [object_ids[key] for key in keys], contexts)))
+
+    def _cache_fetched(self, plasma_client, object_ids: Dict[str, plasma.ObjectID], fetched: Dict[str, Any], instance: str or None):
+        """缓存反序列化得到的对象，Arrow IPC格式不需要反序列化，不缓存
+
+        :param instance: 读取时的plasma store实例标识，与object_id一起作为缓存的版本
+        """
+        to_cache = [key for key, value in fetched.items() if value is not plasma.ObjectNotAvailable and not isinstance(value, pa.Table)]
+        if not to_cache:
+            return
+        object_dict = plasma_client.list()
+        for key in to_cache:
+            info = object_dict.get(object_ids[key])
+            CACHE_TOTAL.inc(object=key, result="miss")
+            self.cache.put(key, (instance, object_ids[key]), fetched[key], info["data_size"] + info["metadata_size"] if info else 0)
+        CACHE_BYTES.set(self.cache.used_bytes)
+
+    def _drop_stale_cache(self) -> str or None:
+        """作废发布指针已不再指向（包括已取消发布、store已重新启动）的缓存，反序列化的对象可能引用共享内存，及时释放以免推迟服务端回收旧一代数据
+
+        :return: 当前的plasma store实例标识
+        """
+        instance = self.pointers.instance
+        for key, (cached_instance, object_id) in self.cache.cached():
+            equipment_id = key.split(PARTITION_SEPARATOR, 1)[0]
+            generation = self.pointers.resolve(equipment_id)
+            if cached_instance != instance or generation is None:
+                self.cache.invalidate(key)
+            elif key == equipment_id and generation_object_id(equipment_id, generation) != object_id:
+                self.cache.invalidate(key)  # 分区写入后不再修改，读取时按清单中的object_id判断是否仍有效
+        return instance
+
+    def _record(self, equipment_id, hit: bool):
+        GET_TOTAL.inc(object=equipment_id, result="hit" if hit else "miss")
+        self.access_recorder.record(equipment_id, hit=hit)
+
+    def get_partitions(
+        self, equipment_id, start: datetime = None, end: datetime = None, serialization_context=None, timeout_ms: int = 0
+    ) -> list or plasma.ObjectNotAvailable:
+        """读取按日期分区保存的数据中与[start, end]有交集的分区，见partitioned_store
+
+        :param timeout_ms: 数据还没有发布时等待的毫秒数，见get
+        :return: 按日期排序的[分区的数据]，没有数据时返回ObjectNotAvailable
+        """
+        manifest = self.get(equipment_id, timeout_ms=timeout_ms)
+        if manifest is plasma.ObjectNotAvailable:
+            return manifest
+        return self.read_partitions(equipment_id, manifest, start, end, serialization_context)
+
+    def read_partitions(
+        self, equipment_id, manifest: pa.Table, start: datetime = None, end: datetime = None, serialization_context=None
+    ) -> list or plasma.ObjectNotAvailable:
+        """按已读取的清单读取与[start, end]有交集的分区，缓存中没有的分区在一次store请求中读取
+
+        :return: 按日期排序的[分区的数据]，分区已被回收（清单是很早以前读取的）时返回ObjectNotAvailable
+        """
+        if not is_manifest(manifest):
+            raise TypeError(f"{equipment_id}不是按日期分区保存的数据")
+        data = PartitionedData.from_table(manifest)
+        object_ids = {f"{equipment_id}{PARTITION_SEPARATOR}{name}": data.partitions[name] for name in data.names(start, end)}
+        instance = self._drop_stale_cache()
+        results, pending = {}, {}
+        for key, object_id in object_ids.items():
+            cached = self.cache.get(key, (instance, object_id))
+            if cached is plasma.ObjectNotAvailable:
+                pending[key] = object_id
+            else:
+                CACHE_TOTAL.inc(object=equipment_id, result="hit")
+                results[key] = cached
+        if pending:
+            with self.pool.connection() as plasma_client:
+                fetched = self._fetch(plasma_client, pending, serialization_context)
+                if any(value is plasma.ObjectNotAvailable for value in fetched.values()):
+                    return plasma.ObjectNotAvailable
+                self._cache_fetched(plasma_client, pending, fetched, instance)
+            results.update(fetched)
+        return [results[key] for key in object_ids]
+
+    def get_dataframe(self, equipment_id) -> pd.DataFrame or None:
+        """获取Arrow IPC格式保存的数据框，没有空值的数值列不复制数据（只读）"""
+        table = self.get(equipment_id)
+        if table is plasma.ObjectNotAvailable:
+            return None
+        return table_to_dataframe(table)
 
     def contains(self, equipment_id):
-        return self.__plasma_client__.contains(equipment_id_to_object_id(equipment_id))
+        with self.pool.connection() as plasma_client:
+            return plasma_client.contains(self.resolve(equipment_id))
 
     def list(self):
-        return [object_id_to_equipment_id(object_id) for object_id in self.__plasma_client__.list()]
+        return self.pointers.list()
 
     def store_capacity(self):
-        return self.__plasma_client__.store_capacity()
+        with self.pool.connection() as plasma_client:
+            return plasma_client.store_capacity()
+
+    def get_hishty(self, start: datetime, end: datetime, timeout_ms: int = 0) -> Hishty or None:
+        """获取[start, end]的分红数据，没有数据时返回None
+
+        分红数据按年分区保存，只读取[start, end]所在的年份；服务端发布新的一代后通常只有当年的分区需要重新反序列化，见get_partitions。
+        :param timeout_ms: 数据还没有发布时等待的毫秒数，缺省不等待，-1表示一直等待；异步程序请使用AsyncDataClient.get_hishty
+        """
+        parts = self.get_partitions(HishtyMan.__HISHTY_OBJECT_ID__, start, end, HishtyMan.get_serialization_context(), timeout_ms)
+        if parts is plasma.ObjectNotAvailable:
+            return None
+        return Hishty.concat(parts).slice(start, end)
+
+    def get_adj_factors(self) -> pd.DataFrame or None:
+        """获取服务端计算的累计复权因子表，按(symbol, div_date)排序，没有数据时返回None，见adj_factor"""
+        return self.get_dataframe(AdjFactorMan.__ADJ_FACTOR_OBJECT_ID__)
+
+    def adjust_prices(self, prices: pd.DataFrame, method: str = FORWARD) -> pd.DataFrame or None:
+        """对以交易日为行、证券代码为列的价格面板复权，不再在本进程中逐条计算分红送配信息，没有复权因子时返回None
+
+        :param method: adj_factor.FORWARD（前复权）或adj_factor.BACKWARD（后复权）
+        """
+        factors = self.get_adj_factors()
+        if factors is None:
+            return None
+        return adjust_prices(prices, factors, method)
+
+    def get_data(self, start: datetime, end: datetime, cols: List[str], sdf_man: SuperDataFrameMan) -> pd.DataFrame:
+        """获取[start, end]的若干列组成的数据框，以(tdate, symbol)为索引，只读取用到的列"""
+        with GET_SECONDS.time(object=sdf_man.数据标识符), self.attached(sdf_man):
+            return sdf_man.get(start, end, cols)
+
+    def scan(self, sdf_man: SuperDataFrameMan) -> LazyQuery:
+        """超级数据框的延迟查询，collect时关联当前一代数据，见lazy_query"""
+        return sdf_man.scan(prepare=lambda: self.attached(sdf_man))
+
+    @contextmanager
+    def attached(self, sdf_man: SuperDataFrameMan):
+        """借用一个连接，让sdf_man关联当前发布的一代数据，with块中sdf_man用这个连接读取列分片，with块结束后连接归还连接池
 
-    def get_hishty(self, start: datetime, end: datetime) -> Hishty or None:
-        """获取分红数据, 注意：如果没有数据则永远等待，请自行先调用contains判断是否具备数据！"""
-        hishty = self.get(HishtyMan.__HISHTY_OBJECT_ID__, serialization_context=HishtyMan.get_serialization_context())
-        return Hishty(start, end, {key: hishty.symbol_infos[key] for key in hishty.symbol_infos if start.strftime("%Y%m%d") <= key <= end.strftime("%Y%m%d")})
+        :raise KeyError: 还没有数据
+        """
+        with self.pool.connection() as plasma_client:
+            try:
+                sdf_man.attach(plasma_client, self.resolve(sdf_man.数据标识符))
+            except KeyError:
+                self._record(sdf_man.数据标识符, hit=False)
+                raise
+            self._record(sdf_man.数据标识符, hit=True)
+            yield sdf_man
@@ -0,0 +1,98 @@
+"""plasma store连接池
+
+每次操作都connect/disconnect的代价是建立socket和握手，在对象多、并发刷新时这部分开销会超过小操作本身；
+而且引用随连接断开才被释放，容易说不清哪些对象还被引用。连接池中的连接长期保持，由服务的各线程和DataClient共用，
+每次用connection()借出，用完归还；连接出错时丢弃，下次借用时重新建立。
+
+plasma对象的引用随读取到的buffer（包括直接引用共享内存的pyarrow.Table、numpy数组）释放而释放，
+连接长期保持后，使用者要在用完数据后及时丢掉这些引用，否则旧一代数据的删除会一直被推迟。
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Callable
+
+from pyarrow import plasma
+
+
+class PlasmaConnectionPool(object):
+    def __init__(self, plasma_store_name: str, max_size: int = 8, connect: Callable = None):
+        """
+        :param plasma_store_name: plasma store的socket名称
+        :param max_size: 最多同时建立的连接数，全部借出时借用者等待归还
+        :param connect: 建立连接的函数，参数为plasma_store_name，缺省为plasma.connect
+        """
+        self.plasma_store_name = plasma_store_name
+        self.max_size = max(1, max_size)
+        self._connect = connect or plasma.connect
+        self._idle: List = []
+        self._size = 0  # 已建立（空闲加借出）的连接数
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: float = None):
+        """借出一个连接，优先使用空闲连接，没有空闲连接且未达到上限时新建
+
+        :param timeout: 等待的秒数，缺省一直等待
+        :raise TimeoutError: 超时仍没有可用的连接
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("连接池已关闭")
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if not self._condition.wait(timeout):
+                    raise TimeoutError(f"{timeout}秒内没有可用的plasma连接")
+        try:
+            return self._connect(self.plasma_store_name)
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, plasma_client, discard: bool = False):
+        """归还连接，discard为True时断开这个连接（如连接已出错）"""
+        with self._condition:
+            if discard or self._closed:
+                self._size -= 1
+                self._disconnect(plasma_client)
+            else:
+                self._idle.append(plasma_client)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """借用一个连接，with语句结束时归还，出现OSError（如plasma store已重启）时丢弃这个连接"""
+        plasma_client = self.acquire(timeout)
+        try:
+            yield plasma_client
+        except OSError:
+            self.release(plasma_client, discard=True)
+            raise
+        except BaseException:
+            self.release(plasma_client)
+            raise
+        else:
+            self.release(plasma_client)
+
+    def close(self):
+        """断开所有空闲连接，借出的连接归还时断开"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for plasma_client in idle:
+            self._disconnect(plasma_client)
+
+    @staticmethod
+    def _disconnect(plasma_client):
+        try:
+            plasma_client.disconnect()
+        except Exception:
+            logging.debug("断开plasma连接出错", exc_info=True)
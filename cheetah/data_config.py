@@ -277,7 +277,7 @@ class CaihuiTableOperator(object):
         # 写入前需获取对应表文件的lock，等待timeout秒,超时则放弃(抛出LockTimeout)
         file_name = os.path.join(cls.hdf5_path, "{}.hdf5".format(table_name))
         with pd.HDFStore(file_name, mode="a") as store:
-            if cls.get_type(table_name) in (cls.SingleVersionTable):
+            if cls.get_type(table_name) in (cls.SingleVersionTable,):
                 # 如果是versiontabl类别，直接保存
                 store.put(key, df, format="t")
                 return True
@@ -352,7 +352,7 @@ class CaihuiTableOperator(object):
             if not os.path.isfile(file_name):
                 return False
             with pd.HDFStore(file_name, mode="r") as store:
-                if cls.get_type(table_name) in (cls.SingleVersionTable):
+                if cls.get_type(table_name) in (cls.SingleVersionTable,):
                     # TODO 是否拆分version 和 timeseries为两个类
                     if not version_name:
                         version_name = "latest"
@@ -388,7 +388,7 @@ class CaihuiTableOperator(object):
         file_name = os.path.join(cls.hdf5_path, "{}.hdf5".format(table_name))
         if not os.path.isfile(file_name):
             return None
-        if cls.get_type(table_name) in (cls.SingleVersionTable):
+        if cls.get_type(table_name) in (cls.SingleVersionTable,):
             where = None
         else:
             where = "{datetime_index}>=pd.Timestamp(start_datetime) &" "{datetime_index}<=pd.Timestamp(end_datetime)".format(
@@ -396,7 +396,7 @@ class CaihuiTableOperator(object):
             )
             # where = 'date>=pd.Timestamp(start_datetime) & date<=pd.Timestamp(end_datetime)'
         with pd.HDFStore(file_name, mode="r") as store:
-            if cls.get_type(table_name) in (cls.SingleVersionTable):
+            if cls.get_type(table_name) in (cls.SingleVersionTable,):
                 return store.get(key)
             for cached_key in store.keys():
                 cached_table_name, cached_start, cached_end = cached_key.split(":")
@@ -0,0 +1,113 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Callable, Any, Iterable, Tuple
+
+
+class RefreshExecutor(object):
+    """数据刷新执行器
+
+    用有界线程池并发执行各个DataMan的刷新，刷新主要耗时在数据库IO上，并发后一轮刷新的耗时接近最慢的单个对象。
+    调度规则：
+    1. 依赖：DataMan.depends_on中列出的数据标识符在本轮先刷新完成（无论成功与否），才开始刷新依赖它的对象；
+    2. 并发组：DataMan.concurrency_group相同的对象共享group_limits中设置的并发上限，用于保护同一个数据源；
+    3. 优先级：在可以执行的对象中，按priority给出的键从小到大执行（如数据最旧、数据最小的优先）；
+    4. stop_event被设置后不再提交新的刷新，等待正在执行的刷新结束后返回。
+    """
+
+    def __init__(self, max_workers: int = 4, group_limits: Dict[str, int] = None, stop_event: threading.Event = None):
+        """
+        :param max_workers: 最大并发刷新数量，缺省为4
+        :param group_limits: 并发组的并发上限，{并发组名称: 上限}，没有设置的并发组只受max_workers限制
+        :param stop_event: 停止事件，通常传入DataService.stop_event
+        """
+        self.max_workers = max(1, max_workers)
+        self.group_limits = group_limits or {}
+        self.stop_event = stop_event or threading.Event()
+
+    def run_cycle(self, objects: Dict[str, Any], work: Callable[[Any], Any], priority: Callable[[Any], Any] = None) -> Dict[str, float]:
+        """执行一轮刷新
+
+        :param objects: 本轮需要刷新的对象，{数据标识符: DataMan}
+        :param work: 刷新单个对象的函数，通常是DataService.deal_object，单个对象的异常不会影响其他对象
+        :param priority: 计算对象优先级键的函数，值越小越先执行，缺省按数据标识符排序
+        :return: {数据标识符: 刷新耗时（秒）}，只包含本轮实际执行了的对象
+        """
+        priority = priority or (lambda item: 0)
+        pending = dict(objects)
+        waiting_on = {key: {dep for dep in self._depends_on(item) if dep in pending and dep != key} for key, item in pending.items()}
+        ready = []  # 堆：(优先级键, 数据标识符)
+        running = {}  # future -> (数据标识符, 开始时间)
+        group_running: Dict[str, int] = {}
+        durations: Dict[str, float] = {}
+
+        def push_ready():
+            for key in [key for key, deps in waiting_on.items() if not deps]:
+                del waiting_on[key]
+                heapq.heappush(ready, (priority(pending[key]), key))
+
+        push_ready()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="refresh") as pool:
+            while ready or waiting_on or running:
+                if not self.stop_event.is_set():
+                    deferred = []
+                    while ready and len(running) < self.max_workers:
+                        item_priority, key = heapq.heappop(ready)
+                        group = self._concurrency_group(pending[key])
+                        if group is not None and group_running.get(group, 0) >= max(1, self.group_limits.get(group, self.max_workers)):
+                            deferred.append((item_priority, key))
+                            continue
+                        if group is not None:
+                            group_running[group] = group_running.get(group, 0) + 1
+                        running[pool.submit(self._run_one, work, pending[key])] = (key, time.monotonic())
+                    for entry in deferred:
+                        heapq.heappush(ready, entry)
+                    if not running and not ready and waiting_on:
+                        logging.error(f"刷新依赖存在循环，忽略依赖关系继续刷新：{sorted(waiting_on)}")
+                        for deps in waiting_on.values():
+                            deps.clear()
+                        push_ready()
+                        continue
+                if not running:
+                    break  # 已停止且没有正在执行的刷新
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, started = running.pop(future)
+                    durations[key] = time.monotonic() - started
+                    group = self._concurrency_group(pending[key])
+                    if group is not None:
+                        group_running[group] -= 1
+                    for deps in waiting_on.values():
+                        deps.discard(key)
+                push_ready()
+        return durations
+
+    @staticmethod
+    def _run_one(work: Callable[[Any], Any], item: Any):
+        """执行单个刷新，保证单个对象的异常不影响其他对象"""
+        try:
+            work(item)
+        except Exception:
+            logging.exception(f"{getattr(item, '数据名称', item)}: 刷新执行出错，已跳过。")
+
+    @staticmethod
+    def _depends_on(item: Any) -> Iterable[str]:
+        return getattr(item, "depends_on", None) or ()
+
+    @staticmethod
+    def _concurrency_group(item: Any) -> str or None:
+        return getattr(item, "concurrency_group", None)
+
+
+def stale_small_first(sizes: Dict[str, int]) -> Callable[[Any], Tuple]:
+    """生成"数据最旧、数据最小优先"的优先级函数
+
+    :param sizes: {数据标识符: 数据大小（字节）}，没有记录的对象视为0（通常是尚未加载的对象，应尽快加载）
+    """
+
+    def key(dataman) -> Tuple:
+        return dataman.数据区间[1], sizes.get(dataman.数据标识符, 0), dataman.数据标识符
+
+    return key
@@ -0,0 +1,183 @@
+"""Factor计算引擎
+
+设置了calculate_method的Factor由其他Factor计算得到，不再从数据表获取：
+    20日涨跌幅:
+        calculate_method: [pct_change, [20]]   # 计算函数及其额外参数
+        dependencies: [收盘价]                  # 依赖的Factor，按顺序作为计算函数的前几个参数
+        lookback: 20                           # 计算一个交易日需要之前多少个交易日的数据
+计算函数是面板（见panel）上的向量化numpy函数：每个依赖是形状为(交易日数, 证券数)的二维数组，返回同样形状的数组。
+calculate_method中的函数可以是register注册的名称，也可以是"包.模块.函数"。
+
+FactorEngine按dependencies建立依赖图并分层，同一层的Factor互不依赖，在进程池中并行计算。
+每次刷新只计算新增的交易日：每个Factor从新数据往前多取lookback个交易日作为输入，只保留新交易日的结果。
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Callable, Set
+
+import numpy as np
+import pandas as pd
+
+from .metadata_catalog import MetadataCatalog
+from .panel import Panel
+
+FUNCTIONS: Dict[str, Callable] = {}  # {名称: 计算函数}
+
+FactorSpec = namedtuple("FactorSpec", ["name", "function", "args", "dependencies", "lookback"])
+
+
+def register(name: str = None):
+    """注册计算函数，之后可以在calculate_method中用名称引用，缺省为函数名"""
+
+    def decorator(function: Callable) -> Callable:
+        FUNCTIONS[name or function.__name__] = function
+        return function
+
+    return decorator
+
+
+@register()
+def shift(values: np.ndarray, periods: int) -> np.ndarray:
+    """periods个交易日前的值"""
+    result = np.full(values.shape, np.nan)
+    if 0 < periods < len(values):
+        result[periods:] = values[:-periods]
+    elif periods == 0:
+        result[:] = values
+    return result
+
+
+@register()
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """最近window个交易日的均值，数据不足window个时为缺失值"""
+    return pd.DataFrame(values, dtype="float64").rolling(window).mean().to_numpy()
+
+
+@register()
+def pct_change(values: np.ndarray, periods: int = 1) -> np.ndarray:
+    """相对于periods个交易日前的变化率"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return values / shift(values, periods) - 1
+
+
+def resolve_function(method) -> Callable:
+    """calculate_method中的函数：可调用对象、注册的名称或"包.模块.函数" """
+    if callable(method):
+        return method
+    if method in FUNCTIONS:
+        return FUNCTIONS[method]
+    module_name, _, function_name = str(method).rpartition(".")
+    if not module_name:
+        raise ValueError(f"没有注册计算函数：{method}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def factor_specs(catalog: MetadataCatalog) -> Dict[str, FactorSpec]:
+    """元数据目录中需要计算的Factor
+
+    :raise ValueError: 依赖的Factor不存在或计算函数找不到
+    """
+    specs = {}
+    for name, factor in catalog.factors.items():
+        method = factor.get("calculate_method")
+        if not method:
+            continue
+        function, args = method[0], list(method[1]) if len(method) > 1 and method[1] else []
+        dependencies = list(factor.get("dependencies") or [])
+        unknown = [dep for dep in dependencies if dep not in catalog]
+        if unknown:
+            raise ValueError(f"{name}依赖的Factor不存在：{unknown}")
+        specs[name] = FactorSpec(name, resolve_function(function), args, dependencies, int(factor.get("lookback") or 0))
+    return specs
+
+
+def topological_levels(specs: Dict[str, FactorSpec]) -> List[List[str]]:
+    """把需要计算的Factor按依赖分层，每一层只依赖之前各层和数据表中的Factor
+
+    :raise ValueError: 依赖存在循环
+    """
+    waiting = {name: {dep for dep in spec.dependencies if dep in specs} for name, spec in specs.items()}
+    levels = []
+    while waiting:
+        level = sorted(name for name, deps in waiting.items() if not deps)
+        if not level:
+            raise ValueError(f"Factor的依赖存在循环：{sorted(waiting)}")
+        for name in level:
+            del waiting[name]
+        for deps in waiting.values():
+            deps.difference_update(level)
+        levels.append(level)
+    return levels
+
+
+def evaluate(function: Callable, args: list, inputs: List[np.ndarray]) -> np.ndarray:
+    """执行一个计算函数，在进程池中执行，必须是模块级函数"""
+    return np.asarray(function(*inputs, *args))
+
+
+class FactorEngine(object):
+    def __init__(self, catalog: MetadataCatalog, max_workers: int = None):
+        """
+        :param catalog: 元数据目录
+        :param max_workers: 进程池的进程数，缺省为CPU数（最多4个），0表示在当前进程中计算
+        :raise ValueError: 配置不合法，见factor_specs、topological_levels
+        """
+        self.specs = factor_specs(catalog)
+        self.levels = topological_levels(self.specs)
+        self.max_workers = min(4, os.cpu_count() or 1) if max_workers is None else max_workers
+        self.lookback = max((spec.lookback for spec in self.specs.values()), default=0)  # 增量计算最多需要往前多取的交易日数
+        self._pool: ProcessPoolExecutor or None = None
+
+    @property
+    def inputs(self) -> Set[str]:
+        """计算需要的所有Factor（包括需要计算的Factor本身）"""
+        return {dep for spec in self.specs.values() for dep in spec.dependencies} | set(self.specs)
+
+    def compute(self, panel: Panel, start_row: int = 0) -> Panel:
+        """计算面板中从start_row开始的交易日，结果写入面板，start_row之前的交易日保持不变
+
+        :param panel: 已放入依赖的Factor的面板，需要计算的Factor如果已在面板中，其中start_row之前是已经算好的值
+        :param start_row: 第一个新交易日所在的行
+        """
+        n_rows = panel.shape[0]
+        if start_row >= n_rows:
+            return panel
+        for level in self.levels:
+            jobs = {}
+            for name in level:
+                spec = self.specs[name]
+                missing = [dep for dep in spec.dependencies if not panel.has_factor(dep)]
+                if missing:
+                    logging.warning(f"{name}: 面板中没有依赖的Factor{missing}，跳过。")
+                    continue
+                lo = max(0, start_row - spec.lookback)
+                jobs[name] = (lo, [panel.factors[dep][lo:] for dep in spec.dependencies])
+            for name, (lo, result) in zip(jobs, self._run(jobs)):
+                if result.shape != (n_rows - lo, panel.shape[1]):
+                    raise ValueError(f"{name}: 计算结果的形状{result.shape}与输入{(n_rows - lo, panel.shape[1])}不一致")
+                if not panel.has_factor(name):
+                    panel.factors[name] = np.full(panel.shape, np.nan, dtype=np.result_type(result.dtype, np.float64))
+                panel.factors[name][start_row:] = result[start_row - lo :]
+        return panel
+
+    def _run(self, jobs: Dict[str, tuple]) -> list:
+        """计算一层Factor，返回[(开始行, 结果)]；多于一个Factor且允许使用进程池时并行计算"""
+        calls = [(self.specs[name].function, self.specs[name].args, inputs) for name, (_, inputs) in jobs.items()]
+        if self.max_workers > 0 and len(calls) > 1:
+            if self._pool is None:
+                # 服务进程中有多个线程（plasma连接、刷新线程），fork不安全，用spawn启动子进程
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            results = list(self._pool.map(evaluate, *zip(*calls)))
+        else:
+            results = [evaluate(*call) for call in calls]
+        return [(lo, result) for (lo, _), result in zip(jobs.values(), results)]
+
+    def close(self):
+        """关闭进程池，之后再计算时重新启动"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
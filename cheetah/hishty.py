@@ -1,6 +1,5 @@
 import logging
-from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, time
 from typing import List, Tuple, Dict, Set
 
 import numpy as np
@@ -9,78 +8,154 @@ import pyarrow as pa
 from pyarrow.plasma import ObjectNotAvailable
 from pyarrow.lib import SerializationContext
 
+from .partitioned_store import PartitionedData, PARTITION_YEAR, partition_name
+from .schedule import TradingDayPolicy
 from .service import DataMan, T
 from .. import get_series_data, FastTdate
 from ..fb.date_time import tdates_2_tdate_ranges
-from ..utils import create_empty_dataframe
+
+
+def _date_int(value: datetime or str) -> int:
+    """datetime或"%Y%m%d"格式的日期转换为整数，如20200101"""
+    return int(value.strftime("%Y%m%d")) if isinstance(value, datetime) else int(value)
+
+
+# 分红送配信息的列，每行是一只证券在一个除权除息日的信息，与symbol_infos中每条信息的字段相同
+HISHTY_COLUMNS = ["div_date", "symbol", "cash_div", "share_div", "pg_rate", "pg_price"]
+VALUE_COLUMNS = HISHTY_COLUMNS[2:]
+
+
+def empty_table() -> pd.DataFrame:
+    return pd.DataFrame({col: pd.Series(dtype=object if col in ("div_date", "symbol") else "float64") for col in HISHTY_COLUMNS})
+
+
+def _date_keys(values: pd.Series) -> np.ndarray:
+    """交易日（datetime或"%Y%m%d"）转换为"%Y%m%d"格式的字符串"""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values) or (len(values) and isinstance(values.iloc[0], datetime)):
+        dates = pd.DatetimeIndex(values)
+        return (dates.year * 10000 + dates.month * 100 + dates.day).astype(str).to_numpy(dtype=object)
+    return values.astype(str).to_numpy(dtype=object)
+
+
+def infos_to_table(symbol_infos: Dict[str, dict]) -> pd.DataFrame:
+    """{除权除息日: {证券: 信息}}转换为按(div_date, symbol)排序的表"""
+    rows = [[info[col] for col in HISHTY_COLUMNS] for infos in symbol_infos.values() for info in infos.values()]
+    if not rows:
+        return empty_table()
+    return pd.DataFrame(rows, columns=HISHTY_COLUMNS).sort_values(["div_date", "symbol"], kind="stable", ignore_index=True)
+
+
+def table_to_infos(table: pd.DataFrame) -> Dict[str, dict]:
+    """按(div_date, symbol)排序的表转换为{除权除息日: {证券: 信息}}"""
+    symbol_infos: Dict[str, dict] = {}
+    for row in zip(*(table[col].tolist() for col in HISHTY_COLUMNS)):
+        symbol_infos.setdefault(row[0], {})[row[1]] = dict(zip(HISHTY_COLUMNS, row))
+    return symbol_infos
+
+
+def _positive(values: pd.Series) -> np.ndarray:
+    """大于0的值保持不变，其他值（包括缺失值）为0"""
+    values = pd.to_numeric(values).to_numpy(dtype="float64", na_value=np.nan)
+    return np.where(values > 0, values, 0.0)
 
 
 class Hishty(object):
-    def __init__(self, start, end, symbol_infos=None):
+    def __init__(self, start, end, symbol_infos=None, table: pd.DataFrame = None):
         """
 
         :param start:
         :param end:
-        :param symbol_infos: 如果传入了则不再取数据
+        :param symbol_infos: {除权除息日: {证券: 信息}}，如果传入了则不再取数据
+        :param table: 按(div_date, symbol)排序的表（见HISHTY_COLUMNS），如果传入了则不再取数据
         """
         self.start = start
         self.end = end
-        self.symbol_infos = symbol_infos if symbol_infos is not None else self.symbol_hishty(start, end)
-        self.div_dates = self.symbol_infos.keys()
+        if table is None:
+            table = infos_to_table(symbol_infos) if symbol_infos is not None else self.symbol_table(start, end)
+        self.table = table
+        self._symbol_infos = symbol_infos  # 按日期、证券嵌套的字典，用到时才由table生成
+        # 每行的除权除息日，slice用二分查找取日期区间
+        self._row_dates = table["div_date"].to_numpy(dtype=np.int64) if len(table) else np.empty(0, dtype=np.int64)
+        self._date_keys = list(pd.unique(table["div_date"]))
+        self.div_dates = dict.fromkeys(self._date_keys).keys()
+        self._event_index: pd.MultiIndex or None = None  # (div_date, symbol)，批量处理时与持仓、信号连接
 
-    def symbol_hishty(self, start: str, end: str):
+    @property
+    def symbol_infos(self) -> Dict[str, dict]:
+        """{除权除息日: {证券: {div_date:..., symbol:..., cash_div:..., share_div:..., pg_rate:..., pg_price:...}}}，第一次用到时才生成"""
+        if self._symbol_infos is None:
+            self._symbol_infos = table_to_infos(self.table)
+        return self._symbol_infos
+
+    @classmethod
+    def from_table(cls, table: pd.DataFrame) -> "Hishty":
+        """由按(div_date, symbol)排序的表建立，区间为表中第一个和最后一个除权除息日"""
+        if table.empty:
+            return cls("", "", table=table)
+        return cls(table["div_date"].iloc[0], table["div_date"].iloc[-1], table=table)
+
+    @classmethod
+    def concat(cls, parts: List["Hishty"]) -> "Hishty":
+        """拼接日期互不重叠的若干Hishty（如按年分区保存的各分区），不复制已生成的每一天的数据"""
+        if not parts:
+            return cls("", "", table=empty_table())
+        table = pd.concat([part.table for part in parts], ignore_index=True) if len(parts) > 1 else parts[0].table
+        symbol_infos = None
+        if all(part._symbol_infos is not None for part in parts):
+            symbol_infos = {}
+            for part in parts:
+                symbol_infos.update(part._symbol_infos)
+        return cls(min(part.start for part in parts), max(part.end for part in parts), symbol_infos, table)
+
+    def slice(self, start: datetime or str, end: datetime or str) -> "Hishty":
+        """取[start, end]的分红数据，二分查找日期区间，返回的Hishty与本对象共用数据，不复制"""
+        lo = int(np.searchsorted(self._row_dates, _date_int(start), side="left"))
+        hi = int(np.searchsorted(self._row_dates, _date_int(end), side="right"))
+        table = self.table.iloc[lo:hi]
+        symbol_infos = None
+        if self._symbol_infos is not None:
+            symbol_infos = {key: self._symbol_infos[key] for key in pd.unique(table["div_date"])}
+        return Hishty(start, end, symbol_infos, table)
+
+    def symbol_table(self, start: str, end: str) -> pd.DataFrame:
         """
-        记录分红、送股、转赠、配股的股票信息
+        分红、送股、转赠、配股的股票信息，同一证券同一天的多条现金分红、送转股合计，配股取第一条
         :param start:
         :param end:
-        :return: dict-> {tdate: {symbol:{div_date:..,symbol:...}, symbol:{...}},tdate: {...}}
+        :return: 按(div_date, symbol)排序的表，列见HISHTY_COLUMNS
         """
-        hishty_info = dict()
-
         pg = get_series_data("equ_allot", start, end, cols=["ALLOTMENT_RATIO", "ALLOTMENT_PRICE"])
-        pg.reset_index(inplace=True)
-        pg = pg.rename(columns={"EX_RIGHTS_DATE": "EX_DIV_DATE"})
-        if pg.empty:
-            li = ["PER_CASH_DIV", "PER_SHARE_DIV_RATIO", "PER_SHARE_TRANS_RATIO"]  # 临时变量
-            pg = create_empty_dataframe(pg.columns.tolist() + li)
-        else:
-            pg["PER_CASH_DIV"] = np.nan
-            pg["PER_SHARE_DIV_RATIO"] = np.nan
-            pg["PER_SHARE_TRANS_RATIO"] = np.nan
-
+        pg = pg.reset_index().rename(columns={"EX_RIGHTS_DATE": "EX_DIV_DATE"})
         ret = get_series_data("equ_div", start, end, cols=["EX_DIV_DATE", "PER_CASH_DIV", "PER_SHARE_DIV_RATIO", "PER_SHARE_TRANS_RATIO"])
-        ret.reset_index(inplace=True)
+        ret = ret.reset_index()
+        cols = ["EX_DIV_DATE", "SYMBOL", "PER_CASH_DIV", "PER_SHARE_DIV_RATIO", "PER_SHARE_TRANS_RATIO", "ALLOTMENT_RATIO", "ALLOTMENT_PRICE"]
+        ret = pd.concat([ret.reindex(columns=cols), pg.reindex(columns=cols)], ignore_index=True)  # 分红在前，配股在后
         if ret.empty:
-            li = ["ALLOTMENT_RATIO", "ALLOTMENT_PRICE"]
-            ret = create_empty_dataframe(ret.columns.tolist() + li)
-        else:
-            ret["ALLOTMENT_RATIO"] = np.nan
-            ret["ALLOTMENT_PRICE"] = np.nan
-        ret = pd.concat([ret, pg])
-        if not ret.empty:
-            ret = ret.reset_index(drop=True)
-            ret["PER_CASH_DIV"] = ret["PER_CASH_DIV"].apply(lambda x: x if x > 0 else 0)
-            ret["PER_SHARE_DIV_RATIO"] = ret["PER_SHARE_DIV_RATIO"].apply(lambda x: x if x > 0 else 0)
-            ret["PER_SHARE_TRANS_RATIO"] = ret["PER_SHARE_TRANS_RATIO"].apply(lambda x: x if x > 0 else 0)
-            ret["PER_SHARE_DIV"] = ret["PER_SHARE_DIV_RATIO"] + ret["PER_SHARE_TRANS_RATIO"]
-            ret["ALLOTMENT_RATIO"] = ret["ALLOTMENT_RATIO"].apply(lambda x: x if x > 0 else 0)
-            ret["ALLOTMENT_PRICE"] = ret["ALLOTMENT_PRICE"].apply(lambda x: x if x > 0 else 0)
-            ret["EX_DIV_DATE"] = ret["EX_DIV_DATE"].apply(lambda x: x.strftime("%Y%m%d"))
-            ret = ret[["EX_DIV_DATE", "SYMBOL", "PER_CASH_DIV", "PER_SHARE_DIV", "ALLOTMENT_RATIO", "ALLOTMENT_PRICE"]]
-            ret = [list(x) for x in ret.values]
-            keys = ["div_date", "symbol", "cash_div", "share_div", "pg_rate", "pg_price"]
-            for data_line in ret:
-                info = dict(zip(keys, data_line))
-                if info["div_date"] in hishty_info:
-
-                    if info["symbol"] in hishty_info[info["div_date"]]:
-                        hishty_info[info["div_date"]][info["symbol"]]["cash_div"] += info["cash_div"]
-                        hishty_info[info["div_date"]][info["symbol"]]["share_div"] += info["share_div"]
-                    else:
-                        hishty_info[info["div_date"]][info["symbol"]] = info
-                else:
-                    hishty_info[info["div_date"]] = {info["symbol"]: info}
-        return hishty_info
+            return empty_table()
+        dates = pd.DatetimeIndex(ret["EX_DIV_DATE"])
+        table = pd.DataFrame(
+            {
+                "div_date": dates.year * 10000 + dates.month * 100 + dates.day,  # 按整数分组后再格式化为"%Y%m%d"，比逐行strftime快得多
+                "symbol": ret["SYMBOL"].to_numpy(dtype=object),
+                "cash_div": _positive(ret["PER_CASH_DIV"]),
+                "share_div": _positive(ret["PER_SHARE_DIV_RATIO"]) + _positive(ret["PER_SHARE_TRANS_RATIO"]),
+                "pg_rate": _positive(ret["ALLOTMENT_RATIO"]),
+                "pg_price": _positive(ret["ALLOTMENT_PRICE"]),
+            }
+        )
+        table = table.groupby(["div_date", "symbol"], sort=True).agg({"cash_div": "sum", "share_div": "sum", "pg_rate": "first", "pg_price": "first"}).reset_index()
+        table["div_date"] = table["div_date"].astype(str)
+        return table
+
+    def symbol_hishty(self, start: str, end: str):
+        """
+        记录分红、送股、转赠、配股的股票信息
+        :param start:
+        :param end:
+        :return: dict-> {tdate: {symbol:{div_date:..,symbol:...}, symbol:{...}},tdate: {...}}
+        """
+        return table_to_infos(self.symbol_table(start, end))
 
     def div_opt(self, tdate: str, bonus_fundbal: float, stock: dict):
         """
@@ -183,6 +258,115 @@ class Hishty(object):
 
         return tmp_signal
 
+    def _events(self, tdates: np.ndarray, symbols: np.ndarray) -> Dict[str, np.ndarray]:
+        """每行(交易日, 证券)的除权除息信息，与table按键连接，没有除权除息的行为0"""
+        if self._event_index is None:
+            self._event_index = pd.MultiIndex.from_arrays([self.table["div_date"], self.table["symbol"]])
+        rows = self._event_index.get_indexer(pd.MultiIndex.from_arrays([tdates, symbols]))
+        found = rows >= 0
+        return {col: np.where(found, self.table[col].to_numpy(dtype="float64")[rows], 0.0) for col in VALUE_COLUMNS}
+
+    def div_opt_batch(self, positions: pd.DataFrame, fundbal: float or Dict[str, float]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        批量处理送股、分红、配股对持仓的影响，结果与按行依次调用div_opt相同
+        :param positions: 持仓，每行相当于div_opt的一个stock，列为tdate、symbol、stkbal、avg_price、mktval，可选sname、market
+        :param fundbal: 每个交易日开始时的资金，数值或{"%Y%m%d": 资金}；同一交易日的各行按行的顺序依次使用这笔资金（分红增加、配股减少）
+        :return: (调整后的持仓，增加fundbal列为处理完这一行后的资金, 信号表)，信号表的列与div_opt的信号相同，按行和送股、分红、配股的顺序排列
+        """
+        tdates = _date_keys(positions["tdate"])
+        symbols = positions["symbol"].to_numpy(dtype=object)
+        events = self._events(tdates, symbols)
+        share, cash, pg_rate, pg_price = events["share_div"], events["cash_div"], events["pg_rate"], events["pg_price"]
+        has_share, has_cash, has_pg = share != 0, cash != 0, (pg_rate != 0) & (pg_price != 0)
+        stkbal = positions["stkbal"].to_numpy(dtype="float64")
+        avg_price = positions["avg_price"].to_numpy(dtype="float64")
+        mktval = positions["mktval"].to_numpy(dtype="float64")
+
+        # 转赠/送股
+        share_effect = np.where(has_share, stkbal * share, 0.0)
+        new_stkbal = stkbal + share_effect
+        avg_price = np.where(has_share, avg_price / (1 + share), avg_price)
+        # 分红
+        cash_effect = np.where(has_cash, new_stkbal * cash, 0.0)
+        avg_price = np.where(has_cash, avg_price - cash, avg_price)
+        mktval = np.where(has_cash, mktval - cash_effect, mktval)
+        # 配股：能买多少受当时的资金限制，只在有分红或配股的行上按顺序计算资金
+        start = np.full(len(positions), float(fundbal)) if np.isscalar(fundbal) else pd.Series(tdates).map(fundbal).to_numpy(dtype="float64")
+        pg_effect = np.zeros(len(positions))
+        balance = np.full(len(positions), np.nan)
+        running: Dict[str, float] = {}
+        for row in np.flatnonzero(has_cash | has_pg):
+            funds = running.get(tdates[row], start[row])
+            if has_cash[row]:
+                funds += cash_effect[row]
+            if has_pg[row]:
+                effect = stkbal[row] * pg_rate[row]
+                if effect * pg_price[row] > funds:
+                    effect = int((funds / pg_price[row]) / 100) * 100
+                funds = funds - effect * pg_price[row]
+                pg_effect[row] = effect
+            running[tdates[row]] = balance[row] = funds
+        balance = pd.Series(balance).groupby(tdates).ffill().fillna(pd.Series(start)).to_numpy()
+        new_stkbal = np.where(has_pg, new_stkbal + pg_effect, new_stkbal)
+        avg_price = np.where(has_pg, (avg_price + pg_price * pg_rate) / (1 + pg_rate), avg_price)
+        mktval = np.where(has_pg, mktval + pg_effect * pg_price, mktval)
+
+        result = positions.copy()
+        result["stkbal"], result["avg_price"], result["mktval"], result["fundbal"] = new_stkbal, avg_price, mktval, balance
+        tax = pg_effect * pg_price * 0.0016
+        tax = np.abs(np.where(tax > 5, tax, 5))  # 交易费用最低5元
+        sname = positions["sname"].to_numpy(dtype=object) if "sname" in positions else np.full(len(positions), None)
+        market = positions["market"].to_numpy(dtype=object) if "market" in positions else np.full(len(positions), None)
+        signals = []
+        for order, (mask, tprice, signal, operator, effect, signal_tax) in enumerate(
+            [
+                (has_share, 0, 220010, 0, share_effect, 0),  # 除权
+                (has_cash, 0, 221007, 0, cash_effect, 0),  # 除息
+                (has_pg, pg_price, 1, 1, pg_effect, tax),  # 以配股价买入
+            ]
+        ):
+            rows = np.flatnonzero(mask)
+            frame = pd.DataFrame(
+                {
+                    "SYMBOL": symbols[rows],
+                    "TPRICE": np.broadcast_to(tprice, mask.shape)[rows],
+                    "SIGNAL": signal,
+                    "TDATE": tdates[rows],
+                    "SNAME": sname[rows],
+                    "OPERATOR": operator,
+                    "MARKET": market[rows],
+                    "STKEFFEFT": effect[rows],
+                    "TAX": np.broadcast_to(signal_tax, mask.shape)[rows],
+                }
+            )
+            frame["_row"], frame["_order"] = rows, order
+            signals.append(frame)
+        signals = pd.concat(signals, ignore_index=True).sort_values(["_row", "_order"], kind="stable", ignore_index=True)
+        return result, signals.drop(columns=["_row", "_order"])
+
+    def div_signal_batch(self, signals: pd.DataFrame) -> pd.DataFrame:
+        """
+        批量调整信号的价格和数量，结果与按行依次调用div_signal相同
+        :param signals: 信号表，至少包括TDATE、SYMBOL、TPRICE、STKEFFEFT列
+        :return: 调整后的信号表
+        """
+        events = self._events(_date_keys(signals["TDATE"]), signals["SYMBOL"].to_numpy(dtype=object))
+        share, cash, pg_rate, pg_price = events["share_div"], events["cash_div"], events["pg_rate"], events["pg_price"]
+        has_share, has_cash, has_pg = share != 0, cash != 0, (pg_rate != 0) & (pg_price != 0)
+        tprice = signals["TPRICE"].to_numpy(dtype="float64")
+        effect = signals["STKEFFEFT"].to_numpy(dtype="float64")
+        # 转赠/送股，数量按100股取整
+        tprice = np.where(has_share, tprice / (1 + share), tprice)
+        effect = np.where(has_share, np.trunc(effect * (1 + share) / 100) * 100, effect)
+        # 分红
+        tprice = np.where(has_cash, tprice - cash, tprice)
+        # 配股
+        tprice = np.where(has_pg, (tprice + pg_price * pg_rate) / (1 + pg_rate), tprice)
+        result = signals.copy()
+        result["TPRICE"] = tprice
+        result["STKEFFEFT"] = effect.astype(signals["STKEFFEFT"].dtype) if signals["STKEFFEFT"].dtype.kind in "iu" else effect
+        return result
+
 
 hishty_info_ = None
 
@@ -193,7 +377,7 @@ def get_hishty(start: datetime or str, end: datetime or str):
     global hishty_info_
     if hishty_info_:
         if int(hishty_info_.end) >= int(end) and int(hishty_info_.start) <= int(start):
-            return Hishty(start, end, {tdate: hishty_info_.symbol_infos[tdate] for tdate in hishty_info_.symbol_infos if int(start) <= int(tdate) <= int(end)})
+            return hishty_info_.slice(start, end)
         else:
             logging.debug(f"更新hishty数据，start={start}, end={end}, hishty_info_.start={hishty_info_.start}, hishty_info_.end={hishty_info_.end}")
     logging.debug(f"更新hishty数据，start={start}, end={end}")
@@ -203,6 +387,10 @@ def get_hishty(start: datetime or str, end: datetime or str):
 
 class HishtyMan(DataMan):
     __HISHTY_OBJECT_ID__ = "hishty______________"
+    # 分红送配信息每个交易日只变化一次：开盘前取当日除权信息，收盘后再检查一次
+    refresh_policy = TradingDayPolicy(time(8, 30), time(15, 30))
+    # 按年分区保存，每天的刷新只重写当年的分区
+    partition_freq = PARTITION_YEAR
 
     def __init__(self, start: datetime = datetime(2010, 1, 1), today_toggle=False):
         super().__init__(self.__HISHTY_OBJECT_ID__, "分红送配信息", start, today_toggle)
@@ -212,11 +400,21 @@ class HishtyMan(DataMan):
 
     @staticmethod
     def merge_data(old_data: Hishty, insert_data: Hishty) -> Hishty:
-        symbol_infos = deepcopy(old_data.symbol_infos)
-        symbol_infos.update(insert_data.symbol_infos)
-        return Hishty(min(symbol_infos), max(symbol_infos), symbol_infos)
+        """新数据中有的除权除息日整体替换旧数据中这一天的数据"""
+        old, insert = old_data.table, insert_data.table
+        table = pd.concat([old[~old["div_date"].isin(list(insert_data.div_dates))], insert], ignore_index=True)
+        return Hishty.from_table(table.sort_values(["div_date", "symbol"], kind="stable", ignore_index=True))
+
+    def split_partitions(self, data: Hishty) -> Dict[str, Hishty]:
+        width = len(partition_name("20000101", self.partition_freq))  # 分区名是日期的前几位
+        groups = data.table.groupby(data.table["div_date"].str[:width], sort=True)
+        return {name: Hishty.from_table(part.reset_index(drop=True)) for name, part in groups}
+
+    def combine_partitions(self, parts: List[Hishty]) -> Hishty:
+        return Hishty.concat(parts)
 
-    def check_data(self, data: Hishty or ObjectNotAvailable) -> Set[Tuple[datetime, datetime]]:
+    def check_data(self, data: Hishty or PartitionedData or ObjectNotAvailable) -> Set[Tuple[datetime, datetime]]:
+        """只向数据源查询水位线之后（含水位线当天）的分红送配信息，与已有数据比较，不再每次从数据区间的开始查询"""
         start_tdate = self.数据区间[0]
         today = datetime.now()
         if self.取当日数据 and FastTdate.is_tdate(today):
@@ -224,12 +422,15 @@ class HishtyMan(DataMan):
         else:
             end_date = FastTdate.last_tdate(today)
 
-        all_trade_days = set(FastTdate.query_all_tdates(start_tdate, end_date, include_stop=True))
+        self.checked_until(end_date)
         if not data or data is ObjectNotAvailable:  # 没有数据的情况
-            return tdates_2_tdate_ranges(all_trade_days)
+            return tdates_2_tdate_ranges(set(FastTdate.query_all_tdates(start_tdate, end_date, include_stop=True)))
+        since = start_tdate if self.watermark is None else max(start_tdate, datetime.combine(self.watermark.fetched_until.date(), time.min))
+        if isinstance(data, PartitionedData):
+            data = data.materialize(self.combine_partitions, since, end_date)  # 只读取水位线之后的分区
         assert isinstance(data, Hishty), f"数据格式不正确，应为Hishty，实为{type(data)}"
-        hishty = Hishty(start_tdate, end_date)
-        error_trade_days = set().union({key for key in hishty.symbol_infos if key not in data.symbol_infos})
+        hishty = Hishty(since, end_date)
+        error_trade_days = {key for key in hishty.div_dates if key not in data.div_dates}
         return tdates_2_tdate_ranges(error_trade_days)
 
     @classmethod
@@ -240,9 +441,13 @@ class HishtyMan(DataMan):
 
     @staticmethod
     def serialize(data: Hishty):
-        return pa.default_serialization_context().serialize(data.symbol_infos).to_components()
+        """按列保存为numpy数组，不再保存按日期、证券嵌套的字典"""
+        columns = {col: data.table[col].to_numpy(dtype=str if col in ("div_date", "symbol") else "float64") for col in HISHTY_COLUMNS}
+        return pa.default_serialization_context().serialize(columns).to_components()
 
     @staticmethod
     def deserialize(data):
-        symbol_infos = pa.deserialize_components(data)
-        return Hishty(start=min(symbol_infos), end=max(symbol_infos), symbol_infos=symbol_infos)
+        columns = pa.deserialize_components(data)
+        if set(HISHTY_COLUMNS) <= set(columns):
+            return Hishty.from_table(pd.DataFrame({col: columns[col].astype(object) if columns[col].dtype.kind == "U" else columns[col] for col in HISHTY_COLUMNS}))
+        return Hishty(start=min(columns), end=max(columns), symbol_infos=columns)  # 按日期、证券嵌套的字典（旧格式的快照）
@@ -0,0 +1,189 @@
+"""延迟查询
+
+    sdf_man.scan().select(["收盘价", "成交量"]).between(start, end).symbols(["600000.CNSESH"]).filter(col("收盘价") > 10).collect()
+scan返回的LazyQuery只记录查询条件，每一步返回新的LazyQuery，collect时才执行：
+- 列投影：只读取选择的列和过滤条件用到的列；
+- 日期区间、证券：在面板（见panel）上直接切片和按列号取数；
+- 过滤条件：在面板的二维数组上向量化计算出行的掩码，只把满足条件的行转换为长表。
+全程不生成完整的数据框再用pandas过滤。
+"""
+from __future__ import annotations
+
+import operator
+from contextlib import nullcontext
+from datetime import datetime
+from typing import List, Callable, ContextManager, Dict, Iterable, Set
+
+import numpy as np
+import pandas as pd
+
+
+class Expr(object):
+    """过滤条件表达式，用col引用列，支持比较、算术、&、|、~、isin、isna、notna"""
+
+    __hash__ = None
+
+    def __init__(self, evaluate: Callable[[Dict[str, np.ndarray]], np.ndarray], columns: Set[str], text: str):
+        """
+        :param evaluate: 由{列名: 二维数组}计算结果的函数
+        :param columns: 用到的列
+        :param text: 表达式的文字形式，用于explain
+        """
+        self.evaluate = evaluate
+        self.columns = columns
+        self.text = text
+
+    def __repr__(self):
+        return self.text
+
+    def _binary(self, other, function: Callable, symbol: str, reverse: bool = False) -> Expr:
+        if isinstance(other, Expr):
+            evaluate_other, columns, text = other.evaluate, self.columns | other.columns, other.text
+        else:
+            evaluate_other, columns, text = (lambda arrays: other), self.columns, repr(other)
+        if reverse:
+            return Expr(lambda arrays: function(evaluate_other(arrays), self.evaluate(arrays)), columns, f"({text} {symbol} {self.text})")
+        return Expr(lambda arrays: function(self.evaluate(arrays), evaluate_other(arrays)), columns, f"({self.text} {symbol} {text})")
+
+    def __gt__(self, other):
+        return self._binary(other, operator.gt, ">")
+
+    def __ge__(self, other):
+        return self._binary(other, operator.ge, ">=")
+
+    def __lt__(self, other):
+        return self._binary(other, operator.lt, "<")
+
+    def __le__(self, other):
+        return self._binary(other, operator.le, "<=")
+
+    def __eq__(self, other):
+        return self._binary(other, operator.eq, "==")
+
+    def __ne__(self, other):
+        return self._binary(other, operator.ne, "!=")
+
+    def __add__(self, other):
+        return self._binary(other, operator.add, "+")
+
+    def __radd__(self, other):
+        return self._binary(other, operator.add, "+", reverse=True)
+
+    def __sub__(self, other):
+        return self._binary(other, operator.sub, "-")
+
+    def __rsub__(self, other):
+        return self._binary(other, operator.sub, "-", reverse=True)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul, "*")
+
+    def __rmul__(self, other):
+        return self._binary(other, operator.mul, "*", reverse=True)
+
+    def __truediv__(self, other):
+        return self._binary(other, operator.truediv, "/")
+
+    def __rtruediv__(self, other):
+        return self._binary(other, operator.truediv, "/", reverse=True)
+
+    def __and__(self, other):
+        return self._binary(other, np.logical_and, "&")
+
+    def __or__(self, other):
+        return self._binary(other, np.logical_or, "|")
+
+    def __invert__(self):
+        return Expr(lambda arrays: np.logical_not(self.evaluate(arrays)), self.columns, f"~{self.text}")
+
+    def isin(self, values: Iterable) -> Expr:
+        values = list(values)
+        return Expr(lambda arrays: np.isin(self.evaluate(arrays), values), self.columns, f"{self.text}.isin({values})")
+
+    def isna(self) -> Expr:
+        return Expr(lambda arrays: pd.isna(self.evaluate(arrays)), self.columns, f"{self.text}.isna()")
+
+    def notna(self) -> Expr:
+        return Expr(lambda arrays: pd.notna(self.evaluate(arrays)), self.columns, f"{self.text}.notna()")
+
+
+def col(name: str) -> Expr:
+    """引用一列（统一名称或别名）"""
+    return Expr(lambda arrays: arrays[name], {name}, name)
+
+
+class LazyQuery(object):
+    def __init__(self, sdf_man, prepare: Callable[[], ContextManager] = None):
+        """
+        :param sdf_man: SuperDataFrameMan
+        :param prepare: 返回collect期间使用的上下文，通常用于借用连接并关联plasma store中当前一代数据（见DataClient.attached）
+        """
+        self.sdf_man = sdf_man
+        self.prepare = prepare
+        self.cols: List[str] or None = None
+        self.start: datetime or None = None
+        self.end: datetime or None = None
+        self.symbol_list: List[str] or None = None
+        self.predicates: List[Expr] = []
+
+    def _copy(self, **changes) -> LazyQuery:
+        query = LazyQuery(self.sdf_man, self.prepare)
+        query.__dict__.update({**self.__dict__, "predicates": list(self.predicates), **changes})
+        return query
+
+    def select(self, cols: Iterable[str]) -> LazyQuery:
+        """结果包含的列，缺省为全部列"""
+        return self._copy(cols=list(cols))
+
+    def between(self, start: datetime = None, end: datetime = None) -> LazyQuery:
+        """日期区间[start, end]"""
+        return self._copy(start=start, end=end)
+
+    def symbols(self, symbols: Iterable[str]) -> LazyQuery:
+        """只查询这些证券"""
+        return self._copy(symbol_list=list(symbols))
+
+    def filter(self, expr: Expr) -> LazyQuery:
+        """过滤条件，多次调用时条件同时满足"""
+        if not isinstance(expr, Expr):
+            raise TypeError(f"过滤条件必须是col构成的表达式：{expr!r}")
+        return self._copy(predicates=self.predicates + [expr])
+
+    def _output_columns(self) -> List[str]:
+        if self.cols is not None:
+            return self.cols
+        if self.sdf_man.frame is None:
+            raise RuntimeError("还没有关联plasma store中的数据，请先调用attach")
+        return list(self.sdf_man.frame.columns)
+
+    def explain(self) -> str:
+        """查询计划的文字说明"""
+        filter_cols = [name for expr in self.predicates for name in sorted(expr.columns)]
+        plan = self.sdf_man.plan(list(dict.fromkeys((self.cols or []) + filter_cols)), self.start, self.end, self.symbol_list)
+        predicates = " & ".join(expr.text for expr in self.predicates) or "无"
+        return f"{plan}\n过滤条件: {predicates}"
+
+    def collect(self) -> pd.DataFrame:
+        """执行查询，返回以(tdate, symbol)为索引的数据框"""
+        with self.prepare() if self.prepare is not None else nullcontext():
+            return self._collect()
+
+    def _collect(self) -> pd.DataFrame:
+        cols = self._output_columns()
+        filter_cols = sorted({name for expr in self.predicates for name in expr.columns})
+        plan = self.sdf_man.plan(list(dict.fromkeys(cols + filter_cols)), self.start, self.end, self.symbol_list)
+        canonical = dict(zip(plan.output, plan.names))
+        panel = self.sdf_man.load_columns(plan.columns, self.start)
+        mask = None
+        if self.predicates:
+            rows, positions = panel.block(self.start, self.end, self.symbol_list)
+            arrays = {name: panel.factors[canonical[name]][rows, positions] for name in filter_cols}
+            mask = np.ones(panel.present[rows, positions].shape, dtype=bool)
+            for expr in self.predicates:
+                mask &= np.asarray(expr.evaluate(arrays), dtype=bool)
+        names = list(dict.fromkeys(canonical[name] for name in cols))
+        result = panel.get(names, self.start, self.end, self.symbol_list, mask)
+        if len(names) != len(cols):
+            result = result[[canonical[name] for name in cols]]
+        result.columns = cols
+        return result
@@ -0,0 +1,149 @@
+"""编译后的元数据目录
+
+metadata.yaml中的Factor多达上万个时，每次启动都用ruamel解析YAML、逐个构建并校验pydantic模型要花不少时间。
+load_catalog只在配置文件变化时重新解析和校验，结果（MetadataCatalog）以pickle保存在配置文件旁边，之后直接加载：
+先比较配置文件的修改时间和大小，不一致时再比较内容的sha1，内容没变（如只是touch了文件）时不重新编译。
+MetadataCatalog预先建好查询用的字典：别名到统一名称、统一名称到数据表、统一名称到数据表的列名、数据表到Factor。
+"""
+import hashlib
+import io
+import logging
+import os
+import pickle
+from typing import Dict, List, Callable
+
+from ruamel.yaml import YAML
+
+CATALOG_VERSION = 1  # MetadataCatalog的结构变化时加一，旧的编译结果自动作废
+CATALOG_SUFFIX = ".catalog"
+
+
+class MetadataCatalog(object):
+    def __init__(self, factors: Dict[str, dict]):
+        """
+        :param factors: {统一名称: 配置}，配置的字段与Factor相同
+        """
+        self.factors = factors
+        self.belong_to: Dict[str, str] = {}  # {统一名称: 数据表}
+        self.table_column: Dict[str, str] = {}  # {统一名称: 数据表的列名}
+        self.alias_to_name: Dict[str, str] = {}  # {统一名称或别名（小写）: 统一名称}，字段大小写不敏感
+        self.by_table: Dict[str, List[str]] = {}  # {数据表: [统一名称]}
+        for name, factor in factors.items():
+            alias = factor.get("alias") or []
+            self.belong_to[name] = factor["belong_to"]
+            self.table_column[name] = alias[0] if alias else name
+            self.by_table.setdefault(factor["belong_to"], []).append(name)
+            for key in [name, *alias]:
+                other = self.alias_to_name.setdefault(str(key).casefold(), name)
+                if other != name:
+                    logging.warning(f"{name}的别名{key}与{other}重复，按{other}处理")
+
+    def __len__(self):
+        return len(self.factors)
+
+    def __contains__(self, name):
+        return name in self.factors
+
+    def has_column(self, name: str) -> bool:
+        return name in self.factors
+
+    def canonical_name(self, name: str) -> str or None:
+        """统一名称或别名（大小写不敏感）对应的统一名称，没有时返回None"""
+        if name in self.factors:
+            return name
+        return self.alias_to_name.get(str(name).casefold())
+
+    def get_belong_to(self, name: str) -> str or None:
+        return self.belong_to.get(name)
+
+    def get_table_colname(self, name: str) -> str or None:
+        return self.table_column.get(name)
+
+    def get_alias(self, name: str) -> List[str] or None:
+        factor = self.factors.get(name)
+        return factor.get("alias") if factor is not None else None
+
+
+def parse_factors(content: bytes) -> Dict[str, dict]:
+    """解析metadata.yaml的内容：{统一名称: 配置}"""
+    conf = YAML(typ="safe").load(io.BytesIO(content))
+    factors = {}
+    for name, factor in (conf.get("Factors") or {}).items():
+        factors[name] = {**factor, "name": name}
+    return factors
+
+
+def compile_catalog(content: bytes, validate: Callable[[dict], None] = None) -> MetadataCatalog:
+    """解析并校验配置，建立MetadataCatalog
+
+    :param validate: 校验一个Factor配置的函数，不合法时抛出异常
+    :raise ValueError: 配置不合法
+    """
+    factors = parse_factors(content)
+    for name, factor in factors.items():
+        try:
+            if validate is not None:
+                validate(factor)
+            if not factor.get("belong_to"):
+                raise ValueError("没有设置belong_to")
+        except Exception as e:
+            raise ValueError(f"Factor配置不合法：{name}，{e}") from e
+    return MetadataCatalog(factors)
+
+
+def catalog_file_name(conf_file: str, cache_dir: str = None) -> str:
+    """编译结果的文件名，缺省与配置文件放在一起"""
+    if cache_dir is None:
+        return conf_file + CATALOG_SUFFIX
+    return os.path.join(cache_dir, os.path.basename(conf_file) + CATALOG_SUFFIX)
+
+
+def load_catalog(conf_file: str, validate: Callable[[dict], None] = None, cache_dir: str = None) -> MetadataCatalog:
+    """加载配置文件的MetadataCatalog，配置文件变化时重新编译并保存
+
+    :param conf_file: metadata.yaml
+    :param validate: 见compile_catalog
+    :param cache_dir: 保存编译结果的目录，缺省与配置文件相同
+    """
+    stat = os.stat(conf_file)
+    file_name = catalog_file_name(conf_file, cache_dir)
+    compiled = _read_compiled(file_name)
+    if compiled is not None and compiled["mtime_ns"] == stat.st_mtime_ns and compiled["size"] == stat.st_size:
+        return compiled["catalog"]
+    with open(conf_file, "rb") as file:
+        content = file.read()
+    sha1 = hashlib.sha1(content).hexdigest()
+    if compiled is not None and compiled["sha1"] == sha1:
+        catalog = compiled["catalog"]
+    else:
+        logging.info(f"{conf_file}已变化，重新编译元数据目录...")
+        catalog = compile_catalog(content, validate)
+    _write_compiled(file_name, {"version": CATALOG_VERSION, "sha1": sha1, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "catalog": catalog})
+    return catalog
+
+
+def _read_compiled(file_name: str) -> dict or None:
+    try:
+        with open(file_name, "rb") as file:
+            compiled = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logging.warning(f"无法读取编译后的元数据目录{file_name}，重新编译", exc_info=True)
+        return None
+    if not isinstance(compiled, dict) or compiled.get("version") != CATALOG_VERSION:
+        return None
+    return compiled
+
+
+def _write_compiled(file_name: str, compiled: dict):
+    """先写临时文件再替换，多个进程同时编译时读者不会读到写了一半的文件；目录不可写时只是下次还要重新编译"""
+    tmp_file = f"{file_name}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as file:
+            pickle.dump(compiled, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, file_name)
+    except OSError:
+        logging.warning(f"无法保存编译后的元数据目录{file_name}", exc_info=True)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
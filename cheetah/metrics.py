@@ -0,0 +1,220 @@
+"""运行指标
+
+MetricsRegistry登记计数器（Counter）、仪表（Gauge）和直方图（Histogram），render输出Prometheus文本格式。
+服务端和客户端各自在本进程的REGISTRY中记录指标，可以定期写到文件（供node_exporter的textfile collector采集），
+也可以用MetricsServer在本地Unix socket上提供，如：curl --unix-socket /tmp/plasma.metrics http://localhost/metrics
+"""
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Iterable
+
+# 用时直方图的缺省分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        """
+        :param name: 指标名称
+        :param documentation: 说明
+        :param label_names: 标签名称，记录时以关键字参数给出各标签的值
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}的标签应为{self.label_names}，实际为{tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        """[(名称, [(标签名, 标签值)], 值)]"""
+        with self._lock:
+            return [(self.name, list(zip(self.label_names, key)), value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录with语句块的用时（秒），出错时也记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        result = []
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                result.append((f"{self.name}_bucket", labels + [("le", _format_value(float(bound)))], cumulative))
+            result.append((f"{self.name}_sum", labels, total))
+            result.append((f"{self.name}_count", labels, cumulative))
+        return result
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, documentation: str, label_names: Tuple[str, ...], **kwargs) -> Metric:
+        """同名指标只登记一次，重复登记时返回已有的指标"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, label_names, **kwargs)
+            elif type(metric) is not metric_class or metric.label_names != tuple(label_names):
+                raise ValueError(f"指标{name}已登记为不同的类型或标签")
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus文本格式的全部指标"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, file_name: str):
+        """把全部指标写到文件，先写临时文件再替换，采集方不会读到写了一半的文件"""
+        with open(f"{file_name}.tmp", "w", encoding="utf8") as file:
+            file.write(self.render())
+        os.replace(f"{file_name}.tmp", file_name)
+
+
+# 本进程的指标
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer(threading.Thread):
+    """在本地Unix socket上提供指标：HTTP请求返回HTTP响应，其他连接（如socat）直接返回文本"""
+
+    def __init__(self, socket_path: str, registry: MetricsRegistry = REGISTRY):
+        threading.Thread.__init__(self, daemon=True)
+        self.socket_path = socket_path
+        self.registry = registry
+        self.stop_event = threading.Event()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # 上次异常退出留下的socket文件
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(socket_path)
+        self._socket.listen(8)
+        self._socket.settimeout(1)
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    connection, _ = self._socket.accept()
+                except socket.timeout:
+                    continue
+                try:
+                    self._serve(connection)
+                except OSError:
+                    logging.debug("发送指标失败", exc_info=True)
+                finally:
+                    connection.close()
+        finally:
+            self._socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _serve(self, connection: socket.socket):
+        connection.settimeout(0.2)
+        try:
+            request = connection.recv(4096)
+        except socket.timeout:
+            request = b""
+        body = self.registry.render().encode("utf8")
+        if request.startswith(b"GET"):
+            header = f"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\n\r\n"
+            body = header.encode("ascii") + body
+        connection.sendall(body)
+
+    def stop(self):
+        self.stop_event.set()
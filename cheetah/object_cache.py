@@ -0,0 +1,63 @@
+"""客户端的反序列化对象缓存
+
+SerializationContext格式的对象每次读取都要完整地反序列化，回测等场景会反复读取同一个对象（如分红送配信息）。
+ObjectCache按数据标识符缓存反序列化后的对象，同时记下它的版本：版本必须从不重复使用，
+客户端用(plasma store实例标识, 这一代的object_id)，代数只增不减，store重新启动后实例标识也不同。
+只要发布指针仍指向这个版本就直接返回缓存的实例，服务端发布新的一代后缓存失效；总大小超过预算时淘汰最久未用的对象。
+"""
+import threading
+from collections import OrderedDict
+from typing import Tuple, Any, List, Hashable
+
+from pyarrow import plasma
+
+
+class ObjectCache(object):
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: 缓存的字节预算，按对象在plasma store中的大小计算，0表示不缓存
+        """
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[Hashable, Any, int]]" = OrderedDict()  # {数据标识符: (版本, 对象, 大小)}，按最近使用排序
+        self._lock = threading.Lock()
+
+    def get(self, equipment_id: str, version: Hashable):
+        """缓存的对象是version这个版本时返回该对象，否则返回ObjectNotAvailable（缓存的旧版本同时作废）"""
+        with self._lock:
+            entry = self._entries.get(equipment_id)
+            if entry is None:
+                return plasma.ObjectNotAvailable
+            if entry[0] != version:
+                self._remove(equipment_id)
+                return plasma.ObjectNotAvailable
+            self._entries.move_to_end(equipment_id)
+            return entry[1]
+
+    def put(self, equipment_id: str, version: Hashable, value, size: int):
+        """缓存一个版本的对象，超过预算时淘汰最久未用的对象，单个对象超过预算时不缓存"""
+        with self._lock:
+            if equipment_id in self._entries:
+                self._remove(equipment_id)
+            if size > self.max_bytes:
+                return
+            self._entries[equipment_id] = (version, value, size)
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, equipment_id: str = None):
+        """作废一个对象的缓存，缺省作废全部"""
+        with self._lock:
+            for key in [equipment_id] if equipment_id is not None else list(self._entries):
+                if key in self._entries:
+                    self._remove(key)
+
+    def cached(self) -> List[Tuple[str, Hashable]]:
+        """[(数据标识符, 版本)]"""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def _remove(self, equipment_id: str):
+        _, _, size = self._entries.pop(equipment_id)
+        self.used_bytes -= size
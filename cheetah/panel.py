@@ -0,0 +1,151 @@
+"""稠密的(交易日 × 证券)面板
+
+按(tdate, symbol)排列的长表取一组证券要逐行比较，取截面（同一天的所有证券）要先分组。面板把数据排成二维：
+- 交易日轴：按日期排序，日期区间对应连续的行，用二分查找得到行号后直接切片；
+- 证券轴：字典编码，证券代码对应列号，一组证券就是一次按列号的取数（gather）；
+- 每个Factor一个连续的二维numpy数组，形状为(交易日数, 证券数)，没有数据的位置为缺失值。
+present记录哪些(交易日, 证券)在原始数据中有行，转换回长表时只保留这些行。
+"""
+from datetime import datetime
+from typing import Dict, List, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .sharded_store import INDEX_NAMES
+
+
+def nullable_dtype(dtype: np.dtype) -> np.dtype:
+    """能表示缺失值的dtype：整数和布尔转为浮点，字符串等转为object"""
+    if dtype.kind in "iub":
+        return np.dtype("float64")
+    if dtype.kind not in "fcMm":
+        return np.dtype(object)
+    return dtype
+
+
+def fill_value(dtype: np.dtype):
+    """dtype对应的缺失值，整数和布尔在有缺失时转为浮点（见nullable_dtype）"""
+    if dtype.kind in "fc":
+        return np.nan
+    if dtype.kind == "M":
+        return np.datetime64("NaT")
+    if dtype.kind == "m":
+        return np.timedelta64("NaT")
+    return None
+
+
+class Panel(object):
+    def __init__(self, dates: Iterable = ()):
+        """
+        :param dates: 交易日轴，通常为数据区间内的全部交易日
+        """
+        self.dates: np.ndarray = np.unique(pd.to_datetime(pd.Index(list(dates))).values.astype("datetime64[ns]"))
+        self.symbols: np.ndarray = np.array([], dtype=object)
+        self.present: np.ndarray = np.zeros((len(self.dates), 0), dtype=bool)
+        self.factors: Dict[str, np.ndarray] = {}
+        self.loaded_from: Dict[str, int] = {}  # {Factor: 第一个放入了数据的行}，只放入了最近的数据时大于0
+        self._symbol_codes: Dict[str, int] = {}
+        self._row_pos: np.ndarray = np.array([], dtype=np.int64)  # 长表每一行在面板中的行号
+        self._col_pos: np.ndarray = np.array([], dtype=np.int64)  # 长表每一行在面板中的列号
+        self._complete = True
+
+    @property
+    def shape(self):
+        return self.present.shape
+
+    def set_index(self, tdates: np.ndarray, symbols: np.ndarray):
+        """按长表的(tdate, symbol)建立证券轴和每一行的位置，已加载的Factor全部清除
+
+        交易日轴上没有的日期（如停牌日历之外的数据）会并入交易日轴。
+        :param tdates: 长表每一行的交易日
+        :param symbols: 长表每一行的证券代码
+        """
+        tdates = np.asarray(tdates).astype("datetime64[ns]")
+        missing_dates = np.setdiff1d(tdates, self.dates)
+        if len(missing_dates):
+            self.dates = np.union1d(self.dates, missing_dates)
+        codes, uniques = pd.factorize(np.asarray(symbols, dtype=object), sort=True)
+        self.symbols = np.asarray(uniques, dtype=object)
+        self._symbol_codes = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._row_pos = np.searchsorted(self.dates, tdates)
+        self._col_pos = codes.astype(np.int64)
+        self.present = np.zeros((len(self.dates), len(self.symbols)), dtype=bool)
+        self.present[self._row_pos, self._col_pos] = True
+        self._complete = bool(self.present.all())  # 每个(交易日, 证券)都有数据时不需要缺失值
+        self.factors = {}
+        self.loaded_from = {}
+
+    def add_factor(self, name: str, values: np.ndarray, offset: int = 0):
+        """把与set_index的长表逐行对应的一列数据放入面板
+
+        :param offset: values从长表的第几行开始，之前的交易日没有放入面板（见loaded_from）
+        """
+        values = np.asarray(values)
+        if len(values) != len(self._row_pos) - offset:
+            raise ValueError(f"{name}: 数据有{len(values)}行，索引从第{offset}行开始有{len(self._row_pos) - offset}行")
+        complete = self._complete and offset == 0
+        dtype = values.dtype if complete else nullable_dtype(values.dtype)
+        if dtype.kind not in "iubfcMm":
+            dtype = np.dtype(object)
+        data = np.empty(self.shape, dtype=dtype)
+        if not complete:
+            data.fill(fill_value(dtype))
+        data[self._row_pos[offset:], self._col_pos[offset:]] = values
+        self.factors[name] = data
+        self.loaded_from[name] = int(self._row_pos[offset]) if offset < len(self._row_pos) else self.shape[0]
+
+    def column(self, name: str) -> np.ndarray:
+        """一个Factor与set_index的长表逐行对应的值"""
+        return self.factors[name][self._row_pos, self._col_pos]
+
+    def has_factor(self, name: str, start_row: int = 0) -> bool:
+        """面板中是否有这个Factor从第start_row行开始的数据"""
+        return name in self.factors and self.loaded_from.get(name, 0) <= start_row
+
+    def rows(self, start: datetime = None, end: datetime = None) -> slice:
+        """日期区间[start, end]对应的行"""
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, "ns"), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, "ns"), side="right"))
+        return slice(lo, max(lo, hi))
+
+    def symbol_positions(self, symbols: Iterable[str] = None) -> np.ndarray or slice:
+        """证券对应的列号，面板中没有的证券被忽略，缺省为全部证券"""
+        if symbols is None:
+            return slice(None)
+        return np.array([self._symbol_codes[symbol] for symbol in symbols if symbol in self._symbol_codes], dtype=np.int64)
+
+    def values(self, name: str, start: datetime = None, end: datetime = None, symbols: Iterable[str] = None) -> np.ndarray:
+        """一个Factor在日期区间内、若干证券上的二维数组；不指定证券时是面板的视图，不复制数据"""
+        if name not in self.factors:
+            raise KeyError(f"面板中没有这个Factor: {name}")
+        return self.factors[name][self.rows(start, end), self.symbol_positions(symbols)]
+
+    def frame(self, name: str, start: datetime = None, end: datetime = None, symbols: Iterable[str] = None) -> pd.DataFrame:
+        """一个Factor的宽表：以交易日为索引、证券代码为列"""
+        rows, cols = self.rows(start, end), self.symbol_positions(symbols)
+        return pd.DataFrame(
+            self.values(name, start, end, symbols),
+            index=pd.DatetimeIndex(self.dates[rows], name=INDEX_NAMES[0]),
+            columns=pd.Index(self.symbols[cols], name=INDEX_NAMES[1]),
+        )
+
+    def block(self, start: datetime = None, end: datetime = None, symbols: Iterable[str] = None) -> Tuple[slice, np.ndarray or slice]:
+        """日期区间和证券对应的(行, 按顺序去重后的列号)，get和mask都以此为准"""
+        positions = self.symbol_positions(symbols)
+        return self.rows(start, end), positions if isinstance(positions, slice) else np.unique(positions)
+
+    def get(self, cols: List[str], start: datetime = None, end: datetime = None, symbols: Iterable[str] = None, mask: np.ndarray = None) -> pd.DataFrame:
+        """若干Factor的长表，以(tdate, symbol)为索引，只包含原始数据中有的行，按tdate、symbol排序
+
+        :param mask: 与block(start, end, symbols)形状相同的布尔数组，只保留为True的行
+        """
+        rows, positions = self.block(start, end, symbols)
+        present = self.present[rows, positions]
+        if mask is not None:
+            present = present & mask  # 不指定证券时present是面板的视图，不能原地修改
+        row_idx, col_idx = np.nonzero(present)
+        # 两个轴都已排序且没有重复，直接作为MultiIndex的levels，行列号就是codes，不需要重新分解
+        index = pd.MultiIndex(levels=[self.dates[rows], self.symbols[positions]], codes=[row_idx, col_idx], names=INDEX_NAMES, verify_integrity=False)
+        data = {col: self.factors[col][rows, positions][row_idx, col_idx] for col in cols}
+        return pd.DataFrame(data, index=index, columns=cols)
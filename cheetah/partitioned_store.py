@@ -0,0 +1,149 @@
+"""按日期分区保存数据
+
+整体保存的数据每次刷新都要把新数据合并进全部历史再整体写入，增加一天的数据要重写十年的数据。
+按日期分区保存时，一代数据在plasma store中保存为：
+1. 分区：按年（PARTITION_YEAR）或按月（PARTITION_MONTH）拆分的数据，每个分区一个对象，写入后不再修改；
+2. 清单：object_id本身，Arrow IPC格式的表，记录每个分区的名称和object_id。
+刷新时只读取并重写新数据涉及的分区（通常只是最近的一个分区，即头分区），其他分区的object_id原样写入新一代的清单，
+所以刷新的用时和内存只与新数据的多少有关。读者先读清单，再只读取用到的日期区间所在的分区。
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Callable, Any, Tuple
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import plasma
+from pyarrow.plasma import ObjectNotAvailable
+
+from .arrow_store import put_table, get_table
+from .plasma_store import shard_object_id
+
+PARTITION_YEAR = "Y"
+PARTITION_MONTH = "M"
+PARTITIONS_KEY = b"cheetah.partitions"  # 清单schema metadata中的标记，值为分区粒度
+
+
+def date_int(value: datetime or str or int) -> int:
+    """datetime或"%Y%m%d"格式的日期转换为整数，如20200101"""
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.year * 10000 + value.month * 100 + value.day
+    return int(value)
+
+
+def partition_name(value: datetime or str or int, freq: str) -> str:
+    """日期所在的分区：按年为"2020"，按月为"202001" """
+    date = date_int(value)
+    if freq == PARTITION_YEAR:
+        return str(date // 10000)
+    if freq == PARTITION_MONTH:
+        return str(date // 100)
+    raise ValueError(f"不支持的分区粒度：{freq}")
+
+
+def partition_range(name: str) -> Tuple[int, int]:
+    """分区包含的日期范围[start, end]，日期为整数"""
+    if len(name) == 4:
+        return int(name) * 10000 + 101, int(name) * 10000 + 1231
+    return int(name) * 100 + 1, int(name) * 100 + 31
+
+
+def partition_object_id(object_id: plasma.ObjectID, name: str) -> plasma.ObjectID:
+    """在object_id这一代写入的分区的object_id，之后各代沿用"""
+    return shard_object_id(object_id, f"partition/{name}")
+
+
+def split_frame(df: pd.DataFrame, freq: str) -> Dict[str, pd.DataFrame]:
+    """把以日期为第一级索引的数据框按分区拆分：{分区名: 数据框}"""
+    dates = pd.DatetimeIndex(df.index.get_level_values(0))
+    names = dates.strftime("%Y" if freq == PARTITION_YEAR else "%Y%m")
+    return {name: part for name, part in df.groupby(names.values, sort=True)}
+
+
+def is_manifest(table) -> bool:
+    """读到的对象是否是分区清单"""
+    return isinstance(table, pa.Table) and PARTITIONS_KEY in (table.schema.metadata or {})
+
+
+class PartitionedData(object):
+    """按日期分区保存的一代数据，分区在用到时才读取；合并新数据时只记录改动的分区，写入时只写这些分区"""
+
+    def __init__(self, freq: str, partitions: Dict[str, plasma.ObjectID] = None, loader: Callable[[plasma.ObjectID], Any] = None, dirty: Dict[str, Any] = None):
+        """
+        :param freq: 分区粒度
+        :param partitions: 已写入plasma store的分区，{分区名: object_id}
+        :param loader: 读取一个分区的函数
+        :param dirty: 还没有写入的分区，{分区名: 数据}
+        """
+        self.freq = freq
+        self.partitions: Dict[str, plasma.ObjectID] = OrderedDict(sorted((partitions or {}).items()))
+        self.loader = loader
+        self.dirty: Dict[str, Any] = dict(dirty or {})
+
+    @classmethod
+    def from_table(cls, table: pa.Table, loader: Callable[[plasma.ObjectID], Any] = None) -> "PartitionedData":
+        """由清单建立"""
+        partitions = {name: plasma.ObjectID(object_id) for name, object_id in zip(table.column("partition").to_pylist(), table.column("object_id").to_pylist())}
+        return cls(table.schema.metadata[PARTITIONS_KEY].decode(), partitions, loader)
+
+    @classmethod
+    def open(cls, plasma_client, object_id: plasma.ObjectID, loader: Callable[[plasma.ObjectID], Any]) -> "PartitionedData" or ObjectNotAvailable:
+        """读取清单，没有这个对象时返回ObjectNotAvailable"""
+        table = get_table(plasma_client, object_id)
+        if table is ObjectNotAvailable:
+            return ObjectNotAvailable
+        if not is_manifest(table):
+            raise TypeError(f"对象{object_id}不是分区清单")
+        return cls.from_table(table, loader)
+
+    def names(self, start: datetime or str = None, end: datetime or str = None) -> List[str]:
+        """与日期区间[start, end]有交集的分区，按日期排序"""
+        lo = 0 if start is None else date_int(start)
+        hi = 99991231 if end is None else date_int(end)
+        names = sorted(set(self.partitions) | set(self.dirty))
+        return [name for name in names if partition_range(name)[1] >= lo and partition_range(name)[0] <= hi]
+
+    def get(self, name: str):
+        """读取一个分区"""
+        if name in self.dirty:
+            return self.dirty[name]
+        data = self.loader(self.partitions[name])
+        if data is ObjectNotAvailable:
+            raise KeyError(f"plasma store中没有分区{name}")
+        return data
+
+    def merge(self, parts: Dict[str, Any], merge_data: Callable[[Any, Any], Any]) -> "PartitionedData":
+        """合并按分区拆分的新数据，只读取新数据涉及的分区，返回新的PartitionedData
+
+        :param parts: {分区名: 新数据}
+        :param merge_data: 合并一个分区的已有数据和新数据的函数，见DataMan.merge_data
+        """
+        dirty = dict(self.dirty)
+        for name, part in parts.items():
+            dirty[name] = merge_data(self.get(name), part) if name in self.dirty or name in self.partitions else part
+        return PartitionedData(self.freq, self.partitions, self.loader, dirty)
+
+    def materialize(self, combine: Callable[[List[Any]], Any], start: datetime or str = None, end: datetime or str = None):
+        """把与[start, end]有交集的分区拼接为一个数据，见DataMan.combine_partitions"""
+        return combine([self.get(name) for name in self.names(start, end)])
+
+    def object_ids(self) -> List[plasma.ObjectID]:
+        """已写入plasma store的分区"""
+        return list(self.partitions.values())
+
+    def write(self, plasma_client, object_id: plasma.ObjectID, store: Callable[[Any, plasma.ObjectID], Any]) -> List[plasma.ObjectID]:
+        """写入改动的分区和新一代的清单，没有改动的分区沿用原来的object_id
+
+        :param object_id: 新一代清单的object_id
+        :param store: 把一个分区写入plasma store的函数
+        :return: 新一代占用的所有object_id，清单在最后，保证清单可见时所有分区都已写入
+        """
+        partitions = dict(self.partitions)
+        for name, data in sorted(self.dirty.items()):
+            partitions[name] = partition_object_id(object_id, name)
+            store(data, partitions[name])
+        names = sorted(partitions)
+        manifest = pa.table({"partition": pa.array(names, pa.string()), "object_id": pa.array([partitions[name].binary() for name in names], pa.binary(20))})
+        put_table(plasma_client, manifest.replace_schema_metadata({PARTITIONS_KEY: self.freq.encode()}), object_id)
+        self.partitions, self.dirty = OrderedDict((name, partitions[name]) for name in names), {}
+        return list(self.partitions.values()) + [object_id]
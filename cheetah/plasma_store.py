@@ -1,3 +1,4 @@
+import hashlib
 import os
 import subprocess
 
@@ -37,3 +38,13 @@ def equipment_id_to_object_id(equipment_id: str) -> plasma.ObjectID:
 def object_id_to_equipment_id(object_id: plasma.ObjectID) -> str:
     """object_id转换为equipment_id的统一算法"""
     return str(object_id.binary().rstrip(b"_"))  # 删除掉右边的_则还原为object_id
+
+
+def generation_object_id(equipment_id: str, generation: int) -> plasma.ObjectID:
+    """装备标识和代数转换为object_id的统一算法，每次更新数据都写入新的一代，旧的一代在没有读者后再回收"""
+    return plasma.ObjectID(hashlib.sha1(f"{equipment_id}@{generation}".encode()).digest())  # sha1正好20字节
+
+
+def shard_object_id(object_id: plasma.ObjectID, shard_name: str) -> plasma.ObjectID:
+    """一个对象的分片（如按列分片的某一列）的object_id，由对象的object_id和分片名称计算得到"""
+    return plasma.ObjectID(hashlib.sha1(object_id.binary() + f"/{shard_name}".encode()).digest())
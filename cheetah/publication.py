@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, List
+
+
+def pointer_file_name(plasma_store_name: str) -> str:
+    """发布指针文件与plasma store的socket放在一起，服务端和客户端据此找到同一个文件"""
+    return f"{plasma_store_name}.published.json"
+
+
+class PublishedPointers(object):
+    """已发布对象的代数指针表
+
+    plasma中的对象不可修改，如果先删除旧对象再用同一个object_id写入新对象，删除生效前（旧对象仍被引用时）无法写入，
+    期间读者也读不到数据。因此每次更新都写入新的一代（见plasma_store.generation_object_id），写完后再把指针指向新的一代。
+    指针表是一个很小的json文件，用"写临时文件+os.replace"原子替换，读者任何时刻都能读到完整的指针表：
+    - generations：{装备标识: 当前发布的代数}；
+    - counters：{装备标识: 分配过的最大代数}，取消发布、重新启动后都保留，代数只增不减，object_id从不重复使用，
+      否则被淘汰后重新加载的数据可能与仍在等待回收（或仍被读者引用）的旧一代撞上同一个object_id；
+    - instance：plasma store实例的随机标识，每次重新启动都不同，客户端据此判断缓存的对象是否来自当前的store。
+    服务端调用next_generation/publish/unpublish，客户端调用resolve，客户端按文件版本缓存指针表。
+    """
+
+    def __init__(self, plasma_store_name: str):
+        self.file_name = pointer_file_name(plasma_store_name)
+        self._generations: Dict[str, int] = {}
+        self._counters: Dict[str, int] = {}
+        self._instance: str or None = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """清空指针表并换一个store实例标识，保留已分配的代数，服务端重新启动plasma store时调用"""
+        with self._lock:
+            self._reload()
+            self._generations = {}
+            self._instance = uuid.uuid4().hex
+            self._write()
+
+    def next_generation(self, equipment_id: str) -> int:
+        """分配一个新的代数，分配后立即写入文件，写入失败而没有发布的代数也不再使用"""
+        with self._lock:
+            self._reload()
+            generation = max(self._counters.get(equipment_id, 0), self._generations.get(equipment_id, 0)) + 1
+            self._counters[equipment_id] = generation
+            self._write()
+            return generation
+
+    def publish(self, equipment_id: str, generation: int):
+        """发布一代数据"""
+        with self._lock:
+            self._reload()
+            self._generations[equipment_id] = generation
+            self._counters[equipment_id] = max(self._counters.get(equipment_id, 0), generation)
+            self._write()
+
+    def unpublish(self, equipment_id: str):
+        """取消发布，之后读者将读不到这个对象，已分配的代数保留"""
+        with self._lock:
+            self._reload()
+            self._generations.pop(equipment_id, None)
+            self._write()
+
+    def resolve(self, equipment_id: str) -> int or None:
+        """获取当前发布的代数，没有发布则返回None"""
+        with self._lock:
+            self._reload()
+            return self._generations.get(equipment_id)
+
+    def list(self) -> List[str]:
+        """当前发布的所有装备标识"""
+        with self._lock:
+            self._reload()
+            return list(self._generations)
+
+    @property
+    def instance(self) -> str or None:
+        """当前plasma store实例的标识，没有指针文件时为None"""
+        with self._lock:
+            self._reload()
+            return self._instance
+
+    def _write(self):
+        tmp_file_name = f"{self.file_name}.{os.getpid()}.tmp"
+        with open(tmp_file_name, "w", encoding="utf8") as file:
+            json.dump({"instance": self._instance, "generations": self._generations, "counters": self._counters}, file)
+        os.replace(tmp_file_name, self.file_name)
+        self._mtime = self._file_version()
+
+    def _file_version(self):
+        # os.replace每次都换成新文件，inode加修改时间可以识别出同一秒内的多次发布
+        stat = os.stat(self.file_name)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _reload(self):
+        try:
+            mtime = self._file_version()
+        except FileNotFoundError:
+            self._generations, self._counters, self._instance, self._mtime = {}, {}, None, None
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.file_name, "r", encoding="utf8") as file:
+                    content = json.load(file)
+                self._generations, self._counters, self._instance = content["generations"], content.get("counters", {}), content.get("instance")
+                self._mtime = mtime
+            except (OSError, ValueError, KeyError):
+                logging.warning(f"读取发布指针文件{self.file_name}失败，继续使用上次读取的指针。", exc_info=True)
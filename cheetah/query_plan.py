@@ -0,0 +1,93 @@
+"""跨数据表的查询计划
+
+一次查询可能涉及几十张数据表的上百列。plan_query把要查询的列（统一名称或别名）转换为统一名称，
+按belong_to分组，每张数据表只读取一次、只读取用到的列，日期区间和证券随读取一起下推；
+align把各数据表读到的数据在共同的(tdate, symbol)索引上对齐：索引编码为整数键后用排序和二分查找合并，
+不需要pandas的通用merge/join。
+"""
+from collections import namedtuple, OrderedDict
+from datetime import datetime
+from typing import List, Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .metadata_catalog import MetadataCatalog
+from .panel import fill_value, nullable_dtype
+from .sharded_store import INDEX_NAMES
+
+SourceScan = namedtuple("SourceScan", ["source", "columns", "table_columns"])  # 一张数据表上的读取：数据表、统一名称、数据表的列名
+
+
+class QueryPlan(object):
+    def __init__(self, output: List[str], names: List[str], scans: List[SourceScan], start: datetime = None, end: datetime = None, symbols: List[str] = None):
+        """
+        :param output: 结果的列名，与查询时给出的列名相同
+        :param names: output对应的统一名称
+        :param scans: 每张数据表上的读取
+        """
+        self.output = output
+        self.names = names
+        self.scans = scans
+        self.start = start
+        self.end = end
+        self.symbols = symbols
+
+    @property
+    def columns(self) -> List[str]:
+        """需要读取的统一名称（去重）"""
+        return [name for scan in self.scans for name in scan.columns]
+
+    def __repr__(self):
+        scans = ", ".join(f"{scan.source}{scan.columns}" for scan in self.scans)
+        return f"QueryPlan([{self.start}, {self.end}], symbols={self.symbols}, scans=[{scans}])"
+
+
+def plan_query(catalog: MetadataCatalog, cols: Iterable[str], start: datetime = None, end: datetime = None, symbols: Iterable[str] = None) -> QueryPlan:
+    """生成查询计划
+
+    :param cols: 列的统一名称或别名
+    :raise KeyError: 元数据中没有的列
+    """
+    output = list(cols)
+    names = [catalog.canonical_name(col) for col in output]
+    unknown = [col for col, name in zip(output, names) if name is None]
+    if unknown:
+        raise KeyError(f"没有这些column: {unknown}")
+    by_source: Dict[str, List[str]] = OrderedDict()
+    for name in dict.fromkeys(names):
+        by_source.setdefault(catalog.get_belong_to(name), []).append(name)
+    scans = [SourceScan(source, columns, [catalog.get_table_colname(name) for name in columns]) for source, columns in by_source.items()]
+    return QueryPlan(output, names, scans, start, end, None if symbols is None else list(symbols))
+
+
+def align(pieces: List[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]]) -> pd.DataFrame:
+    """把各数据表的数据在(tdate, symbol)的并集上对齐，某张表没有的行为缺失值
+
+    :param pieces: [(每行的交易日, 每行的证券代码, {列名: 每行的值})]，每张表内(tdate, symbol)不重复
+    :return: 以(tdate, symbol)为索引、按索引排序的数据框
+    """
+    if not pieces:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=INDEX_NAMES))
+    tdates = [np.asarray(piece[0]).astype("datetime64[ns]") for piece in pieces]
+    dates, date_codes = np.unique(np.concatenate(tdates), return_inverse=True)
+    symbol_codes, symbols = pd.factorize(np.concatenate([np.asarray(piece[1], dtype=object) for piece in pieces]), sort=True)
+    width = max(1, len(symbols))
+    keys = date_codes.astype(np.int64) * width + symbol_codes  # (tdate, symbol)编码为一个整数，按键排序即按索引排序
+    union = np.unique(keys)
+    index = pd.MultiIndex(levels=[dates, symbols], codes=[union // width, union % width], names=INDEX_NAMES, verify_integrity=False)
+    data = {}
+    offset = 0
+    for piece_tdates, (_, _, columns) in zip(tdates, pieces):
+        positions = np.searchsorted(union, keys[offset : offset + len(piece_tdates)])
+        offset += len(piece_tdates)
+        complete = len(positions) == len(union)
+        for col, values in columns.items():
+            values = np.asarray(values)
+            dtype = values.dtype if complete else nullable_dtype(values.dtype)
+            result = np.empty(len(union), dtype=dtype)
+            if not complete:
+                result.fill(fill_value(dtype))
+            result[positions] = values
+            data[col] = result
+    return pd.DataFrame(data, index=index)
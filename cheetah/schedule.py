@@ -0,0 +1,133 @@
+"""按对象安排刷新时间
+
+每个DataMan可以通过refresh_policy声明自己的刷新策略，如固定间隔、交易日收盘后、交易日的若干固定时点等，
+RefreshScheduler用小顶堆按下次刷新时间排列所有对象，只有到期的对象才会进入刷新（才会调用check_data）。
+"""
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Iterable
+
+
+def trade_calendar():
+    """stralib的交易日历，用到时才导入，导入本模块（及客户端读取数据）不需要stralib"""
+    from .. import FastTdate
+
+    return FastTdate
+
+
+class RefreshPolicy(ABC):
+    """刷新策略"""
+
+    @abstractmethod
+    def next_due(self, last_run: datetime) -> datetime:
+        """上次刷新时间为last_run时，下次应该刷新的时间"""
+        return NotImplemented
+
+
+class IntervalPolicy(RefreshPolicy):
+    """固定间隔刷新"""
+
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+
+    def next_due(self, last_run: datetime) -> datetime:
+        return last_run + timedelta(seconds=self.seconds)
+
+    def __repr__(self):
+        return f"IntervalPolicy({self.seconds})"
+
+
+class TradingDayPolicy(RefreshPolicy):
+    """只在交易日的若干固定时点刷新，类似于只在交易日执行的cron"""
+
+    def __init__(self, *times: time, calendar=None):
+        """
+        :param times: 每个交易日的刷新时点，如time(15, 30)
+        :param calendar: 交易日历，需提供is_tdate，缺省在计算刷新时间时才导入stralib的FastTdate
+        """
+        if not times:
+            raise ValueError("至少需要一个刷新时点")
+        self.times = sorted(times)
+        self.calendar = calendar
+
+    def next_due(self, last_run: datetime) -> datetime:
+        calendar = self.calendar or trade_calendar()
+        day = last_run.date()
+        for _ in range(366):
+            if calendar.is_tdate(datetime.combine(day, time())):
+                for at in self.times:
+                    due = datetime.combine(day, at)
+                    if due > last_run:
+                        return due
+            day += timedelta(days=1)
+        raise RuntimeError(f"一年内找不到交易日，请检查交易日历：{last_run}")
+
+    def __repr__(self):
+        return f"TradingDayPolicy({', '.join(at.strftime('%H:%M') for at in self.times)})"
+
+
+class AfterClosePolicy(TradingDayPolicy):
+    """交易日收盘后刷新一次，适合每个交易日只变化一次的数据"""
+
+    def __init__(self, at: time = time(15, 30), calendar=None):
+        super().__init__(at, calendar=calendar)
+
+
+class RefreshScheduler(object):
+    """用小顶堆管理各对象的下次刷新时间"""
+
+    def __init__(self, default_policy: RefreshPolicy, retry_interval: int = None):
+        """
+        :param default_policy: 没有声明refresh_policy的对象使用的策略
+        :param retry_interval: 刷新失败后最迟多少秒重试，缺省None表示按刷新策略安排
+        """
+        self.default_policy = default_policy
+        self.retry_interval = retry_interval
+        self._heap = []  # (到期时间, 序号, 数据标识符)
+        self._due: Dict[str, datetime] = {}  # 每个对象当前有效的到期时间，堆中与之不符的条目已作废
+        self._counter = itertools.count()
+
+    def policy_of(self, dataman) -> RefreshPolicy:
+        return getattr(dataman, "refresh_policy", None) or self.default_policy
+
+    def schedule(self, equipment_id: str, due: datetime):
+        self._due[equipment_id] = due
+        heapq.heappush(self._heap, (due, next(self._counter), equipment_id))
+
+    def schedule_now(self, equipment_id: str):
+        """立即刷新，用于新加入的对象和需要重新加载的对象"""
+        self.schedule(equipment_id, datetime.min)
+
+    def reschedule(self, dataman, ran_at: datetime, succeeded: bool = True):
+        """刷新完成后按对象的刷新策略安排下次刷新，刷新失败时不等到刷新策略的下个时点，最迟retry_interval秒后重试"""
+        due = self.policy_of(dataman).next_due(ran_at)
+        if not succeeded and self.retry_interval is not None:
+            due = min(due, ran_at + timedelta(seconds=self.retry_interval))
+        self.schedule(dataman.数据标识符, due)
+
+    def pop_due(self, now: datetime, known_ids: Iterable[str]) -> List[str]:
+        """取出所有到期的对象
+
+        :param now: 当前时间
+        :param known_ids: 当前服务中的所有数据标识符，没有安排过的对象立即到期，已移除的对象不再安排
+        """
+        known_ids = set(known_ids)
+        for equipment_id in known_ids - set(self._due):
+            self.schedule_now(equipment_id)
+        result = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, equipment_id = heapq.heappop(self._heap)
+            if self._due.get(equipment_id) != due:
+                continue  # 已被重新安排
+            del self._due[equipment_id]
+            if equipment_id in known_ids:
+                result.append(equipment_id)
+        return result
+
+    def next_due_time(self) -> datetime or None:
+        """最早的下次刷新时间，没有安排任何对象时返回None"""
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
@@ -1,19 +1,61 @@
 import logging
 import threading
+import time
+from collections import namedtuple
 from datetime import datetime
-from typing import List, Any, Tuple, Dict, TypeVar, Set
+from typing import List, Any, Tuple, Dict, TypeVar, Set, Callable
 from abc import ABC, abstractmethod
 
+import pandas as pd
+import pyarrow as pa
 from pyarrow import plasma, SerializationContext
 from pyarrow.plasma import PlasmaStoreFull, ObjectNotAvailable, PlasmaObjectExists
 
-from .plasma_store import start_plasma_store, equipment_id_to_object_id
+from .capacity import CapacityManager, POLICY_LRU
+from .connection_pool import PlasmaConnectionPool
+from .arrow_store import put_table, get_table, dataframe_to_table, table_to_dataframe
+from .executor import RefreshExecutor, stale_small_first
+from .metrics import REGISTRY, MetricsServer
+from .partitioned_store import PartitionedData, split_frame
+from .plasma_store import start_plasma_store, generation_object_id
+from .publication import PublishedPointers
+from .schedule import RefreshPolicy, RefreshScheduler, IntervalPolicy
+from .snapshot import SnapshotStore
 from .singleton import Singleton
 
 T = TypeVar("T")
 
+# 数据在plasma store中的保存格式
+STORAGE_SERIALIZATION = "serialization"  # 用get_serialization_context序列化
+STORAGE_ARROW = "arrow"  # Arrow IPC列式格式，读者不需要反序列化，适合数据框
+
+# 水位线：已与数据源核对一致的最后一天，数据源能提供更新时间时同时记录已读到的最大更新时间（否则为None）
+Watermark = namedtuple("Watermark", ["fetched_until", "source_updated_at"])
+
+REFRESH_STAGE_SECONDS = REGISTRY.histogram("cheetah_refresh_stage_seconds", "各对象刷新各阶段（check/fetch/merge/put/delete）的用时", ("object", "stage"))
+BYTES_WRITTEN = REGISTRY.counter("cheetah_bytes_written_total", "写入plasma store的字节数", ("object",))
+OBJECT_BYTES = REGISTRY.gauge("cheetah_object_bytes", "各对象当前一代数据的大小", ("object",))
+STORE_CAPACITY_BYTES = REGISTRY.gauge("cheetah_store_capacity_bytes", "plasma store的容量")
+STORE_USED_BYTES = REGISTRY.gauge("cheetah_store_used_bytes", "plasma store已使用的字节数")
+STORE_UTILIZATION = REGISTRY.gauge("cheetah_store_utilization", "plasma store的使用率")
+
 
 class DataMan(ABC):
+    # 刷新本对象前需要先刷新的数据标识符，如复权因子依赖分红送配信息
+    depends_on: Tuple[str, ...] = ()
+    # 并发组名称，同一并发组的对象共享DataService.group_limits中设置的并发上限，None表示不限制
+    concurrency_group: str or None = None
+    # 保存格式，数据框类的数据建议使用STORAGE_ARROW
+    storage_format: str = STORAGE_SERIALIZATION
+    # 内存紧张时是否可以被淘汰
+    evictable: bool = True
+    # 刷新策略，见schedule模块，None表示按DataService.update_interval固定间隔刷新
+    refresh_policy: RefreshPolicy or None = None
+    # 按列分片保存时不压缩的最近交易日数，更早的数据压缩保存、读取时才解压（见sharded_store），None表示全部不压缩
+    hot_window: int or None = None
+    # 按日期分区保存的粒度（partitioned_store.PARTITION_YEAR、PARTITION_MONTH），刷新时只重写新数据涉及的分区，None表示整体保存
+    partition_freq: str or None = None
+
     def __init__(self, id: str, name: str, start: datetime, today_toggle=False):
         """
 
@@ -27,6 +69,10 @@ class DataMan(ABC):
         self._数据区间: Tuple[datetime, datetime] = (start, start)
         self._取当日数据: bool = today_toggle
         self._plasma_store_id = None
+        self._partition_ids: Dict[plasma.ObjectID, List[plasma.ObjectID]] = {}  # 按日期分区保存时每一代数据的分区和清单
+        self.watermark: Watermark or None = None  # check_data只需核对水位线之后的数据，随快照保存
+        self._checked: Watermark or None = None  # 本次check_data核对到的水位线，刷新成功后才生效
+        self._dependency_loader: Callable[[str], Any] or None = None  # 刷新期间由服务设置，见dependency
 
     @property
     def 数据获取ID(self):
@@ -73,6 +119,26 @@ class DataMan(ABC):
     def check_data(self, data: T or ObjectNotAvailable) -> Set[Tuple[datetime, datetime]]:
         return NotImplemented
 
+    def checked_until(self, fetched_until: datetime, source_updated_at: datetime = None):
+        """check_data记录本次已与数据源核对到的水位线，刷新成功（没有缺少的数据，或新数据已发布）后由服务调用commit_watermark生效"""
+        self._checked = Watermark(fetched_until, source_updated_at)
+
+    def commit_watermark(self):
+        if self._checked is not None:
+            self.watermark, self._checked = self._checked, None
+
+    def close(self):
+        """服务停止时调用，释放进程池等资源，缺省没有需要释放的资源"""
+
+    def dependency(self, key: str) -> Any or PartitionedData or ObjectNotAvailable:
+        """读取depends_on中的数据当前发布的一代，只能在刷新期间（check_data、fetch_data中）调用
+
+        :return: 见load，按日期分区保存的数据返回PartitionedData；还没有数据时返回ObjectNotAvailable
+        """
+        if key not in self.depends_on or self._dependency_loader is None:
+            raise RuntimeError(f"{self.数据名称}: 只能在刷新期间读取depends_on中的数据，{key}不可用")
+        return self._dependency_loader(key)
+
     @classmethod
     @abstractmethod
     def get_serialization_context(cls) -> SerializationContext:
@@ -88,6 +154,73 @@ class DataMan(ABC):
     def deserialize(data):
         return NotImplemented
 
+    def to_arrow(self, data: T) -> pa.Table:
+        """storage_format为STORAGE_ARROW时，保存前把数据转换为pyarrow.Table，缺省认为数据是pandas数据框"""
+        return dataframe_to_table(data)
+
+    def from_arrow(self, table: pa.Table) -> T:
+        """storage_format为STORAGE_ARROW时，把读取到的pyarrow.Table还原为数据"""
+        return table_to_dataframe(table)
+
+    def split_partitions(self, data: T) -> Dict[str, T]:
+        """partition_freq不为None时，把数据按日期拆分为{分区名: 数据}，缺省认为数据是以日期为第一级索引的数据框"""
+        return split_frame(data, self.partition_freq)
+
+    def combine_partitions(self, parts: List[T]) -> T:
+        """把按日期排序的若干分区拼接为一个数据，缺省认为数据是数据框"""
+        return pd.concat(parts) if parts else ObjectNotAvailable
+
+    def merge(self, old_data: T or PartitionedData, insert_data: T) -> T or PartitionedData:
+        """合并已有数据和新获取的数据；按日期分区保存时只读取并合并新数据涉及的分区，其他分区不读取"""
+        if isinstance(old_data, PartitionedData):
+            return old_data.merge(self.split_partitions(insert_data), self.merge_data)
+        return self.merge_data(old_data, insert_data)
+
+    def load(self, plasma_client, object_id: plasma.ObjectID) -> T or PartitionedData or ObjectNotAvailable:
+        """从plasma store读取已保存的数据；按日期分区保存时只读取清单，返回PartitionedData，分区在用到时才读取"""
+        if self.partition_freq is not None:
+            data = PartitionedData.open(plasma_client, object_id, lambda partition_id: self._load_object(plasma_client, partition_id))
+            if data is not ObjectNotAvailable:
+                self._partition_ids.setdefault(object_id, data.object_ids() + [object_id])
+            return data
+        return self._load_object(plasma_client, object_id)
+
+    def _load_object(self, plasma_client, object_id: plasma.ObjectID) -> T or ObjectNotAvailable:
+        if self.storage_format == STORAGE_ARROW:
+            table = get_table(plasma_client, object_id)
+            return table if table is ObjectNotAvailable else self.from_arrow(table)
+        return plasma_client.get(object_id, timeout_ms=0, serialization_context=self.get_serialization_context())
+
+    def estimate_size(self, data: T) -> int or None:
+        """估计数据写入plasma store后的大小（字节），用于写入前的容量检查，返回None表示无法估计"""
+        if isinstance(data, PartitionedData):  # 只写入改动的分区
+            sizes = [self.estimate_size(part) for part in data.dirty.values()]
+            return None if None in sizes else sum(sizes)
+        if isinstance(data, pd.DataFrame):
+            return int(data.memory_usage(index=True, deep=True).sum())
+        return None
+
+    def object_ids(self, object_id: plasma.ObjectID) -> List[plasma.ObjectID]:
+        """一代数据在plasma store中占用的所有object_id，分片保存的数据需要重载，用于回收旧一代数据和统计大小"""
+        return self._partition_ids.get(object_id, [object_id])
+
+    def store(self, plasma_client, data: T or PartitionedData, object_id: plasma.ObjectID) -> plasma.ObjectID:
+        """把数据保存到plasma store，返回保存的object_id；按日期分区保存时只写入改动的分区和新一代的清单"""
+        if self.partition_freq is not None:
+            if not isinstance(data, PartitionedData):
+                data = PartitionedData(self.partition_freq, dirty=self.split_partitions(data))
+            object_ids = data.write(plasma_client, object_id, lambda part, partition_id: self._store_object(plasma_client, part, partition_id))
+            # 只保留当前一代和新一代的分区清单，当前一代随后会被服务回收
+            self._partition_ids = {key: value for key, value in self._partition_ids.items() if key == self.数据获取ID}
+            self._partition_ids[object_id] = object_ids
+            return object_id
+        return self._store_object(plasma_client, data, object_id)
+
+    def _store_object(self, plasma_client, data: T, object_id: plasma.ObjectID) -> plasma.ObjectID:
+        if self.storage_format == STORAGE_ARROW:
+            return put_table(plasma_client, self.to_arrow(data), object_id)
+        return plasma_client.put(data, object_id=object_id, serialization_context=self.get_serialization_context())
+
 
 class DataService(Singleton, threading.Thread):
     """数据加载到共享内存"""
@@ -95,12 +228,38 @@ class DataService(Singleton, threading.Thread):
     # 记录内存中需要缓存的数据及其状态
     __objects__: Dict[str, DataMan]
 
-    def __init__(self, plasma_store_name: str, object_list: List[DataMan], plasma_shm_size: int = 2000, update_interval: int = 300):
+    def __init__(
+        self,
+        plasma_store_name: str,
+        object_list: List[DataMan],
+        plasma_shm_size: int = 2000,
+        update_interval: int = 300,
+        max_workers: int = 4,
+        group_limits: Dict[str, int] = None,
+        gc_delay: int = 30,
+        eviction_policy: str = POLICY_LRU,
+        high_watermark: float = 0.9,
+        low_watermark: float = 0.8,
+        snapshot_dir: str = None,
+        snapshot_interval: int = 3600,
+        metrics_file: str = None,
+        metrics_socket: str = None,
+    ):
         """ 初始化plasma store和需要维护的数据列表
         :param plasma_store_name: 启动plasma store server的进程名称
         :param plasma_shm_size: 为缓存分配的内存大小, 以M为单位，缺省2000
         :param object_list: 拟缓存的对象列表
-        :param update_interval: 更新间隔（s），缺省300秒
+        :param update_interval: 更新间隔（s），缺省300秒，是没有声明refresh_policy的对象的刷新间隔，也是刷新失败的对象最迟重试的间隔
+        :param max_workers: 并发刷新的最大数量，缺省4，为1时退化为逐个刷新
+        :param group_limits: 并发组的并发上限，{并发组名称: 上限}，见DataMan.concurrency_group
+        :param gc_delay: 旧一代数据在新一代发布后保留的秒数，缺省30秒，保证刚解析到旧一代指针的读者仍能读到数据
+        :param eviction_policy: 内存紧张时的淘汰策略，capacity.POLICY_LRU或capacity.POLICY_LFU，缺省LRU
+        :param high_watermark: 内存使用率超过该值时开始淘汰最冷的对象，缺省0.9
+        :param low_watermark: 淘汰到内存使用率低于该值为止，缺省0.8
+        :param snapshot_dir: 磁盘快照目录，设置后定期把已发布的数据保存到磁盘，启动时从快照恢复，只获取快照之后缺少的数据
+        :param snapshot_interval: 快照间隔（s），缺省3600秒
+        :param metrics_file: 每轮更新后把运行指标以Prometheus文本格式写到这个文件
+        :param metrics_socket: 在这个Unix socket上提供运行指标，见metrics.MetricsServer
         """
         logging.info("开始启动plasma服务器...")
         if hasattr(self, "proc"):
@@ -108,19 +267,47 @@ class DataService(Singleton, threading.Thread):
             self.proc.kill()
         self.plasma_store_name, self.proc = start_plasma_store(plasma_store_name, int(plasma_shm_size * 1e6))
         logging.info("plasma服务器启动成功！")
+        # 刷新线程、主线程各借用一个连接，连接长期保持，不再每次操作都重新连接
+        self.pool = PlasmaConnectionPool(self.plasma_store_name, max_size=max_workers + 2)
+        self.pointers = PublishedPointers(self.plasma_store_name)
+        self.pointers.reset()  # 新启动的plasma store中没有任何对象，旧的指针全部作废
 
         self.__objects__ = {item.数据标识符: item for item in object_list}
 
         threading.Thread.__init__(self)
         self.stop_event = threading.Event()
         self.update_interval = update_interval
+        self.executor = RefreshExecutor(max_workers, group_limits, self.stop_event)
+        # 各对象按自己的刷新策略到期后才刷新，没有声明refresh_policy的对象每update_interval秒刷新一次，刷新失败的对象最迟update_interval秒后重试
+        self.scheduler = RefreshScheduler(IntervalPolicy(update_interval), retry_interval=update_interval)
+        # 记录各对象的大小和客户端的访问情况，用于安排刷新顺序和内存紧张时的淘汰
+        self.capacity = CapacityManager(self.plasma_store_name, eviction_policy, high_watermark, low_watermark)
+        self._refreshing: Set[str] = set()  # 正在刷新的对象不能被淘汰
+
+        self.snapshots = SnapshotStore(snapshot_dir) if snapshot_dir else None
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_generations: Dict[str, int] = {}  # 各对象已保存快照的代数
+        self._last_snapshot = None
+        if self.snapshots is not None:
+            self.restore_snapshots()
+        self.gc_delay = gc_delay
+        # 已被新一代替换、等待回收的对象：[(退役时间, 数据标识符, object_id)]
+        self._retired: List[Tuple[float, str, plasma.ObjectID]] = []
+        self._retired_lock = threading.Lock()
+        self.metrics_file = metrics_file
+        self.metrics_server = MetricsServer(metrics_socket) if metrics_socket else None
+        if self.metrics_server is not None:
+            self.metrics_server.start()
 
     def add_object(self, item: DataMan):
         self.__objects__[item.数据标识符] = item
 
     def remove_object(self, object_id: str):
         if self.contains(object_id):
-            self._delete_plasma_object(None, self.objects[object_id].数据获取ID)
+            self.pointers.unpublish(object_id)
+            if self.objects[object_id].数据获取ID is not None:
+                self._retire(object_id, self.objects[object_id].object_ids(self.objects[object_id].数据获取ID))
+        OBJECT_BYTES.remove(object=object_id)
         return self.__objects__.pop(object_id)
 
     def has_object(self, object_id: str):
@@ -133,49 +320,132 @@ class DataService(Singleton, threading.Thread):
     def get_object_status(self, item_id):
         return self.__objects__[item_id]
 
-    def deal_object(self, dataman: DataMan):
-        plasma_client = plasma.connect(self.plasma_store_name)
+    def deal_object(self, dataman: DataMan) -> bool:
+        """刷新一个对象：核对缺少的数据，获取、合并后写入新的一代并发布
+
+        :return: 是否刷新成功（没有缺少的数据也算成功），失败时由调度器安排尽快重试
+        """
+        plasma_client = self.pool.acquire()
+        self._refreshing.add(dataman.数据标识符)
+        key = dataman.数据标识符
+        broken = False
+        dataman._dependency_loader = lambda dependency: self._load_dependency(plasma_client, dependency)
         try:
-            object_id = equipment_id_to_object_id(dataman.数据标识符)
-            stored_data = plasma_client.get(object_id, timeout_ms=0, serialization_context=dataman.get_serialization_context())
+            object_id = dataman.数据获取ID
+            if object_id is None:
+                stored_data = ObjectNotAvailable
+            else:
+                stored_data = dataman.load(plasma_client, object_id)
             if stored_data is ObjectNotAvailable:
                 logging.info(f"{dataman.数据名称}: 内存中还没有的数据。")
-            missing_data_ranges = dataman.check_data(stored_data)
+            with REFRESH_STAGE_SECONDS.time(object=key, stage="check"):
+                missing_data_ranges = dataman.check_data(stored_data)
             if missing_data_ranges:
                 logging.info(f"{dataman.数据名称}: 需要更新, 缺少的数据区间为：{missing_data_ranges}")
                 merged_data = stored_data
                 for start, end in missing_data_ranges:
-                    fetched_data = dataman.fetch_data(start, end)
+                    with REFRESH_STAGE_SECONDS.time(object=key, stage="fetch"):
+                        fetched_data = dataman.fetch_data(start, end)
                     if merged_data is not ObjectNotAvailable:
-                        merged_data = dataman.merge_data(merged_data, fetched_data)
+                        with REFRESH_STAGE_SECONDS.time(object=key, stage="merge"):
+                            merged_data = dataman.merge(merged_data, fetched_data)
                     else:
                         merged_data = fetched_data
                     logging.info(f"{dataman.数据名称}: ({start},{end})的数据获取和合并成功。")
-                if plasma_client.contains(object_id):
-                    logging.info(f"{dataman.数据名称}: 正在删除旧数据，请等待...")
-                    plasma_client = self._delete_plasma_object(plasma_client, object_id)
-                    logging.info(f"{dataman.数据名称}: 旧数据删除成功！")
-                dataman.数据获取ID = plasma_client.put(merged_data, object_id=object_id, serialization_context=dataman.get_serialization_context())
+                size = dataman.estimate_size(merged_data)
+                if not self._admit(plasma_client, dataman, size):
+                    logging.error(f"{dataman.数据名称}: 内存不足，且没有更冷的数据可以淘汰，拒绝写入新数据，继续使用旧数据。")
+                    return False
+                try:
+                    # 新数据写入新的一代（代数只增不减，object_id不会与仍在等待回收的旧一代重复），写完后再切换发布指针，读者在整个更新过程中都能读到数据
+                    generation = self.pointers.next_generation(dataman.数据标识符)
+                    new_object_id = generation_object_id(dataman.数据标识符, generation)
+                    with REFRESH_STAGE_SECONDS.time(object=key, stage="put"):
+                        dataman.数据获取ID = dataman.store(plasma_client, merged_data, new_object_id)
+                    new_object_ids = dataman.object_ids(dataman.数据获取ID)
+                    old_object_ids = dataman.object_ids(object_id) if object_id is not None else []
+                    # 新一代沿用的对象（如没有改动的分区）不计入写入量，也不回收
+                    reused = set(new_object_ids) & set(old_object_ids)
+                    BYTES_WRITTEN.inc(self._objects_size(plasma_client, [item for item in new_object_ids if item not in reused]), object=key)
+                    OBJECT_BYTES.set(self._objects_size(plasma_client, new_object_ids), object=key)
+                    self.pointers.publish(dataman.数据标识符, generation)
+                    if object_id is not None:
+                        self._retire(key, [item for item in old_object_ids if item not in reused])
+                finally:
+                    self.capacity.release(size or 0)
                 dataman.数据区间 = max(missing_data_ranges)[1]  # 扩展数据区间的后界
                 logging.info(f"{dataman.数据名称}: 数据更新完成，重新保存ID为:{dataman.数据获取ID}, 新数据区间为：{dataman.数据区间}")
+            dataman.commit_watermark()
+            return True
         except (KeyboardInterrupt, SystemExit):
             self.stop_event.set()
+            return False
         except PlasmaStoreFull:
             logging.error(f"{dataman.数据名称}: 内存已经全部用满，保存数据失败。请清理内存!!!!")
-        except Exception:
+            return False
+        except PlasmaObjectExists:
+            # 代数只增不减，正常情况下不会发生；这一代已经作废，重试时使用下一代
+            logging.exception(f"{dataman.数据名称}: 新一代数据的object_id已存在，发布指针文件可能被改动过，稍后用新的一代重试。")
+            return False
+        except Exception as e:
+            broken = isinstance(e, OSError)  # 连接出错，丢弃这个连接
             logging.exception(f"{dataman.数据名称}: 本次更新出错, 在下次更新再重试，或请管理员检查原因。")
+            return False
         finally:
-            plasma_client.disconnect()
+            stored_data = merged_data = fetched_data = None  # 连接会被继续使用，及时释放对共享内存中旧数据的引用
+            dataman._dependency_loader = None
+            self._refreshing.discard(dataman.数据标识符)
+            self.pool.release(plasma_client, discard=broken)
+
+    def _load_dependency(self, plasma_client, key: str):
+        """读取被依赖的对象当前的一代数据，没有这个对象或还没有数据时返回ObjectNotAvailable"""
+        dependency = self.objects.get(key)
+        if dependency is None or dependency.数据获取ID is None:
+            return ObjectNotAvailable
+        return dependency.load(plasma_client, dependency.数据获取ID)
 
     def run(self):
         while not self.stop_event.is_set():
-            for dataman in self.objects.copy().values():
-                self.deal_object(dataman)
-                if self.stop_event.is_set():
-                    break
-            logging.info(f"本次更新完成，{self.update_interval}秒后将重新执行数据更新...")
-            self.check_object_list()
-            self.stop_event.wait(self.update_interval)
+            self.capacity.refresh_access()
+            for object_id in self.capacity.demanded():
+                if object_id in self.objects:
+                    logging.info(f"{self.objects[object_id].数据名称}: 客户端需要已被淘汰的数据，重新加载。")
+                    self.scheduler.schedule_now(object_id)
+                self.capacity.readmit(object_id)
+            due = self.scheduler.pop_due(datetime.now(), self.objects.keys())
+            objects = {key: self.objects[key] for key in due if key in self.objects and key not in self.capacity.evicted}
+            if objects:
+                succeeded: Dict[str, bool] = {}
+                durations = self.executor.run_cycle(
+                    objects, lambda item: succeeded.__setitem__(item.数据标识符, self.deal_object(item)), stale_small_first(self.capacity.sizes)
+                )
+                ran_at = datetime.now()
+                for key, item in objects.items():
+                    self.scheduler.reschedule(item, ran_at, succeeded.get(key, False))
+                if durations:
+                    slowest = max(durations, key=durations.get)
+                    logging.info(
+                        f"本轮共刷新{len(durations)}个对象，最慢的是{self.objects[slowest].数据名称 if slowest in self.objects else slowest}，用时{durations[slowest]:.1f}秒。"
+                    )
+            self.collect_garbage()
+            if self.metrics_file:
+                self.write_metrics()
+            wait_seconds = self._seconds_to_next_due()
+            if objects:
+                logging.info(f"本次更新完成，{wait_seconds:.0f}秒后将重新检查需要更新的数据...")
+                self.check_object_list()
+                self.relieve_pressure()
+            if self.snapshots is not None and (self._last_snapshot is None or time.monotonic() - self._last_snapshot >= self.snapshot_interval):
+                self.snapshot_objects()
+                self._last_snapshot = time.monotonic()
+            self.stop_event.wait(wait_seconds)
+
+    def _seconds_to_next_due(self) -> float:
+        """距离下一个对象到期的秒数，最长不超过update_interval（需要定期检查被淘汰的对象是否又被访问），最短1秒"""
+        next_due = self.scheduler.next_due_time()
+        if next_due is None:
+            return self.update_interval
+        return min(self.update_interval, max(1.0, (next_due - datetime.now()).total_seconds()))
 
     def contains(self, object_id: str, plasma_store_contains=False):
         """service中是否存在一个对象，缺省不判断plasma store中已经有这个对象，如果打开开关则同时判断plasma store中也有此对象"""
@@ -185,58 +455,220 @@ class DataService(Singleton, threading.Thread):
             return object_id in self.objects
 
     def _plasma_store_contains(self, object_id: str):
-        plasma_client = plasma.connect(self.plasma_store_name)
-        result = plasma_client.contains(equipment_id_to_object_id(object_id))
-        plasma_client.disconnect()
-        return result
+        with self.pool.connection() as plasma_client:
+            return plasma_client.contains(self.objects[object_id].数据获取ID)
 
     def check_object_list(self) -> List[bool]:
-        plasma_client = plasma.connect(self.plasma_store_name)
-        object_dict = plasma_client.list()
-        result = []
-        for item in self.objects:
-            is_ok = plasma_client.contains(self.objects[item].数据获取ID)
-            result.append(is_ok)
-            if is_ok:
-                data_size = round(object_dict[self.objects[item].数据获取ID]["data_size"] / 1024 / 1024, 2)
-            else:
-                data_size = 0
-            logging.info(
-                f"服务器自查信息：数据名称:{self.objects[item].数据名称}, 数据区间:{self.objects[item].数据区间}, 数据标识符:{self.objects[item].数据标识符}, 数据是否存在：{is_ok}, 数据大小: {data_size}M"
-            )
-        plasma_client.disconnect()
+        with self.pool.connection() as plasma_client:
+            object_dict = plasma_client.list()
+            result = []
+            for item in self.objects:
+                is_ok = self.objects[item].数据获取ID is not None and plasma_client.contains(self.objects[item].数据获取ID)
+                result.append(is_ok)
+                if is_ok:
+                    object_ids = self.objects[item].object_ids(self.objects[item].数据获取ID)
+                    self.capacity.update_size(item, sum(object_dict[object_id]["data_size"] for object_id in object_ids if object_id in object_dict))
+                    OBJECT_BYTES.set(self.capacity.sizes[item], object=item)
+                    data_size = round(self.capacity.sizes[item] / 1024 / 1024, 2)
+                else:
+                    data_size = 0
+                logging.info(
+                    f"服务器自查信息：数据名称:{self.objects[item].数据名称}, 数据区间:{self.objects[item].数据区间}, "
+                    f"数据标识符:{self.objects[item].数据标识符}, 数据是否存在：{is_ok}, 数据大小: {data_size}M"
+                )
         return result
 
-    def stop(self):
+    def stop(self, timeout: float = None):
+        """停止服务：等刷新线程完成正在进行的刷新后再保存快照、关闭连接和plasma store
+
+        :param timeout: 等待刷新线程结束的最长秒数，缺省一直等待
+        """
         logging.info("收到停止数据服务指令，开始停止服务..., 可能需要几分钟时间，请耐心等待!")
         self.stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        if self.snapshots is not None and self.proc.poll() is None:
+            self.snapshot_objects()
+        for item in self.objects.values():
+            try:
+                item.close()
+            except Exception:
+                logging.exception(f"{item.数据名称}: 释放资源出错。")
+        self.pool.close()
         if self.proc.poll() is None:
             self.proc.kill()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
         logging.info("数据服务已停止！")
 
-    def _delete_plasma_object(self, plasma_client, object_id):
-        """安全的删除plasma store中的对象。用内部函数_delete会莫名其妙的挂掉，故开发了此函数
-        有时，产出plasam store中的对象会不起作用（也没错报错，但是对象依然还存在），因为这个对象可能仍然被引用，特别是被当前plasma_client引用，
-        所以本函数会先断开连接，切断引用关系，然后再尝试多次删除，成功后再重建连接，并返回。
-        Parameters
-        ----------
-        plasma_client: 必须传入当前的plama_client，因为有些时候某个object会被plasma_client给引用(refs)
-        object_id: 欲删除的object_id
-
-        Returns
-        -------
-        plasma_client
+    def restore_snapshots(self) -> int:
+        """启动时从磁盘快照恢复数据，恢复的对象之后只需获取快照数据区间之后缺少的数据
+
+        :return: 恢复的对象数量
+        """
+        with self.pool.connection() as plasma_client:
+            count = 0
+            for key, dataman in self.objects.items():
+                try:
+                    restored = self.snapshots.restore(plasma_client, key)
+                except PlasmaStoreFull:
+                    logging.error(f"{dataman.数据名称}: 内存已满，无法从快照恢复，将重新获取全部数据。")
+                    continue
+                except Exception:
+                    logging.exception(f"{dataman.数据名称}: 从快照恢复出错，将重新获取全部数据。")
+                    continue
+                if restored is ObjectNotAvailable:
+                    continue
+                generation, (start, end) = restored
+                if start > dataman.数据区间[0]:
+                    logging.warning(f"{dataman.数据名称}: 快照的数据开始于{start}，晚于设置的{dataman.数据区间[0]}，不使用快照。")
+                    continue
+                dataman.数据获取ID = generation_object_id(key, generation)
+                dataman.数据区间 = end
+                watermark = self.snapshots.watermark(key)
+                dataman.watermark = None if watermark is None else Watermark(*watermark)
+                self.pointers.publish(key, generation)
+                self._snapshot_generations[key] = generation
+                count += 1
+                logging.info(f"{dataman.数据名称}: 已从快照恢复，数据区间为：{dataman.数据区间}")
+        return count
+
+    def snapshot_objects(self) -> int:
+        """把上次快照之后有更新的已发布对象保存到磁盘
+
+        :return: 本次保存快照的对象数量
+        """
+        with self.pool.connection() as plasma_client:
+            count = 0
+            for key, dataman in list(self.objects.items()):
+                generation = self.pointers.resolve(key)
+                if generation is None or self._snapshot_generations.get(key) == generation:
+                    continue
+                object_id = generation_object_id(key, generation)
+                if dataman.数据获取ID != object_id:
+                    continue  # 正在更新，下次再保存
+                try:
+                    if self.snapshots.save(plasma_client, key, generation, dataman.object_ids(object_id), dataman.数据区间, dataman.watermark):
+                        self._snapshot_generations[key] = generation
+                        count += 1
+                except Exception:
+                    logging.exception(f"{dataman.数据名称}: 保存快照出错，下次再试。")
+        if count:
+            logging.info(f"已保存{count}个对象的快照。")
+        return count
+
+    def evict(self, object_id: str, plasma_client=None):
+        """淘汰一个对象：取消发布并删除其数据，客户端再次访问时重新加载
+
+        :param plasma_client: 调用者已借用的连接，缺省从连接池借用
         """
-        if plasma_client:
-            plasma_client.disconnect()  # 断开重连以释放对object的ref
-        plasma_client = plasma.connect(self.plasma_store_name)
-        plasma_client.delete([object_id])
-        retry_times = 120
-        # 貌似plasam的delete是个后台线程处理的，删除后并不是立即生效，而是待下次删除线程工作时才会真正之星，下面代码就是等待执行线程生效后再返回，避免删除后发现对象仍然存在。
-        while plasma_client.contains(object_id):
-            self.stop_event.wait(1)
-            if retry_times < 0:
-                break
+        dataman = self.objects[object_id]
+        logging.warning(f"{dataman.数据名称}: 内存紧张，淘汰该数据，大小：{round(self.capacity.sizes.get(object_id, 0) / 1024 / 1024, 2)}M")
+        self.pointers.unpublish(object_id)
+        if dataman.数据获取ID is not None:
+            if plasma_client is not None:
+                with REFRESH_STAGE_SECONDS.time(object=object_id, stage="delete"):
+                    plasma_client.delete(dataman.object_ids(dataman.数据获取ID))
             else:
-                retry_times -= 1
-        return plasma_client
+                with self.pool.connection() as plasma_client:
+                    with REFRESH_STAGE_SECONDS.time(object=object_id, stage="delete"):
+                        plasma_client.delete(dataman.object_ids(dataman.数据获取ID))
+        dataman.数据获取ID = None
+        dataman.数据区间 = dataman.数据区间[0]  # 重新加载时从头获取
+        dataman.watermark = None
+        self.capacity.mark_evicted(object_id)
+        OBJECT_BYTES.set(0, object=object_id)
+
+    def relieve_pressure(self) -> List[str]:
+        """内存使用率超过high_watermark时淘汰最冷的对象
+
+        :return: 被淘汰的数据标识符
+        """
+        with self.pool.connection() as plasma_client:
+            used, capacity = self._store_usage(plasma_client)
+            retired = self._retired_size(plasma_client)
+        STORE_USED_BYTES.set(used)
+        STORE_CAPACITY_BYTES.set(capacity)
+        STORE_UTILIZATION.set(used / capacity if capacity else 0)
+        # 退役的旧一代数据gc_delay秒后就会回收，不计入使用量，否则刚刷新过的对象会因为新旧两代同时存在而被淘汰
+        victims = self.capacity.pressure_victims(used - retired, capacity, self._eviction_candidates())
+        for object_id in victims:
+            self.evict(object_id)
+        return victims
+
+    def _eviction_candidates(self, exclude: Set[str] = frozenset()) -> List[str]:
+        return [
+            key
+            for key, item in self.objects.items()
+            if item.evictable and item.数据获取ID is not None and key not in self.capacity.evicted and key not in self._refreshing and key not in exclude
+        ]
+
+    def _admit(self, plasma_client, dataman: DataMan, size: int or None) -> bool:
+        """写入前的容量检查，放不下时淘汰比本对象更冷的对象，仍然放不下则拒绝写入"""
+        if not size:
+            return True
+        used, capacity = self._store_usage(plasma_client)
+        used -= self._retired_size(plasma_client)  # 与relieve_pressure相同，退役的旧一代很快就会回收，不为它淘汰在用的数据
+        shortage = self.capacity.admit(size, used, capacity)
+        if shortage <= 0:
+            return True
+        candidates = self._eviction_candidates(exclude=set(dataman.depends_on))
+        victims = self.capacity.select_victims(shortage, candidates, colder_than=dataman.数据标识符)
+        if victims is None:
+            return False
+        for object_id in victims:
+            self.evict(object_id, plasma_client)
+        self.capacity.reserve(size)
+        return True
+
+    @staticmethod
+    def _store_usage(plasma_client) -> Tuple[int, int]:
+        """plasma store已使用的字节数和总容量"""
+        used = sum(item["data_size"] + item["metadata_size"] for item in plasma_client.list().values())
+        return used, plasma_client.store_capacity()
+
+    @staticmethod
+    def _objects_size(plasma_client, object_ids: List[plasma.ObjectID]) -> int:
+        """若干对象占用的字节数"""
+        object_dict = plasma_client.list()
+        return sum(object_dict[object_id]["data_size"] + object_dict[object_id]["metadata_size"] for object_id in object_ids if object_id in object_dict)
+
+    def _retired_size(self, plasma_client) -> int:
+        """已退役、等待回收的对象占用的字节数"""
+        with self._retired_lock:
+            object_ids = [object_id for _, _, object_id in self._retired]
+        return self._objects_size(plasma_client, object_ids)
+
+    def _retire(self, equipment_id: str, object_ids: List[plasma.ObjectID]):
+        """登记已被新一代替换的数据，gc_delay秒后由collect_garbage回收"""
+        retired_at = time.monotonic()
+        with self._retired_lock:
+            self._retired.extend((retired_at, equipment_id, object_id) for object_id in object_ids)
+
+    def collect_garbage(self) -> int:
+        """回收退役超过gc_delay秒的旧数据
+
+        plasma的delete对仍被引用的对象会延迟到所有引用释放后才真正删除，所以这里只发出删除请求，不需要等待删除生效。
+        :return: 本次发出删除请求的对象数量
+        """
+        deadline = time.monotonic() - self.gc_delay
+        with self._retired_lock:
+            expired = [item for item in self._retired if item[0] <= deadline]
+            self._retired = [item for item in self._retired if item[0] > deadline]
+        if expired:
+            by_equipment: Dict[str, List[plasma.ObjectID]] = {}
+            for _, equipment_id, object_id in expired:
+                by_equipment.setdefault(equipment_id, []).append(object_id)
+            with self.pool.connection() as plasma_client:
+                for equipment_id, object_ids in by_equipment.items():
+                    with REFRESH_STAGE_SECONDS.time(object=equipment_id, stage="delete"):
+                        plasma_client.delete(object_ids)
+                logging.info(f"已回收{len(expired)}个旧版本数据。")
+        return len(expired)
+
+    def write_metrics(self):
+        """把运行指标写到metrics_file"""
+        try:
+            REGISTRY.write_textfile(self.metrics_file)
+        except OSError:
+            logging.warning(f"写入运行指标失败：{self.metrics_file}", exc_info=True)
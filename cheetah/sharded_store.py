@@ -0,0 +1,332 @@
+"""按列分片保存数据框
+
+一个以(tdate, symbol)为索引的数据框在plasma store中保存为：
+1. 清单对象：object_id本身，记录有哪些列；
+2. 索引分片：所有列共用的(tdate, symbol)，按tdate、symbol排序，symbol字典编码；
+3. 列分片：每一列一个对象。
+分片的object_id由清单的object_id和分片名称计算得到（见plasma_store.shard_object_id），读者读取时只需要读索引和用到的列。
+
+分层保存：读取几乎都集中在最近的数据上。写入时指定hot_from（最近一段数据的第一个交易日）后，每一列分为两个分片：
+hot_from之后的热数据是原始的Arrow buffer，读者直接引用共享内存；之前的冷数据以LZ4/ZSTD压缩，
+读者用到时才解压，解压结果放在有字节上限的缓存（COLD_CACHE）中。清单的schema metadata记录热数据从第几行开始。
+
+增量更新：ShardedUpdate逐列生成新一代，不把已有数据读取为数据框。新数据都在已有数据之后（每日刷新）时，
+索引和每一列的热数据分片后接上新行，冷数据分片按原始字节复制，不解压；热数据超过热窗口的两倍或补齐中间缺少的交易日时，
+才逐列读取已有数据（包括解压冷数据）重新分层。
+"""
+from datetime import datetime
+from typing import List, Iterable, Dict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import plasma
+from pyarrow.plasma import ObjectNotAvailable
+
+from .arrow_store import put_table, get_table, copy_object
+from .object_cache import ObjectCache
+from .plasma_store import shard_object_id
+
+INDEX_SHARD = "__index__"
+INDEX_NAMES = ["tdate", "symbol"]
+COLD_SUFFIX = "@cold"  # 冷数据分片名称的后缀
+HOT_FROM_KEY = b"hot_from"  # 清单schema metadata中热数据开始的行号
+COLD_COMPRESSION = "zstd"
+COLD_CACHE_BYTES = 256 * 1024 * 1024
+
+COLD_CACHE = ObjectCache(COLD_CACHE_BYTES)  # 本进程中所有ShardedFrame共用的冷数据解压缓存
+
+
+def write_sharded(
+    plasma_client, df: pd.DataFrame, object_id: plasma.ObjectID, hot_from: datetime = None, compression: str = COLD_COMPRESSION
+) -> List[plasma.ObjectID]:
+    """把以(tdate, symbol)为索引的数据框按列分片写入plasma store
+
+    :param plasma_client: plasma客户端
+    :param df: 欲保存的数据框
+    :param object_id: 清单的object_id
+    :param hot_from: 从这个交易日开始的数据不压缩，之前的数据以compression压缩，缺省全部不压缩
+    :param compression: 冷数据的压缩算法，lz4或zstd
+    :return: 写入的所有object_id，清单在最后，保证清单可见时所有分片都已写入
+    """
+    df = df.sort_index()
+    index = _index_table(df.index.get_level_values(0).values, df.index.get_level_values(1).values)
+    object_ids = [put_table(plasma_client, index, shard_object_id(object_id, INDEX_SHARD))]
+    hot_row = 0 if hot_from is None else int(np.searchsorted(df.index.get_level_values(0).values, np.datetime64(hot_from, "ns"), side="left"))
+    for col in df.columns:
+        object_ids.extend(_write_column(plasma_client, col, pa.array(df[col].values), object_id, hot_row, compression))
+    object_ids.append(_write_manifest(plasma_client, df.columns, object_id, hot_row))
+    return object_ids
+
+
+def _index_table(tdates: np.ndarray, symbols: pa.Array or np.ndarray) -> pa.Table:
+    symbols = symbols if isinstance(symbols, pa.Array) else pa.array(pd.Categorical(symbols))  # 每个交易日都重复一遍证券代码，字典编码后只保存一次
+    return pa.table({INDEX_NAMES[0]: pa.array(np.asarray(tdates).astype("datetime64[ns]")), INDEX_NAMES[1]: symbols})
+
+
+def _write_manifest(plasma_client, columns: List[str], object_id: plasma.ObjectID, hot_row: int) -> plasma.ObjectID:
+    manifest = pa.table({"column": pa.array([str(col) for col in columns], pa.string())})
+    return put_table(plasma_client, manifest.replace_schema_metadata({HOT_FROM_KEY: str(hot_row).encode()}), object_id)
+
+
+def _write_column(plasma_client, col: str, array: pa.Array, object_id: plasma.ObjectID, hot_row: int, compression: str) -> List[plasma.ObjectID]:
+    """写入一列，前hot_row行压缩为冷数据分片"""
+    object_ids = []
+    if hot_row > 0:
+        cold = pa.table({col: array.slice(0, hot_row)})
+        object_ids.append(put_table(plasma_client, cold, shard_object_id(object_id, f"{col}{COLD_SUFFIX}"), compression=compression))
+    object_ids.append(put_table(plasma_client, pa.table({col: array.slice(hot_row)}), shard_object_id(object_id, col)))
+    return object_ids
+
+
+def concat_arrays(arrays: List[pa.Array]) -> pa.Array:
+    """拼接同一列的若干段：字典编码的列合并字典，类型不同时按numpy的规则提升（如有缺失值的整数列转为浮点）"""
+    arrays = [array for array in arrays if len(array)] or arrays[:1]
+    if len(arrays) == 1:
+        return arrays[0]
+    if any(pa.types.is_dictionary(array.type) for array in arrays):
+        value_type = next(array.type.value_type for array in arrays if pa.types.is_dictionary(array.type))
+        dictionary_type = pa.dictionary(pa.int32(), value_type)
+        try:
+            chunks = [(array if pa.types.is_dictionary(array.type) else array.cast(value_type).dictionary_encode()).cast(dictionary_type) for array in arrays]
+            return pa.chunked_array(chunks).unify_dictionaries().combine_chunks()
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass
+    elif all(array.type == arrays[0].type for array in arrays):
+        return pa.concat_arrays(arrays)
+    return pa.array(np.concatenate([to_numpy(array) for array in arrays]))
+
+
+def as_array(column: pa.ChunkedArray) -> pa.Array:
+    """分片是一次写入的，通常只有一个chunk，直接取出不复制"""
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def to_numpy(array: pa.Array) -> np.ndarray:
+    """转换为numpy数组，字典编码的列（见storage_types）解码为原来的值"""
+    return array.to_numpy(zero_copy_only=False)
+
+
+def sharded_object_ids(object_id: plasma.ObjectID, columns: Iterable[str]) -> List[plasma.ObjectID]:
+    """一代按列分片的数据可能占用的所有object_id（包括可能不存在的冷数据分片）"""
+    shards = [shard_object_id(object_id, name) for col in columns for name in (col, f"{col}{COLD_SUFFIX}")]
+    return [shard_object_id(object_id, INDEX_SHARD)] + shards + [object_id]
+
+
+class ShardedFrame(object):
+    """按列分片保存的数据框的读取句柄，初始化时只读取清单和索引，列在用到时才读取，读取的数据直接引用共享内存"""
+
+    def __init__(self, plasma_client, object_id: plasma.ObjectID, cold_cache: ObjectCache = None):
+        """
+        :param cold_cache: 冷数据的解压缓存，缺省为COLD_CACHE
+        """
+        manifest = get_table(plasma_client, object_id)
+        if manifest is ObjectNotAvailable:
+            raise KeyError(f"plasma store中没有{object_id}")
+        self.plasma_client = plasma_client
+        self.object_id = object_id
+        self.cold_cache = COLD_CACHE if cold_cache is None else cold_cache
+        self.columns: List[str] = manifest.column("column").to_pylist()
+        self.hot_from = int((manifest.schema.metadata or {}).get(HOT_FROM_KEY, 0))  # 第一行热数据，之前的行在冷数据分片中
+        self.index_table = get_table(plasma_client, shard_object_id(object_id, INDEX_SHARD))
+        self._tdates = as_array(self.index_table.column(INDEX_NAMES[0])).to_numpy(zero_copy_only=False)
+
+    @classmethod
+    def open(cls, plasma_client, object_id: plasma.ObjectID):
+        """打开一代数据，不存在时返回ObjectNotAvailable"""
+        try:
+            return cls(plasma_client, object_id)
+        except KeyError:
+            return ObjectNotAvailable
+
+    def __len__(self):
+        return self.index_table.num_rows
+
+    @property
+    def tdates(self) -> np.ndarray:
+        """所有行的交易日（已排序）"""
+        return self._tdates
+
+    @property
+    def symbols(self) -> np.ndarray:
+        """所有行的证券代码"""
+        return to_numpy(as_array(self.index_table.column(INDEX_NAMES[1])))
+
+    def rows(self, start: datetime = None, end: datetime = None) -> slice:
+        """日期区间[start, end]对应的行，索引按日期排序，用二分查找"""
+        lo = 0 if start is None else int(np.searchsorted(self._tdates, np.datetime64(start, "ns"), side="left"))
+        hi = len(self) if end is None else int(np.searchsorted(self._tdates, np.datetime64(end, "ns"), side="right"))
+        return slice(lo, max(lo, hi))
+
+    def column(self, col: str, rows: slice = slice(None)) -> pa.Array:
+        """读取一列，只读取这一列的分片；只用到热数据时不解压冷数据"""
+        if col not in self.columns:
+            raise KeyError(f"没有这个column: {col}")
+        start, stop, _ = rows.indices(len(self))
+        stop = max(start, stop)
+        pieces = []
+        if start < self.hot_from:
+            pieces.append(self._cold(col).slice(start, min(stop, self.hot_from) - start))
+        if stop > self.hot_from or not pieces:
+            hot = as_array(get_table(self.plasma_client, shard_object_id(self.object_id, col)).column(0))
+            hot_start = max(start, self.hot_from) - self.hot_from
+            pieces.append(hot.slice(hot_start, max(0, stop - self.hot_from - hot_start)))
+        return concat_arrays(pieces)
+
+    def _cold(self, col: str) -> pa.Array:
+        """解压后的冷数据，同一个分片只解压一次，直到被缓存淘汰"""
+        object_id = shard_object_id(self.object_id, f"{col}{COLD_SUFFIX}")
+        key = object_id.binary().hex()
+        array = self.cold_cache.get(key, object_id)
+        if array is ObjectNotAvailable:
+            table = get_table(self.plasma_client, object_id)
+            if table is ObjectNotAvailable:
+                raise KeyError(f"plasma store中没有{col}的冷数据分片")
+            array = as_array(table.column(0))
+            self.cold_cache.put(key, object_id, array, array.nbytes)
+        return array
+
+    def nbytes(self) -> int:
+        """这一代数据在plasma store中占用的字节数"""
+        object_dict = self.plasma_client.list()
+        object_ids = sharded_object_ids(self.object_id, self.columns)
+        return sum(object_dict[object_id]["data_size"] + object_dict[object_id]["metadata_size"] for object_id in object_ids if object_id in object_dict)
+
+    def index(self, rows: slice = slice(None)) -> pd.MultiIndex:
+        start, stop, _ = rows.indices(len(self))
+        index = self.index_table.slice(start, stop - start)
+        return pd.MultiIndex.from_arrays([to_numpy(as_array(index.column(name))) for name in INDEX_NAMES], names=INDEX_NAMES)
+
+    def get(self, cols: List[str] = None, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        """读取日期区间内的若干列
+
+        :param cols: 需要的列，缺省为全部列
+        :param start: 开始日期，缺省为最早
+        :param end: 结束日期（含），缺省为最晚
+        """
+        cols = self.columns if cols is None else cols
+        rows = self.rows(start, end)
+        data = {col: to_numpy(self.column(col, rows)) for col in cols}
+        return pd.DataFrame(data, index=self.index(rows), columns=cols)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """读取全部数据"""
+        return self.get()
+
+
+class ShardedUpdate(object):
+    """一代按列分片的数据和新获取的数据，write时逐列生成新一代，同一行以新数据为准"""
+
+    def __init__(self, base: ShardedFrame, insert: pd.DataFrame):
+        """
+        :param base: 已有的一代数据
+        :param insert: 以(tdate, symbol)为索引的新数据
+        """
+        insert = insert[~insert.index.duplicated(keep="last")].sort_index()
+        self.base = base
+        self.insert = insert
+
+    def __len__(self):
+        """已有数据和新数据的行数之和，与已有数据重复的行算两次"""
+        return len(self.base) + len(self.insert)
+
+    @property
+    def appends(self) -> bool:
+        """新数据都在已有数据的最后一个交易日之后"""
+        return len(self.base) == 0 or len(self.insert) == 0 or self.insert.index.get_level_values(0).values[0] > self.base.tdates[-1]
+
+    @property
+    def columns(self) -> List[str]:
+        return self.base.columns + [col for col in self.insert.columns if col not in self.base.columns]
+
+    @property
+    def tdates(self) -> np.ndarray:
+        """合并后所有交易日（已排序、去重）"""
+        base = self.base.tdates
+        base = base[np.concatenate([[True], base[1:] != base[:-1]])] if len(base) else base  # 已排序，不需要再排序去重
+        insert = np.unique(self.insert.index.get_level_values(0).values.astype("datetime64[ns]"))
+        return np.concatenate([base, insert]) if self.appends else np.union1d(base, insert)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """读取合并后的全部数据"""
+        merged = pd.concat([self.base.to_dataframe(), self.insert])
+        return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+    def write(self, plasma_client, object_id: plasma.ObjectID, hot_from: datetime = None, compression: str = COLD_COMPRESSION) -> List[plasma.ObjectID]:
+        """逐列写入新一代，参数和返回值见write_sharded"""
+        base, insert = self.base, self.insert
+        insert_tdates = insert.index.get_level_values(0).values.astype("datetime64[ns]")
+        if self.appends:
+            tdates = np.concatenate([base.tdates, insert_tdates])
+            hot_row = 0 if hot_from is None else int(np.searchsorted(tdates, np.datetime64(hot_from, "ns"), side="left"))
+            # 冷热分界保持不变，除非热数据已超过热窗口的两倍
+            if base.hot_from <= hot_row and len(tdates) - base.hot_from <= 2 * (len(tdates) - hot_row):
+                return self._append(plasma_client, object_id, tdates, compression)
+            return self._rebuild(
+                plasma_client, object_id, np.arange(len(base)), np.arange(len(base), len(tdates)), tdates, self._symbols(), hot_row, compression
+            )
+        keys, tdates, symbols = self._union_keys(insert_tdates)
+        union, first = np.unique(keys, return_index=True)
+        positions = np.searchsorted(union, keys)
+        hot_row = 0 if hot_from is None else int(np.searchsorted(tdates[first], np.datetime64(hot_from, "ns"), side="left"))
+        return self._rebuild(plasma_client, object_id, positions[: len(base)], positions[len(base) :], tdates[first], symbols[first], hot_row, compression)
+
+    def _symbols(self) -> np.ndarray:
+        return np.concatenate([self.base.symbols, self.insert.index.get_level_values(1).values.astype(object)])
+
+    def _union_keys(self, insert_tdates: np.ndarray):
+        """已有数据和新数据的每一行编码为整数键，按键排序即按(tdate, symbol)排序"""
+        tdates = np.concatenate([self.base.tdates.astype("datetime64[ns]"), insert_tdates])
+        symbols = self._symbols()
+        date_codes = np.unique(tdates, return_inverse=True)[1]
+        symbol_codes, uniques = pd.factorize(symbols, sort=True)
+        return date_codes.astype(np.int64) * max(1, len(uniques)) + symbol_codes, tdates, symbols
+
+    def _append(self, plasma_client, object_id: plasma.ObjectID, tdates: np.ndarray, compression: str) -> List[plasma.ObjectID]:
+        """新数据接在已有数据之后：冷数据分片复制，热数据分片和索引后接新行"""
+        base, insert = self.base, self.insert
+        index = base.index_table
+        symbols = concat_arrays([as_array(index.column(INDEX_NAMES[1])), pa.array(pd.Categorical(insert.index.get_level_values(1)))])
+        object_ids = [put_table(plasma_client, _index_table(tdates, symbols), shard_object_id(object_id, INDEX_SHARD))]
+        for col in self.columns:
+            new = pa.array(insert[col].values) if col in insert.columns else None
+            if col in base.columns:
+                if base.hot_from > 0:
+                    cold_name = f"{col}{COLD_SUFFIX}"
+                    object_ids.append(copy_object(plasma_client, shard_object_id(base.object_id, cold_name), shard_object_id(object_id, cold_name)))
+                old = base.column(col, slice(base.hot_from, None))
+                hot = concat_arrays([old, new if new is not None else pa.nulls(len(insert), old.type)])
+                object_ids.append(put_table(plasma_client, pa.table({col: hot}), shard_object_id(object_id, col)))
+            else:  # 新增的列，已有的行为缺失值
+                array = concat_arrays([pa.nulls(len(base), new.type), new])
+                object_ids.extend(_write_column(plasma_client, col, array, object_id, base.hot_from, compression))
+        object_ids.append(_write_manifest(plasma_client, self.columns, object_id, base.hot_from))
+        return object_ids
+
+    def _rebuild(self, plasma_client, object_id, base_rows, insert_rows, tdates, symbols, hot_row, compression) -> List[plasma.ObjectID]:
+        """逐列读取已有数据，按行号放入合并后的位置后重新分层写入
+
+        :param base_rows: 已有数据每一行在合并后的行号
+        :param insert_rows: 新数据每一行在合并后的行号
+        """
+        object_ids = [put_table(plasma_client, _index_table(tdates, symbols), shard_object_id(object_id, INDEX_SHARD))]
+        for col in self.columns:
+            pieces: Dict[str, tuple] = {}
+            if col in self.base.columns:
+                pieces["base"] = (base_rows, self.base.column(col))
+            if col in self.insert.columns:
+                pieces["insert"] = (insert_rows, pa.array(self.insert[col].values))
+            object_ids.extend(_write_column(plasma_client, col, _scatter(len(tdates), list(pieces.values())), object_id, hot_row, compression))
+        object_ids.append(_write_manifest(plasma_client, self.columns, object_id, hot_row))
+        return object_ids
+
+
+def _scatter(length: int, pieces: List[tuple]) -> pa.Array:
+    """把若干段数据按行号放入长度为length的一列，后面的段覆盖前面的段，没有数据的行为缺失值"""
+    rows = np.concatenate([piece_rows for piece_rows, _ in pieces])
+    array = concat_arrays([values for _, values in pieces])
+    if len(rows) == length and np.array_equal(rows, np.arange(length)):
+        return array
+    order = np.full(length, -1, dtype=np.int64)
+    order[rows] = np.arange(len(rows))  # 同一行出现多次时，后面的段（新数据）覆盖前面的段
+    return array.take(pa.array(order, mask=order < 0))
@@ -0,0 +1,120 @@
+"""共享内存数据的磁盘快照
+
+每个已发布对象的一代数据保存为一个目录：{snapshot_dir}/{数据标识符}/{代数}/，
+其中每个plasma对象保存为一个原始字节文件（可直接内存映射），manifest.json记录代数、数据区间和各对象的object_id及metadata，
+manifest.json最后写入，有manifest.json的目录才是完整的快照。
+服务重新启动后按原来的object_id把快照写回plasma store并发布原来的代数，再只获取数据区间之后缺少的数据。
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import List, Tuple
+from urllib.parse import quote
+
+import pyarrow as pa
+from pyarrow import plasma
+from pyarrow.plasma import ObjectNotAvailable
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+class SnapshotStore(object):
+    def __init__(self, snapshot_dir: str):
+        """
+        :param snapshot_dir: 保存快照的本地目录
+        """
+        self.snapshot_dir = snapshot_dir
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    def _object_dir(self, equipment_id: str) -> str:
+        return os.path.join(self.snapshot_dir, quote(equipment_id, safe=""))
+
+    def save(
+        self,
+        plasma_client,
+        equipment_id: str,
+        generation: int,
+        object_ids: List[plasma.ObjectID],
+        data_range: Tuple[datetime, datetime],
+        watermark: Tuple[datetime, datetime or None] = None,
+    ) -> bool:
+        """保存一代数据的快照，保存成功后删除这个对象更早的快照
+
+        :param plasma_client: plasma客户端
+        :param equipment_id: 数据标识符
+        :param generation: 代数
+        :param object_ids: 这一代数据占用的所有object_id，见DataMan.object_ids
+        :param data_range: 数据区间，即重新启动后的水位线
+        :param watermark: 已与数据源核对到的(日期, 数据源的更新时间)，见DataMan.watermark
+        :return: 是否保存成功，对象已被回收时返回False
+        """
+        generation_dir = os.path.join(self._object_dir(equipment_id), str(generation))
+        if os.path.isfile(os.path.join(generation_dir, MANIFEST_FILE_NAME)):
+            return True
+        os.makedirs(generation_dir, exist_ok=True)
+        objects = []
+        for n, object_id in enumerate(object_ids):
+            [(metadata, buffer)] = plasma_client.get_buffers([object_id], timeout_ms=0, with_meta=True)
+            if buffer is None:
+                shutil.rmtree(generation_dir, ignore_errors=True)
+                return False
+            file_name = f"{n}.bin"
+            with open(os.path.join(generation_dir, file_name), "wb") as file:
+                file.write(buffer)
+            objects.append({"object_id": object_id.binary().hex(), "metadata": metadata.hex(), "file": file_name})
+        manifest = {
+            "equipment_id": equipment_id,
+            "generation": generation,
+            "data_range": [data_range[0].isoformat(), data_range[1].isoformat()],
+            "watermark": None if watermark is None else [None if value is None else value.isoformat() for value in watermark],
+            "objects": objects,
+        }
+        with open(os.path.join(generation_dir, f"{MANIFEST_FILE_NAME}.tmp"), "w", encoding="utf8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(os.path.join(generation_dir, f"{MANIFEST_FILE_NAME}.tmp"), os.path.join(generation_dir, MANIFEST_FILE_NAME))
+        self._remove_older(equipment_id, generation)
+        return True
+
+    def latest(self, equipment_id: str) -> dict or None:
+        """最新的完整快照的manifest，没有快照返回None"""
+        object_dir = self._object_dir(equipment_id)
+        if not os.path.isdir(object_dir):
+            return None
+        for generation in sorted((int(name) for name in os.listdir(object_dir) if name.isdigit()), reverse=True):
+            manifest_file_name = os.path.join(object_dir, str(generation), MANIFEST_FILE_NAME)
+            if os.path.isfile(manifest_file_name):
+                with open(manifest_file_name, "r", encoding="utf8") as file:
+                    return json.load(file)
+        return None
+
+    def restore(self, plasma_client, equipment_id: str) -> Tuple[int, Tuple[datetime, datetime]] or ObjectNotAvailable:
+        """把最新的快照按原来的object_id写回plasma store
+
+        :return: (代数, 数据区间)，没有快照时返回ObjectNotAvailable
+        """
+        manifest = self.latest(equipment_id)
+        if manifest is None:
+            return ObjectNotAvailable
+        generation_dir = os.path.join(self._object_dir(equipment_id), str(manifest["generation"]))
+        for item in manifest["objects"]:
+            object_id = plasma.ObjectID(bytes.fromhex(item["object_id"]))
+            if plasma_client.contains(object_id):
+                continue
+            with pa.memory_map(os.path.join(generation_dir, item["file"])) as file:
+                plasma_client.put_raw_buffer(file.read_buffer(), object_id=object_id, metadata=bytes.fromhex(item["metadata"]))
+        start, end = (datetime.fromisoformat(value) for value in manifest["data_range"])
+        return manifest["generation"], (start, end)
+
+    def watermark(self, equipment_id: str) -> Tuple[datetime, datetime or None] or None:
+        """最新快照中保存的水位线，没有快照或没有保存水位线时返回None"""
+        manifest = self.latest(equipment_id)
+        if manifest is None or not manifest.get("watermark"):
+            return None
+        return tuple(None if value is None else datetime.fromisoformat(value) for value in manifest["watermark"])
+
+    def _remove_older(self, equipment_id: str, generation: int):
+        object_dir = self._object_dir(equipment_id)
+        for name in os.listdir(object_dir):
+            if name.isdigit() and int(name) < generation:
+                shutil.rmtree(os.path.join(object_dir, name), ignore_errors=True)
@@ -0,0 +1,89 @@
+"""按Column.dtype保存数据
+
+数据表读出的数据大多是float64和object，直接写入plasma store浪费空间。enforce_dtypes按元数据中声明的dtype转换：
+- 数值和布尔：转换为声明的紧凑类型（如float32、int32、bool），整数和布尔列有缺失值时保留为浮点；
+- 字符串（S、U、O等）：字典编码为pandas.Categorical，写入store时是Arrow的DictionaryArray，重复的证券代码、名称只保存一次。
+同时统计每一列转换前后占用的内存。
+"""
+import logging
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+DICTIONARY = "dictionary"
+
+# metadata.yaml中沿用的非numpy写法
+DTYPE_ALIASES = {
+    "f3": "float32",
+    "str": DICTIONARY,
+    "category": DICTIONARY,
+}
+
+ColumnSaving = namedtuple("ColumnSaving", ["column", "before", "after", "bytes_before", "bytes_after"])  # 一列的转换：dtype和占用的字节数
+
+
+def storage_dtype(declared: str) -> np.dtype or str or None:
+    """声明的dtype对应的保存类型：numpy dtype、DICTIONARY，无法识别时返回None"""
+    declared = DTYPE_ALIASES.get(str(declared).strip(), declared)
+    if declared == DICTIONARY:
+        return DICTIONARY
+    try:
+        dtype = np.dtype(declared)
+    except TypeError:
+        return None
+    if dtype.kind in "SUO":
+        return DICTIONARY
+    return dtype
+
+
+def cast_column(values: pd.Series, dtype: np.dtype or str) -> pd.Series:
+    """把一列转换为保存类型，无法无损转换（整数、布尔列有缺失值）时尽量转为浮点"""
+    if dtype == DICTIONARY:
+        return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+    if dtype.kind in "iub" and values.isna().any():
+        dtype = np.dtype("float32") if dtype.itemsize <= 2 else np.dtype("float64")  # float32只能精确表示24位以内的整数
+    if values.dtype == dtype:
+        return values
+    if values.dtype.kind == "O":
+        values = pd.to_numeric(values)
+    return values.astype(dtype)
+
+
+def enforce_dtypes(df: pd.DataFrame, dtypes: Dict[str, str]) -> Tuple[pd.DataFrame, List[ColumnSaving]]:
+    """按声明的dtype转换数据框的各列，没有声明或无法识别的列保持原样
+
+    :param dtypes: {列名: 声明的dtype}
+    :return: (转换后的数据框, 每一列的转换)
+    """
+    columns, savings = {}, []
+    for col in df.columns:
+        original = values = df[col]
+        dtype = storage_dtype(dtypes[col]) if col in dtypes else None
+        if dtype is not None:
+            try:
+                values = cast_column(original, dtype)
+            except (ValueError, TypeError):
+                logging.warning(f"{col}: 无法转换为{dtypes[col]}，保持{original.dtype}。", exc_info=True)
+        columns[col] = values
+        if values is not original:
+            savings.append(
+                ColumnSaving(
+                    col, str(original.dtype), str(values.dtype), original.memory_usage(index=False, deep=True), values.memory_usage(index=False, deep=True)
+                )
+            )
+    if not savings:
+        return df, savings
+    return pd.DataFrame(columns, index=df.index), savings
+
+
+def log_savings(name: str, savings: List[ColumnSaving]):
+    """记录转换节省的内存，每一列的明细为debug级别"""
+    if not savings:
+        return
+    for saving in savings:
+        logging.debug(f"{name}: {saving.column} {saving.before}->{saving.after}，{saving.bytes_before}->{saving.bytes_after}字节")
+    before = sum(saving.bytes_before for saving in savings)
+    after = sum(saving.bytes_after for saving in savings)
+    logging.info(f"{name}: 按元数据转换了{len(savings)}列，内存从{before / 1e6:.1f}M降到{after / 1e6:.1f}M，节省{(before - after) / 1e6:.1f}M")
@@ -7,37 +7,45 @@ from pydantic import BaseModel, Field
 from pydantic.types import ConstrainedStr, NoneStr, Callable, List, Optional
 from typing import Tuple, Union, Dict
 import numpy as np
+import pandas as pd
 
 from typing import Set, Tuple
 
+from pyarrow import plasma
 from pyarrow._plasma import ObjectNotAvailable
 from pyarrow.lib import SerializationContext
-from ruamel.yaml import YAML
 
+from . import metadata_catalog
+from .metadata_catalog import MetadataCatalog
 from .models import SuperModel
-from .service import DataMan, T
+from .factor_engine import FactorEngine
+from .panel import Panel
+from .query_plan import QueryPlan, plan_query, align
+from .lazy_query import LazyQuery
+from .storage_types import enforce_dtypes, log_savings, ColumnSaving
+from .service import DataMan, STORAGE_ARROW
+from .schedule import trade_calendar
+from .sharded_store import ShardedFrame, ShardedUpdate, write_sharded, sharded_object_ids, to_numpy, INDEX_NAMES
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
+
+
+def load_catalog(conf_file) -> MetadataCatalog:
+    """ 加载配置文件的元数据目录，只在配置文件变化时重新解析并用Factor校验（见metadata_catalog）
+    """
+    try:
+        catalog = metadata_catalog.load_catalog(conf_file, validate=lambda factor: Factor(**factor))
+    except ValueError:
+        logging.error(f"读取数据配置发生错误，请检查配置是否合法！配置文件: {conf_file}", exc_info=True)
+        quit(-1)
+    logging.info(f"处理配置完成，共{len(catalog)}个Factors")
+    return catalog
 
 
 def load_metadata(conf_file) -> SuperDataFrameModel:
     """ 加载配置文件中的所有字段
     """
-    yaml = YAML(typ="safe")
-    with open(conf_file, "r", encoding="utf8") as file:
-        conf = yaml.load(file)
-        try:
-            factor_dict = {}
-            for item in conf["Factors"]:
-                logging.debug(f"正在处理Factor：{item}")
-                conf["Factors"][item]["name"] = item
-                factor_dict[item] = Factor(**conf["Factors"][item])
-            sdf = SuperDataFrameModel(columns=factor_dict)
-            logging.info(f"处理配置完成，Factors: {[*conf['Factors'].keys()]}")
-        except Exception:
-            logging.error(f"读取数据配置发生错误，请检查配置是否合法！错误配置名称: {item}， 信息：{conf}", exc_info=True)
-            quit(-1)
-    return sdf
+    return SuperDataFrameModel.from_catalog(load_catalog(conf_file))
 
 
 class Column(SuperModel):
@@ -59,13 +67,19 @@ class Factor(Column):
     """因子。因子是通过数据计算出来的。
     """
 
-    calculate_method: Optional[Tuple[Callable, List]]
-    dependencies: Optional[List]
+    calculate_method: Optional[Tuple[Union[str, Callable], List]]  # 计算函数及其额外参数，设置后由服务计算，不再从数据表获取，见factor_engine
+    dependencies: Optional[List]  # 计算依赖的Factor
+    lookback: Optional[int]  # 计算一个交易日需要之前多少个交易日的数据
 
 
 class SuperDataFrameModel(SuperModel):
     columns: Dict[ConstrainedStr, Factor]
 
+    @classmethod
+    def from_catalog(cls, catalog: MetadataCatalog) -> SuperDataFrameModel:
+        """由已校验过的元数据目录建立，不再重复校验"""
+        return cls.construct(columns={name: Factor.construct(**factor) for name, factor in catalog.factors.items()})
+
     def get_column(self, col_name: str) -> Column:
         return self.columns[col_name]
 
@@ -90,8 +104,7 @@ class SuperDataFrameModel(SuperModel):
 
     def get_alias(self, col_name: ConstrainedStr) -> str or None:
         if self.has_column(col_name):
-            if "alias" in self.columns[col_name].fields:
-                return self.columns[col_name].alias
+            return self.columns[col_name].alias
         return None
 
     def update_column(self, col: Column):
@@ -118,17 +131,190 @@ class SuperDataFrameMan(DataMan):
     基础功能：数据及映射关系的灵活定义、数据增删查更新，数据检查和清洗，数据压缩，数据保存
     数据服务：数据灵活高速查询、拼装、转换
 
+    数据以(tdate, symbol)为索引，每个Factor按列分片保存在plasma store中（见sharded_store），读取时只读用到的列。
+    读者把读到的列放入稠密的(交易日 × 证券)面板（见panel），同一代数据的后续查询直接切片。
     """
 
-    def fetch_data(self, start: datetime, end: datetime) -> T:
-        pass
+    __SUPER_DATA_FRAME_OBJECT_ID__ = "super_data_frame"
+    storage_format = STORAGE_ARROW
+
+    def fetch_data(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """获取所有需要从数据表获取的Factor在[start, end]的数据，每张数据表读取一次，列名为Factor的统一名称"""
+        table_operator = self.table_operator
+        if table_operator is None:
+            from .data_config import CaihuiTableOperator as table_operator  # 只有服务端需要访问数据库，客户端读取数据不依赖数据库配置
+
+        pieces = []
+        for scan in self.fetch_plan(start, end).scans:
+            df = self.to_factor_frame(table_operator.query(scan.source, start.strftime("%Y%m%d"), end.strftime("%Y%m%d")), scan.columns)
+            pieces.append((df.index.get_level_values(0).values, df.index.get_level_values(1).values, {col: df[col].values for col in df.columns}))
+        return align(pieces)
+
+    def fetch_plan(self, start: datetime = None, end: datetime = None) -> QueryPlan:
+        """从数据表获取数据的查询计划，索引列随数据表一起获取，需要计算的Factor由factor_engine计算"""
+        names = [name for name in self.catalog.factors if name not in INDEX_NAMES and name not in self.factor_engine.specs]
+        return plan_query(self.catalog, names, start, end)
+
+    def columns_by_table(self) -> Dict[str, List[str]]:
+        """按数据表对需要从数据表获取的Factor分组：{数据表: [Factor统一名称]}"""
+        return {scan.source: scan.columns for scan in self.fetch_plan().scans}
+
+    def to_factor_frame(self, df: pd.DataFrame, col_names: List[str]) -> pd.DataFrame:
+        """把数据表的数据转换为以(tdate, symbol)为索引、Factor统一名称为列名的数据框
+
+        :param df: CaihuiTableOperator.query返回的数据框，索引为(date, 证券代码, ...)
+        :param col_names: 需要的Factor统一名称
+        """
+        df = df.copy(deep=False)
+        df.index = pd.MultiIndex.from_arrays([df.index.get_level_values(0), df.index.get_level_values(1)], names=INDEX_NAMES)
+        df = df[~df.index.duplicated(keep="last")]
+        table_cols = {}
+        for name in col_names:
+            table_col = self.catalog.get_table_colname(name)
+            if table_col in df.columns:
+                table_cols[table_col] = name
+            else:
+                logging.warning(f"{name}: 数据表{self.catalog.get_belong_to(name)}中没有列{table_col}，跳过。")
+        return df[list(table_cols)].rename(columns=table_cols)
 
     @staticmethod
-    def merge_data(old_data: T, insert_data: T) -> T:
-        pass
+    def merge_data(old_data: ShardedFrame or ShardedUpdate or pd.DataFrame, insert_data: pd.DataFrame) -> ShardedUpdate or pd.DataFrame:
+        """已有数据是plasma store中的一代数据时不读取，返回ShardedUpdate，写入时逐列生成新一代（见sharded_store）"""
+        if isinstance(old_data, ShardedUpdate):
+            return ShardedUpdate(old_data.base, SuperDataFrameMan.merge_data(old_data.insert, insert_data))
+        if isinstance(old_data, ShardedFrame):
+            return ShardedUpdate(old_data, insert_data)
+        merged = pd.concat([old_data, insert_data])
+        return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+    def check_data(self, data: ShardedFrame or ObjectNotAvailable) -> Set[Tuple[datetime, datetime]]:
+        """只读取索引分片，比较已有的交易日，没有新数据时不读取任何列"""
+        from ..fb.date_time import tdates_2_tdate_ranges
+
+        calendar = self.calendar or trade_calendar()
+        start_tdate = self.数据区间[0]
+        today = datetime.now()
+        if self.取当日数据 and calendar.is_tdate(today):
+            end_date = today
+        else:
+            end_date = calendar.last_tdate(today)
 
-    def check_data(self, data: T or ObjectNotAvailable) -> Set[Tuple[datetime, datetime]]:
-        pass
+        all_trade_days = set(calendar.query_all_tdates(start_tdate, end_date, include_stop=True))
+        if data is ObjectNotAvailable or not data:  # 没有数据的情况
+            return tdates_2_tdate_ranges(all_trade_days)
+        stored_trade_days = set(pd.DatetimeIndex(np.unique(data.tdates)).strftime("%Y%m%d"))
+        return tdates_2_tdate_ranges(all_trade_days - stored_trade_days)
+
+    def load(self, plasma_client, object_id: plasma.ObjectID) -> ShardedFrame or ObjectNotAvailable:
+        return ShardedFrame.open(plasma_client, object_id)
+
+    def compute_factors(self, data: pd.DataFrame, since: datetime = None) -> pd.DataFrame:
+        """计算需要计算的Factor，只计算上次计算之后新增的交易日，往前多取lookback个交易日作为输入
+
+        :param since: 从这个交易日开始计算，缺省为上次计算之后的第一个交易日
+        """
+        engine = self.factor_engine
+        if not engine.specs or data.empty:
+            return data
+        tdates = data.index.get_level_values(0).values
+        dates = np.unique(tdates)
+        if any(name not in data.columns for name in engine.specs):
+            new_from = 0  # 新增了需要计算的Factor，全部重新计算
+        elif since is not None:
+            new_from = int(np.searchsorted(dates, np.datetime64(since, "ns"), side="left"))
+        elif self._computed_until is None:
+            new_from = 0  # 服务重启，全部重新计算
+        else:
+            new_from = int(np.searchsorted(dates, np.datetime64(self._computed_until, "ns"), side="right"))
+        if new_from >= len(dates):
+            return data
+        window_from = max(0, new_from - engine.lookback)
+        rows = np.flatnonzero(tdates >= dates[window_from])
+        window = data.iloc[rows]
+        panel = Panel(dates[window_from:])
+        panel.set_index(window.index.get_level_values(0).values, window.index.get_level_values(1).values)
+        for name in engine.inputs:
+            if name in window.columns:
+                panel.add_factor(name, window[name].values)
+        engine.compute(panel, new_from - window_from)
+        data = data.copy(deep=False)
+        for name in engine.specs:
+            if panel.has_factor(name):
+                values = data[name].to_numpy(dtype=panel.factors[name].dtype, copy=True) if name in data.columns else np.full(len(data), np.nan)
+                values[rows] = panel.column(name)
+                data[name] = values
+        logging.info(f"{self.数据名称}: 计算了{len(engine.specs)}个Factor在{len(dates) - new_from}个新交易日上的数据。")
+        return data
+
+    def compute_update(self, update: ShardedUpdate) -> ShardedUpdate or pd.DataFrame:
+        """计算新数据中需要计算的Factor，已有数据只读取新数据之前lookback个交易日的输入列
+
+        已有数据中没有某个需要计算的Factor（新增了Factor）时要全部重新计算，返回合并后的整个数据框。
+        """
+        engine, base, insert = self.factor_engine, update.base, update.insert
+        if not engine.specs or insert.empty:
+            return update
+        if len(base) and any(name not in base.columns for name in engine.specs):
+            return self.compute_factors(update.to_dataframe())
+        since = insert.index.get_level_values(0).min()
+        base_dates = np.unique(base.tdates)
+        first = max(0, int(np.searchsorted(base_dates, np.datetime64(since, "ns"))) - engine.lookback)
+        window = insert
+        if first < len(base_dates):
+            cols = [name for name in dict.fromkeys(list(engine.inputs) + list(engine.specs)) if name in base.columns]
+            window = self.merge_data(base.get(cols, base_dates[first]), insert)
+        computed = self.compute_factors(window, since)
+        insert = insert.copy(deep=False)
+        for name in engine.specs:
+            if name in computed.columns:
+                insert[name] = computed[name].reindex(insert.index).values
+        return ShardedUpdate(base, insert)
+
+    def store(self, plasma_client, data: pd.DataFrame or ShardedUpdate, object_id: plasma.ObjectID) -> plasma.ObjectID:
+        """写入一代数据；data是ShardedUpdate时只计算、转换新数据，逐列生成新一代，不读取整个已有数据"""
+        data = self.compute_update(data) if isinstance(data, ShardedUpdate) else self.compute_factors(data)
+        dtypes = {name: factor.get("dtype") for name, factor in self.catalog.factors.items()}
+        if isinstance(data, ShardedUpdate):
+            insert, savings = enforce_dtypes(data.insert, dtypes)
+            data = ShardedUpdate(data.base, insert)
+        else:
+            data, savings = enforce_dtypes(data, dtypes)
+        self.storage_report.update({saving.column: saving for saving in savings})
+        log_savings(self.数据名称, savings)
+        if isinstance(data, ShardedUpdate):
+            object_ids = data.write(plasma_client, object_id, hot_from=self.hot_from(data))
+        else:
+            object_ids = write_sharded(plasma_client, data, object_id, hot_from=self.hot_from(data))
+        if len(data):
+            self._computed_until = self.trade_dates(data)[-1]
+        # 只保留当前一代和新一代的分片清单，当前一代随后会被服务回收
+        self._shard_ids = {key: value for key, value in self._shard_ids.items() if key == self.数据获取ID}
+        self._shard_ids[object_id] = object_ids
+        return object_id
+
+    def estimate_size(self, data: pd.DataFrame or ShardedUpdate) -> int or None:
+        if isinstance(data, ShardedUpdate):
+            return data.base.nbytes() + int(data.insert.memory_usage(index=True, deep=True).sum())
+        return super().estimate_size(data)
+
+    @staticmethod
+    def trade_dates(data: pd.DataFrame or ShardedUpdate) -> np.ndarray:
+        """数据中的所有交易日（已排序、去重）"""
+        if isinstance(data, ShardedUpdate):
+            return data.tdates
+        return np.unique(data.index.get_level_values(0).values)
+
+    def hot_from(self, data: pd.DataFrame or ShardedUpdate) -> datetime or None:
+        """最近hot_window个交易日的第一个交易日，之前的数据压缩保存；没有设置hot_window或数据不足时返回None"""
+        if not self.hot_window or not len(data):
+            return None
+        dates = self.trade_dates(data)
+        return dates[-self.hot_window] if len(dates) > self.hot_window else None
+
+    def object_ids(self, object_id: plasma.ObjectID) -> List[plasma.ObjectID]:
+        if object_id in self._shard_ids:
+            return self._shard_ids[object_id]
+        return sharded_object_ids(object_id, self.catalog.factors)
 
     @classmethod
     def get_serialization_context(cls) -> SerializationContext:
@@ -142,16 +328,47 @@ class SuperDataFrameMan(DataMan):
     def deserialize(data):
         pass
 
-    def __init__(self, config_file_name, start=datetime(2010, 1, 1), today_toggle=True):
+    def __init__(
+        self,
+        config_file_name,
+        start=datetime(2010, 1, 1),
+        today_toggle=True,
+        table_operator=None,
+        factor_workers: int = None,
+        hot_window: int = None,
+        calendar=None,
+    ):
         """
 
         :param config_file_name:
         :param start: 数据的开始时间，缺省为20100101
+        :param table_operator: 数据表访问对象，需提供query(table_name, start_datetime, end_datetime)，缺省为CaihuiTableOperator
+        :param calendar: 交易日历，需提供is_tdate、last_tdate、query_all_tdates，缺省在检查缺少的交易日时才导入stralib的FastTdate
+        :param factor_workers: 并行计算Factor的进程数，缺省为CPU数（最多4个），0表示在当前进程中计算
+        :param hot_window: 不压缩的最近交易日数，缺省为DataMan.hot_window（全部不压缩）
         """
-        super().__init__("super_data_frame", "超级数据框", start, today_toggle=today_toggle)
-        self.sdf = self.check_config(load_metadata(config_file_name))
+        super().__init__(self.__SUPER_DATA_FRAME_OBJECT_ID__, "超级数据框", start, today_toggle=today_toggle)
+        self.catalog = load_catalog(config_file_name)
+        self._sdf: SuperDataFrameModel or None = None
+        self.factor_engine = FactorEngine(self.catalog, factor_workers)
+        self._computed_until: datetime or None = None  # 服务端已计算到的交易日，之后的交易日是新数据
+        self.storage_report: Dict[str, ColumnSaving] = {}  # 每一列最近一次按dtype转换节省的内存，见storage_types
+        self.table_operator = table_operator
+        self.calendar = calendar
+        if hot_window is not None:
+            self.hot_window = hot_window
+        self.frame: ShardedFrame or None = None  # get读取的数据，见attach
+        self.panel: Panel or None = None  # 已读取的列组成的面板，见init_dataframe
+        self._shard_ids: Dict[plasma.ObjectID, List[plasma.ObjectID]] = {}  # 服务端记录的每一代数据的分片
         self.init_dataframe()
 
+    @property
+    def sdf(self) -> SuperDataFrameModel:
+        """pydantic模型形式的全部Factor，第一次用到时才由元数据目录建立；查询名称、数据表等请直接使用catalog"""
+        if self._sdf is None:
+            self._sdf = self.check_config(SuperDataFrameModel.from_catalog(self.catalog))
+        return self._sdf
+
     def check_config(self, config: SuperDataFrameModel):
         """  TODO 检查是否重名
 
@@ -161,12 +378,83 @@ class SuperDataFrameMan(DataMan):
         return config
 
     def init_dataframe(self):
-        """以交易日为索引，建立起初始数据框"""
-        pass
+        """建立初始的面板：设置了交易日历时以数据区间内的交易日为轴，否则交易日轴在attach时由数据建立；证券轴和数据在attach、get时建立"""
+        if self.calendar is None:
+            self.panel = Panel()
+            return
+        start = self.数据区间[0]
+        tdates = self.calendar.query_all_tdates(start, max(start, self.calendar.last_tdate(datetime.now())), include_stop=True)
+        self.panel = Panel(pd.to_datetime(tdates, format="%Y%m%d"))
 
     def update_data(self):
         pass
 
-    def get(self, start, end, cols):
-        # TODO deal with alias to canonical name
-        return self.df[[cols]].query("@start<= tdate <= end")
+    def close(self):
+        """关闭计算Factor的进程池"""
+        self.factor_engine.close()
+
+    def attach(self, plasma_client, object_id: plasma.ObjectID) -> ShardedFrame:
+        """关联plasma store中的一代数据，之后get从这一代数据中读取；仍是已关联的这一代时保留面板中已读取的列
+
+        :param plasma_client: 之后读取列分片使用的连接，每次关联都换成调用者当前借用的连接
+        """
+        if self.frame is not None and self.frame.object_id == object_id:
+            self.frame.plasma_client = plasma_client
+            return self.frame
+        frame = ShardedFrame(plasma_client, object_id)
+        if self.panel is None:
+            self.init_dataframe()
+        self.panel.set_index(frame.tdates, frame.symbols)
+        self.frame = frame
+        return self.frame
+
+    def load_columns(self, cols: List[str], start: datetime = None) -> Panel:
+        """把还没有读取的列放入面板
+
+        :param start: 只需要从这一天开始的数据，都在热数据中时只读取热数据，不解压冷数据
+        """
+        if self.frame is None:
+            raise RuntimeError("还没有关联plasma store中的数据，请先调用attach")
+        offset, start_row = 0, 0
+        hot_from = self.frame.hot_from
+        if start is not None and 0 < hot_from < len(self.frame):
+            hot_row = self.panel.rows(self.frame.tdates[hot_from]).start  # 热数据的第一个交易日在面板中的行
+            if self.panel.rows(start).start >= hot_row:
+                offset, start_row = hot_from, hot_row
+        for col in cols:
+            if not self.panel.has_factor(col, start_row):
+                self.panel.add_factor(col, to_numpy(self.frame.column(col, slice(offset, None))), offset)
+        return self.panel
+
+    def get(self, start, end, cols, symbols: List[str] = None) -> pd.DataFrame:
+        """读取[start, end]的若干列，以(tdate, symbol)为索引，只读取用到的列分片
+
+        :param cols: 列的统一名称或别名，返回的列名与之相同
+        :param symbols: 需要的证券，缺省为全部证券
+        """
+        plan = self.plan(cols, start, end, symbols)
+        names = list(dict.fromkeys(plan.names))
+        result = self.load_columns(plan.columns, start).get(names, start, end, symbols)
+        if len(names) != len(plan.names):
+            result = result[plan.names]  # 同一列用不同的名称查询了多次
+        result.columns = plan.output
+        return result
+
+    def get_panel(self, start, end, col, symbols: List[str] = None) -> pd.DataFrame:
+        """读取[start, end]的一列，以交易日为索引、证券代码为列；不指定证券时直接引用面板中的数据（只读）"""
+        [name] = self.plan([col]).names
+        return self.load_columns([name], start).frame(name, start, end, symbols)
+
+    def scan(self, prepare=None) -> LazyQuery:
+        """延迟查询，见lazy_query
+
+        :param prepare: 返回collect期间使用的上下文，如借用连接并关联plasma store中的当前一代数据，见DataClient.attached
+        """
+        return LazyQuery(self, prepare)
+
+    def plan(self, cols: List[str], start: datetime = None, end: datetime = None, symbols: List[str] = None) -> QueryPlan:
+        """查询计划：列名转换为统一名称、按数据表分组，见query_plan
+
+        :raise KeyError: 元数据中没有的列
+        """
+        return plan_query(self.catalog, cols, start, end, symbols)
@@ -1,4 +1,7 @@
 import os
+import time
+import uuid
+
 import pytest
 
 from stralib.adam.exceptions import AdamDataException
@@ -39,3 +42,14 @@ def conf_dir(request, project_root) -> str:
         request.cls.conf_dir = conf_dir
     yield conf_dir
     loader.load_config()
+
+
+@pytest.fixture()
+def plasma_store_name(tmp_path) -> str:
+    """启动一个测试用的plasma store，返回其socket名称"""
+    from cheetah.plasma_store import start_plasma_store
+
+    plasma_store_name, proc = start_plasma_store(os.path.join(tmp_path, f"plasma_{uuid.uuid4().hex[:8]}"), int(1e8))
+    time.sleep(0.5)
+    yield plasma_store_name
+    proc.kill()
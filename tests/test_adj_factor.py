@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pyarrow import plasma
+
+from cheetah.adj_factor import AdjFactorMan, cumulative_factors, adjust_prices, FORWARD, BACKWARD
+from cheetah.hishty import Hishty, HishtyMan
+
+
+def make_hishty(rows):
+    table = pd.DataFrame(rows, columns=["div_date", "symbol", "cash_div", "share_div", "pg_rate", "pg_price"])
+    return Hishty.from_table(table.sort_values(["div_date", "symbol"], ignore_index=True))
+
+
+HISHTY = make_hishty(
+    [
+        ["20200103", "600000.SH", 0.5, 0.2, 0.0, 0.0],
+        ["20200107", "600000.SH", 0.0, 0.0, 0.3, 8.0],
+        ["20200107", "000001.SZ", 0.1, 0.0, 0.0, 0.0],
+        ["20200110", "600000.SH", 0.2, 0.0, 0.0, 0.0],
+    ]
+)
+
+
+def test_adjust_prices_matches_div_signal():
+    factors = cumulative_factors(HISHTY.table)
+    dates = pd.bdate_range("2020-01-02", "2020-01-13")
+    prices = pd.DataFrame(np.linspace(10, 20, len(dates) * 3).reshape(len(dates), 3), index=dates, columns=["600000.SH", "000001.SZ", "600519.SH"])
+    forward, backward = adjust_prices(prices, factors, FORWARD), adjust_prices(prices, factors, BACKWARD)
+    for date in dates:
+        for symbol in prices.columns:
+            later = prices.at[date, symbol]  # 依次应用之后的除权除息日即为前复权价格
+            earlier = backward.at[date, symbol]  # 后复权价格依次应用之前（含当天）的除权除息日应还原为原价格
+            for div_date in HISHTY.div_dates:
+                if pd.Timestamp(div_date) > date:
+                    later = HISHTY.div_signal(div_date, {"SYMBOL": symbol, "TPRICE": later, "STKEFFEFT": 0})["TPRICE"]
+                else:
+                    earlier = HISHTY.div_signal(div_date, {"SYMBOL": symbol, "TPRICE": earlier, "STKEFFEFT": 0})["TPRICE"]
+            assert np.isclose(forward.at[date, symbol], later)
+            assert np.isclose(earlier, prices.at[date, symbol])
+    pd.testing.assert_series_equal(forward["600519.SH"], prices["600519.SH"])  # 没有除权除息的证券不变
+
+
+def test_incremental_update(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    hishty_man, man = HishtyMan(), AdjFactorMan()
+    hishty_id = plasma.ObjectID.from_random()
+    hishty_man.数据获取ID = hishty_man.store(plasma_client, HISHTY.slice("20200101", "20200106"), hishty_id)
+    man._dependency_loader = lambda key: hishty_man.load(plasma_client, hishty_man.数据获取ID)
+
+    (start, end), = man.check_data(plasma.ObjectNotAvailable)
+    factors = man.fetch_data(start, end)
+    assert not man.check_data(factors)  # 没有新的除权除息日
+
+    updated = hishty_man.merge(hishty_man.load(plasma_client, hishty_id), HISHTY.slice("20200107", "20200110"))
+    hishty_man.数据获取ID = hishty_man.store(plasma_client, updated, plasma.ObjectID.from_random())
+    (start, end), = man.check_data(factors)
+    assert start == pd.Timestamp("2020-01-03")  # 从已有的最后一个除权除息日开始计算
+    merged = man.merge_data(factors, man.fetch_data(start, end))
+    pd.testing.assert_frame_equal(merged, cumulative_factors(HISHTY.table), check_exact=False)
+    plasma_client.disconnect()
+
+
+def test_stored_as_arrow_without_serialization_context(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    man, factors = AdjFactorMan(), cumulative_factors(HISHTY.table)
+    object_id = man.store(plasma_client, factors, plasma.ObjectID.from_random())
+    pd.testing.assert_frame_equal(man.load(plasma_client, object_id), factors)
+    plasma_client.disconnect()
+    with pytest.raises(NotImplementedError):
+        man.get_serialization_context()
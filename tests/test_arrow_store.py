@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from pyarrow import plasma
+
+from cheetah.arrow_store import put_table, get_table, get_object, get_objects, dataframe_to_table, table_to_dataframe
+
+
+def test_arrow_round_trip(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    df = pd.DataFrame({"收盘价": np.arange(5, dtype="float32"), "成交量": np.arange(5)}, index=pd.Index(list("abcde"), name="symbol"))
+    object_id = plasma.ObjectID.from_random()
+    put_table(plasma_client, dataframe_to_table(df), object_id)
+
+    result = table_to_dataframe(get_table(plasma_client, object_id))
+    pd.testing.assert_frame_equal(df, result)
+    assert not result["收盘价"].values.flags.owndata  # 直接引用共享内存
+
+    assert get_table(plasma_client, plasma.ObjectID.from_random()) is plasma.ObjectNotAvailable
+    other_id = plasma_client.put({"a": 1})
+    assert get_object(plasma_client, other_id) == {"a": 1}
+    assert get_object(plasma_client, object_id).num_rows == 5
+    plasma_client.disconnect()
+
+
+def test_get_objects(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    table_id = put_table(plasma_client, dataframe_to_table(pd.DataFrame({"a": [1, 2]})), plasma.ObjectID.from_random())
+    other_id = plasma_client.put([1, 2, 3])
+    missing_id = plasma.ObjectID.from_random()
+
+    table, other, missing = get_objects(plasma_client, [table_id, other_id, missing_id])
+    assert table.num_rows == 2
+    assert other == [1, 2, 3]
+    assert missing is plasma.ObjectNotAvailable
+    plasma_client.disconnect()
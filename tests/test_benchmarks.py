@@ -0,0 +1,23 @@
+import json
+import os
+import subprocess
+import sys
+
+from pathlib import Path
+
+
+def test_benchmarks_run_small(tmp_path):
+    """在独立的进程中运行基准，不依赖stralib和plasma store"""
+    output = os.path.join(tmp_path, "result.json")
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--sizes", "small", "--repeat", "1", "--no-plasma", "--output", output],
+        cwd=Path(__file__).parent.parent.as_posix(),
+        check=True,
+        timeout=300,
+    )
+    with open(output, encoding="utf8") as file:
+        report = json.load(file)
+    assert report["store"] == "memory"
+    results = {result["scenario"]: result for result in report["results"]}
+    assert set(results) == {"cold_backfill", "incremental_refresh", "cache_roundtrip", "hishty_build", "client_get", "client_get_data"}
+    assert [name for name, result in results.items() if "error" in result] == []
@@ -0,0 +1,35 @@
+from cheetah.capacity import AccessRecorder, AccessStat, CapacityManager, POLICY_LFU, read_access_stats
+
+
+def test_access_stats_merge_processes(tmp_path):
+    plasma_store_name = str(tmp_path / "plasma")
+    recorder = AccessRecorder(plasma_store_name)
+    recorder.record("a", hit=True)
+    recorder.record("b", hit=False)  # 未命中立即写出
+    stats = read_access_stats(plasma_store_name)
+    assert stats["a"].count == 1 and stats["b"].misses == 1
+
+
+def test_select_victims_only_colder_objects(tmp_path):
+    manager = CapacityManager(str(tmp_path / "plasma"), POLICY_LFU)
+    manager.sizes = {"cold": 10, "warm": 10, "hot": 10}
+    manager.access = {key: AccessStat(count, count, 0, 0) for key, count in [("cold", 1), ("warm", 5), ("hot", 9)]}
+    assert manager.select_victims(15, ["cold", "warm", "hot"]) == ["cold", "warm"]
+    assert manager.select_victims(15, ["cold", "warm"], colder_than="warm") is None
+    assert manager.pressure_victims(used=95, capacity=100, candidates=["cold", "warm", "hot"]) == ["cold", "warm"]
+    assert manager.pressure_victims(used=50, capacity=100, candidates=["cold"]) == []
+    assert manager.pressure_victims(used=95, capacity=100, candidates=["cold"]) == []  # 淘汰了也降不到low_watermark以下
+
+
+def test_admit_reserve_and_demand(tmp_path):
+    manager = CapacityManager(str(tmp_path / "plasma"))
+    assert manager.admit(40, used=50, capacity=100) == 0
+    assert manager.admit(20, used=50, capacity=100) == 10  # 已登记的40字节还没写完
+    manager.release(40)
+    assert manager.admit(20, used=50, capacity=100) == 0
+
+    manager.mark_evicted("a")
+    assert manager.demanded() == set()
+    AccessRecorder(manager.plasma_store_name).record("a", hit=False)
+    manager.refresh_access()
+    assert manager.demanded() == {"a"}
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from pyarrow import plasma
+
+from benchmarks.synthetic import SyntheticTables, trade_days
+from cheetah.arrow_store import put_table
+from cheetah.async_client import AsyncDataClient
+from cheetah.client import DataClient, GET_SECONDS, BATCH_OBJECT
+from cheetah.hishty import Hishty, HishtyMan
+from cheetah.plasma_store import generation_object_id
+from cheetah.publication import PublishedPointers
+from cheetah.super_dataframe import SuperDataFrameMan
+
+TABLE = pa.table({"x": [1, 2, 3]})
+HISHTY = Hishty.from_table(
+    pd.DataFrame(
+        [["20190103", "600000.SH", 0.5, 0.2, 0.0, 0.0], ["20200107", "000001.SZ", 0.1, 0.0, 0.0, 0.0], ["20200110", "600000.SH", 0.2, 0.0, 0.0, 0.0]],
+        columns=["div_date", "symbol", "cash_div", "share_div", "pg_rate", "pg_price"],
+    )
+)
+
+
+@pytest.fixture()
+def client(plasma_store_name):
+    client = DataClient(plasma_store_name)
+    yield client
+    client.pool.close()
+    DataClient._instances.pop(DataClient, None)
+
+
+def publish_table(plasma_store_name, equipment_id, generation=1):
+    """像服务端一样写入一代数据后发布"""
+    plasma_client = plasma.connect(plasma_store_name)
+    put_table(plasma_client, TABLE, generation_object_id(equipment_id, generation))
+    plasma_client.disconnect()
+    PublishedPointers(plasma_store_name).publish(equipment_id, generation)
+
+
+def publish_hishty(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    HishtyMan().store(plasma_client, HISHTY, generation_object_id(HishtyMan.__HISHTY_OBJECT_ID__, 1))
+    plasma_client.disconnect()
+    PublishedPointers(plasma_store_name).publish(HishtyMan.__HISHTY_OBJECT_ID__, 1)
+
+
+def later(seconds, function, *args):
+    timer = threading.Timer(seconds, function, args)
+    timer.start()
+    return timer
+
+
+def test_get_many_timeout(client, plasma_store_name):
+    publish_table(plasma_store_name, "a")
+    result = client.get_many(["a", "b"], timeout_ms=0)
+    assert result["a"].equals(TABLE) and result["b"] is plasma.ObjectNotAvailable
+    start = time.monotonic()
+    assert client.get_many(["a", "b"], timeout_ms=200)["b"] is plasma.ObjectNotAvailable
+    assert time.monotonic() - start >= 0.2
+
+    timer = later(0.2, publish_table, plasma_store_name, "b")
+    result = client.get_many(["a", "b"], timeout_ms=5000)
+    timer.join()
+    assert result["a"].equals(TABLE) and result["b"].equals(TABLE)
+
+
+def test_get_many_backs_off_until_published(client, plasma_store_name, monkeypatch):
+    delays = []
+
+    def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) == 4:
+            publish_table(plasma_store_name, "b")
+
+    monkeypatch.setattr(time, "sleep", sleep)
+    assert client.get("b", timeout_ms=-1).equals(TABLE)  # 一直等待，检查间隔加倍
+    assert delays == [0.01, 0.02, 0.04, 0.08]
+
+
+def test_async_get_many(client, plasma_store_name):
+    async_client = AsyncDataClient(client)
+    publish_table(plasma_store_name, "a")
+
+    async def main():
+        timer = later(0.2, publish_table, plasma_store_name, "b")
+        waiting = asyncio.ensure_future(async_client.get_many(["a", "b"], timeout=5))
+        ticks = 0
+        while not waiting.done():  # 等待期间事件循环没有被阻塞
+            ticks += 1
+            await asyncio.sleep(0.01)
+        timer.join()
+        return await waiting, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result["a"].equals(TABLE) and result["b"].equals(TABLE)
+    assert ticks > 5
+    assert asyncio.run(async_client.get("c", timeout=0)) is plasma.ObjectNotAvailable
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(async_client.get_many(["a", "c"], timeout=0.2))
+
+
+def test_async_get_hishty(client, plasma_store_name):
+    async_client = AsyncDataClient(client)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(async_client.get_hishty("20200101", "20201231", timeout=0.2))
+
+    async def main():
+        timer = later(0.2, publish_hishty, plasma_store_name)
+        hishty = await async_client.get_hishty("20200101", "20201231", timeout=5)
+        timer.join()
+        return hishty
+
+    hishty = asyncio.run(main())
+    assert list(hishty.div_dates) == ["20200107", "20200110"]
+    pd.testing.assert_frame_equal(hishty.table.reset_index(drop=True), HISHTY.slice("20200101", "20201231").table.reset_index(drop=True))
+
+
+def test_get_data_and_scan_read_with_borrowed_connection(client, plasma_store_name, tmp_path):
+    tables = SyntheticTables(5, 2)
+    metadata_file = os.path.join(tmp_path, "metadata.yaml")
+    tables.write_metadata(metadata_file)
+    sdf_man = SuperDataFrameMan(metadata_file, start=datetime(2020, 1, 1), table_operator=tables, factor_workers=0)
+    days = trade_days(datetime(2020, 1, 31), 10)
+    plasma_client = plasma.connect(plasma_store_name)
+    sdf_man.store(plasma_client, sdf_man.fetch_data(days[0], days[-1]), generation_object_id(sdf_man.数据标识符, 1))
+    plasma_client.disconnect()
+    PublishedPointers(plasma_store_name).publish(sdf_man.数据标识符, 1)
+
+    borrowed = []
+    load_columns = sdf_man.load_columns
+
+    def record(cols, start=None):
+        borrowed.append(sdf_man.frame.plasma_client not in client.pool._idle)  # 读取列分片时连接仍被借用
+        return load_columns(cols, start)
+
+    sdf_man.load_columns = record
+    result = client.get_data(days[0], days[-1], ["因子0"], sdf_man)
+    collected = client.scan(sdf_man).select(["因子1"]).between(days[0], days[-1]).collect()
+    assert borrowed == [True, True]
+    assert len(client.pool._idle) == client.pool._size  # 读取完成后归还
+    expected = tables.query("SYN0", days[0], days[-1])
+    np.testing.assert_array_equal(result["因子0"].to_numpy(), expected["COL0"].to_numpy())
+    np.testing.assert_array_equal(collected["因子1"].to_numpy(), expected["COL1"].to_numpy())
+
+
+def test_cache_dropped_when_unpublished_or_store_restarted(client, plasma_store_name):
+    pointers = PublishedPointers(plasma_store_name)
+    pointers.reset()
+    publish_hishty(plasma_store_name)
+    assert client.get_hishty("20200101", "20201231") is not None
+    assert len(client.cache.cached()) == 1  # 2020年的分区
+    pointers.unpublish(HishtyMan.__HISHTY_OBJECT_ID__)
+    assert client.get_hishty("20200101", "20201231") is None
+    assert client.cache.cached() == []  # 指针已消失，缓存也作废
+
+    pointers.publish(HishtyMan.__HISHTY_OBJECT_ID__, 1)
+    assert client.get_hishty("20200101", "20201231") is not None
+    instance, _ = client.cache.cached()[0][1]
+    pointers.reset()  # store重新启动，之后发布的object_id即使相同也是另一个store中的对象
+    pointers.publish(HishtyMan.__HISHTY_OBJECT_ID__, 1)
+    assert client.get_hishty("20200101", "20201231") is not None
+    assert [version[0] for _, version in client.cache.cached()] == [pointers.instance]
+    assert pointers.instance != instance
+
+
+def test_get_seconds_observed_once_per_read(client, plasma_store_name):
+    def count(object_label):
+        return sum(value for name, labels, value in GET_SECONDS.samples() if name.endswith("_count") and ("object", object_label) in labels)
+
+    publish_table(plasma_store_name, "a")
+    before = {label: count(label) for label in ("a", "b", BATCH_OBJECT)}
+    client.get_many(["a", "b"])
+    client.get("a")
+    # 整批的用时只记录一次，不记到批中每个对象名下
+    assert {label: count(label) - before[label] for label in before} == {"a": 1, "b": 0, BATCH_OBJECT: 1}
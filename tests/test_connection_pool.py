@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+
+from cheetah.connection_pool import PlasmaConnectionPool
+
+
+def test_connections_are_reused_and_bounded(plasma_store_name):
+    pool = PlasmaConnectionPool(plasma_store_name, max_size=2)
+    with pool.connection() as first:
+        object_id = first.put("data")
+    with pool.connection() as second:
+        assert second is first  # 空闲连接被复用
+        assert second.get(object_id, timeout_ms=0) == "data"
+
+    a, b = pool.acquire(), pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.1)
+    threading.Timer(0.1, pool.release, (a,)).start()
+    assert pool.acquire(timeout=5) is a  # 归还后等待者拿到连接
+    pool.release(a)
+    pool.release(b)
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_broken_connection_is_discarded(plasma_store_name):
+    pool = PlasmaConnectionPool(plasma_store_name, max_size=1)
+    with pytest.raises(OSError):
+        with pool.connection() as plasma_client:
+            broken = plasma_client
+            raise OSError("连接已断开")
+    with pool.connection() as plasma_client:
+        assert plasma_client is not broken
+        assert plasma_client.store_capacity() > 0
@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import datetime
+
+from cheetah.executor import RefreshExecutor, stale_small_first
+
+
+class FakeMan(object):
+    def __init__(self, id, end=datetime(2020, 1, 1), depends_on=(), concurrency_group=None):
+        self.数据标识符 = id
+        self.数据名称 = id
+        self.数据区间 = (datetime(2010, 1, 1), end)
+        self.depends_on = depends_on
+        self.concurrency_group = concurrency_group
+
+
+def test_run_cycle_parallel_and_dependencies():
+    finished = []
+    lock = threading.Lock()
+    both_running = threading.Barrier(2, timeout=5)  # a、b都在执行时才能通过，不是并发执行时超时出错
+
+    def work(man):
+        if man.数据标识符 in ("a", "b"):
+            both_running.wait()
+        with lock:
+            finished.append(man.数据标识符)
+
+    objects = {
+        "a": FakeMan("a"),
+        "b": FakeMan("b"),
+        "c": FakeMan("c", depends_on=("a", "b")),
+    }
+    durations = RefreshExecutor(max_workers=4).run_cycle(objects, work)
+    assert set(durations) == {"a", "b", "c"}
+    assert finished == ["a", "b", "c"] or finished == ["b", "a", "c"]
+    assert not both_running.broken
+
+
+def test_run_cycle_group_limit_and_error_isolation():
+    active = {"db": 0, "max": 0}
+    lock = threading.Lock()
+
+    def work(man):
+        with lock:
+            active["db"] += 1
+            active["max"] = max(active["max"], active["db"])
+        time.sleep(0.02)
+        with lock:
+            active["db"] -= 1
+        if man.数据标识符 == "bad":
+            raise RuntimeError("boom")
+
+    objects = {key: FakeMan(key, concurrency_group="db") for key in ["bad", "x", "y", "z"]}
+    durations = RefreshExecutor(max_workers=4, group_limits={"db": 2}).run_cycle(objects, work)
+    assert set(durations) == set(objects)
+    assert active["max"] == 2
+
+
+def test_run_cycle_stop_event_and_priority():
+    stop_event = threading.Event()
+    order = []
+
+    def work(man):
+        order.append(man.数据标识符)
+        stop_event.set()
+
+    objects = {"new": FakeMan("new", end=datetime(2020, 1, 2)), "old": FakeMan("old", end=datetime(2019, 1, 1))}
+    durations = RefreshExecutor(max_workers=1, stop_event=stop_event).run_cycle(objects, work, stale_small_first({}))
+    assert order == ["old"]
+    assert list(durations) == ["old"]
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cheetah.factor_engine import FactorEngine, topological_levels, factor_specs, shift
+from cheetah.metadata_catalog import MetadataCatalog
+from cheetah.panel import Panel
+
+
+def make_catalog(**derived):
+    factors = {"收盘价": {"name": "收盘价", "belong_to": "CHDQUOTE_ADJ"}}
+    for name, (method, dependencies, lookback) in derived.items():
+        factors[name] = {"name": name, "belong_to": "CHDQUOTE_ADJ", "calculate_method": method, "dependencies": dependencies, "lookback": lookback}
+    return MetadataCatalog(factors)
+
+
+def make_panel(close: np.ndarray) -> Panel:
+    dates = pd.bdate_range("2020-01-01", periods=close.shape[0])
+    panel = Panel(dates)
+    index = pd.MultiIndex.from_product([dates, [f"S{i}" for i in range(close.shape[1])]])
+    panel.set_index(index.get_level_values(0).values, index.get_level_values(1).values)
+    panel.add_factor("收盘价", close.ravel())
+    return panel
+
+
+def test_incremental_compute():
+    catalog = make_catalog(前收=(["shift", [1]], ["收盘价"], 1), 均价=(["rolling_mean", [3]], ["前收"], 2))
+    engine = FactorEngine(catalog, max_workers=0)
+    assert engine.levels == [["前收"], ["均价"]] and engine.lookback == 2
+
+    close = np.arange(30, dtype="float64").reshape(10, 3)
+    full = engine.compute(make_panel(close))
+    expected = pd.DataFrame(shift(close, 1)).rolling(3).mean().to_numpy()
+    np.testing.assert_allclose(full.factors["均价"], expected)
+
+    partial = make_panel(close)  # 前7个交易日已经算好，只计算后3个
+    partial.factors["前收"] = full.factors["前收"].copy()
+    partial.factors["均价"] = full.factors["均价"].copy()
+    partial.factors["均价"][7:] = -1
+    engine.compute(partial, start_row=7)
+    np.testing.assert_allclose(partial.factors["均价"], expected)
+
+
+def test_invalid_dependencies():
+    with pytest.raises(ValueError):
+        topological_levels(factor_specs(make_catalog(a=(["shift", [1]], ["b"], 1), b=(["shift", [1]], ["a"], 1))))
+    with pytest.raises(ValueError):
+        factor_specs(make_catalog(a=(["shift", [1]], ["不存在"], 1)))
@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cheetah.hishty import Hishty
+
+
+def make_info(div_date, symbol, cash_div=0.0, share_div=0.0, pg_rate=0.0, pg_price=0.0):
+    return {"div_date": div_date, "symbol": symbol, "cash_div": cash_div, "share_div": share_div, "pg_rate": pg_rate, "pg_price": pg_price}
+
+
+def test_slice_by_date_range():
+    symbol_infos = {
+        date: {"600000.SH": make_info(date, "600000.SH", cash_div=0.1)} for date in ["20200106", "20200103", "20200110", "20200215"]
+    }
+    hishty = Hishty("20200101", "20200301", symbol_infos)
+    sub = hishty.slice(datetime(2020, 1, 3), "20200110")
+    assert list(sub.div_dates) == ["20200103", "20200106", "20200110"]
+    assert sub.symbol_infos["20200106"] is symbol_infos["20200106"]  # 共用每一天的数据
+    assert list(hishty.slice("20200107", "20200109").div_dates) == []
+    assert list(hishty.slice("20200111", "20991231").div_dates) == ["20200215"]
+
+
+def test_check_data_after_watermark(monkeypatch):
+    from cheetah import hishty as hishty_module
+    from cheetah.service import Watermark
+
+    class Calendar(object):
+        @staticmethod
+        def is_tdate(value):
+            return True
+
+        @staticmethod
+        def last_tdate(value):
+            return datetime(2020, 3, 2)
+
+    queried = []
+
+    def symbol_table(self, start, end):
+        queried.append(start)
+        return hishty_module.infos_to_table({"20200302": {"600000.SH": make_info("20200302", "600000.SH", cash_div=0.2)}})
+
+    monkeypatch.setattr(hishty_module, "FastTdate", Calendar)
+    monkeypatch.setattr(Hishty, "symbol_table", symbol_table)
+    man = hishty_module.HishtyMan()
+    stored = Hishty("20200102", "20200102", {"20200102": {"600000.SH": make_info("20200102", "600000.SH", cash_div=0.1)}})
+    man.watermark = Watermark(datetime(2020, 2, 28, 15, 30), None)
+    assert man.check_data(stored)  # 20200302的数据还没有
+    assert queried[0] == datetime(2020, 2, 28)  # 只查询水位线当天之后的数据
+    man.commit_watermark()
+    assert man.watermark.fetched_until == datetime(2020, 3, 2)
+
+
+def test_symbol_table(monkeypatch):
+    from cheetah import hishty as hishty_module
+
+    def series_data(name, start, end, cols=None):
+        if name == "equ_div":
+            return pd.DataFrame(
+                {
+                    "SYMBOL": ["600000.SH", "600000.SH", "000001.SZ"],
+                    "EX_DIV_DATE": pd.to_datetime(["2020-01-03", "2020-01-03", "2020-01-06"]),
+                    "PER_CASH_DIV": [0.1, 0.2, -1.0],
+                    "PER_SHARE_DIV_RATIO": [np.nan, 0.1, np.nan],
+                    "PER_SHARE_TRANS_RATIO": [0.3, np.nan, np.nan],
+                }
+            )
+        return pd.DataFrame({"SYMBOL": ["600000.SH"], "EX_RIGHTS_DATE": pd.to_datetime(["2020-01-06"]), "ALLOTMENT_RATIO": [0.3], "ALLOTMENT_PRICE": [5.0]})
+
+    monkeypatch.setattr(hishty_module, "get_series_data", series_data)
+    hishty = Hishty("20200101", "20200110")
+    assert hishty._symbol_infos is None  # 用到时才生成嵌套的字典
+    assert hishty.table[["div_date", "symbol"]].values.tolist() == [["20200103", "600000.SH"], ["20200106", "000001.SZ"], ["20200106", "600000.SH"]]
+    info = hishty.symbol_infos["20200103"]["600000.SH"]
+    assert np.isclose(info["cash_div"], 0.3) and np.isclose(info["share_div"], 0.4) and info["pg_rate"] == 0
+    assert hishty.symbol_infos["20200106"]["000001.SZ"]["cash_div"] == 0  # 负数和缺失值为0
+    assert hishty.symbol_infos["20200106"]["600000.SH"] == make_info("20200106", "600000.SH", pg_rate=0.3, pg_price=5.0)
+
+
+def test_div_opt_batch_matches_div_opt():
+    symbol_infos = {
+        "20200103": {
+            "600000.SH": make_info("20200103", "600000.SH", cash_div=0.5, share_div=0.2),
+            "000001.SZ": make_info("20200103", "000001.SZ", cash_div=0.1, pg_rate=0.3, pg_price=8.0),
+            "600519.SH": make_info("20200103", "600519.SH", pg_rate=0.3, pg_price=10.0),
+        }
+    }
+    hishty = Hishty("20200101", "20200110", symbol_infos)
+    stocks = [
+        {"symbol": "600000.SH", "stkbal": 1000.0, "avg_price": 10.0, "mktval": 10000.0, "sname": "浦发银行", "market": "SH"},
+        {"symbol": "000001.SZ", "stkbal": 2000.0, "avg_price": 12.0, "mktval": 24000.0, "sname": "平安银行", "market": "SZ"},
+        {"symbol": "600519.SH", "stkbal": 1000.0, "avg_price": 20.0, "mktval": 20000.0, "sname": "贵州茅台", "market": "SH"},
+        {"symbol": "000002.SZ", "stkbal": 500.0, "avg_price": 30.0, "mktval": 15000.0, "sname": "万科A", "market": "SZ"},
+    ]
+    fundbal, expected_stocks, expected_signals, balances = 3000.0, [], [], []
+    for stock in stocks:  # 配股受资金限制，第三只只能买一部分
+        fundbal, signals, adjusted = hishty.div_opt("20200103", fundbal, stock)
+        expected_stocks.append(adjusted)
+        expected_signals.extend(signals)
+        balances.append(fundbal)
+
+    positions = pd.DataFrame(stocks).assign(tdate="20200103")
+    result, signals = hishty.div_opt_batch(positions, 3000.0)
+    for col in ["stkbal", "avg_price", "mktval"]:
+        assert result[col].tolist() == [stock[col] for stock in expected_stocks]
+    assert result["fundbal"].tolist() == balances
+    assert signals.to_dict("records") == expected_signals
+
+    orders = pd.DataFrame({"TDATE": "20200103", "SYMBOL": [stock["symbol"] for stock in stocks], "TPRICE": 10.0, "STKEFFEFT": 1050})
+    expected = pd.DataFrame([hishty.div_signal("20200103", order) for order in orders.to_dict("records")])
+    pd.testing.assert_frame_equal(hishty.div_signal_batch(orders), expected)
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cheetah.lazy_query import LazyQuery, col
+from cheetah.metadata_catalog import MetadataCatalog
+from cheetah.panel import Panel
+from cheetah.query_plan import plan_query
+
+
+class PanelSource(object):
+    """只有面板的SuperDataFrameMan，数据已全部读入"""
+
+    def __init__(self, df: pd.DataFrame, catalog: MetadataCatalog):
+        self.catalog = catalog
+        self.panel = Panel(df.index.get_level_values(0))
+        self.panel.set_index(df.index.get_level_values(0).values, df.index.get_level_values(1).values)
+        for name in df.columns:
+            self.panel.add_factor(name, df[name].values)
+        self.frame = None
+
+    def plan(self, cols, start=None, end=None, symbols=None):
+        return plan_query(self.catalog, cols, start, end, symbols)
+
+    def load_columns(self, cols, start=None):
+        return self.panel
+
+
+def test_lazy_query():
+    index = pd.MultiIndex.from_product([pd.bdate_range("2020-01-01", "2020-01-10"), ["000001.CNSESZ", "600000.CNSESH", "600519.CNSESH"]], names=["tdate", "symbol"])
+    df = pd.DataFrame({"收盘价": np.arange(len(index), dtype="float64"), "成交量": np.arange(len(index)) % 4}, index=index)
+    catalog = MetadataCatalog({name: {"name": name, "belong_to": "CHDQUOTE_ADJ", "alias": [alias]} for name, alias in [("收盘价", "TCLOSE"), ("成交量", "VOTURNOVER")]})
+    query = LazyQuery(PanelSource(df, catalog))
+
+    narrow = query.select(["TCLOSE"]).between(datetime(2020, 1, 2), datetime(2020, 1, 6)).symbols(["600519.CNSESH", "000001.CNSESZ"])
+    filtered = narrow.filter((col("成交量") > 0) & (col("tclose") < 15))
+    assert narrow.cols == ["TCLOSE"] and not narrow.predicates  # 每一步返回新的查询
+
+    result = filtered.collect()
+    frame = df.loc["2020-01-02":"2020-01-06"]
+    frame = frame[frame.index.get_level_values(1).isin(["600519.CNSESH", "000001.CNSESZ"]) & (frame["成交量"] > 0) & (frame["收盘价"] < 15)]
+    expected = frame[["收盘价"]].rename(columns={"收盘价": "TCLOSE"})
+    pd.testing.assert_frame_equal(expected, result, check_index_type=False)
+    assert "CHDQUOTE_ADJ" in filtered.explain()
+    assert len(query.select(["收盘价"]).collect()) == len(df)
@@ -0,0 +1,55 @@
+import os
+from unittest import mock
+
+import pytest
+
+from cheetah import metadata_catalog
+from cheetah.metadata_catalog import load_catalog, catalog_file_name
+
+METADATA = """
+Factors:
+    symbol:
+        dtype: S13
+        belong_to: CHDQUOTE_ADJ
+        alias:
+            - 证券代码
+    昨日收盘价:
+        dtype: f3
+        belong_to: CHDQUOTE_ADJ
+        alias:
+            - LCLOSE
+            - PreClose
+    risk_signal_identity:
+        dtype: i4
+        belong_to: RISK_SIGNAL
+"""
+
+
+def test_load_catalog(tmp_path):
+    conf_file = os.path.join(tmp_path, "metadata.yaml")
+    with open(conf_file, "w", encoding="utf8") as file:
+        file.write(METADATA)
+
+    catalog = load_catalog(conf_file)
+    assert os.path.exists(catalog_file_name(conf_file))
+    assert catalog.get_belong_to("symbol") == "CHDQUOTE_ADJ"
+    assert catalog.get_table_colname("昨日收盘价") == "LCLOSE"
+    assert catalog.get_table_colname("risk_signal_identity") == "risk_signal_identity"
+    assert catalog.canonical_name("preclose") == "昨日收盘价"  # 大小写不敏感
+    assert catalog.canonical_name("不存在") is None
+    assert catalog.by_table == {"CHDQUOTE_ADJ": ["symbol", "昨日收盘价"], "RISK_SIGNAL": ["risk_signal_identity"]}
+
+    with mock.patch.object(metadata_catalog, "compile_catalog") as compile_catalog:
+        assert load_catalog(conf_file).factors == catalog.factors
+        os.utime(conf_file, ns=(0, 0))  # 只改修改时间，内容不变
+        assert load_catalog(conf_file).factors == catalog.factors
+        compile_catalog.assert_not_called()
+
+    with open(conf_file, "a", encoding="utf8") as file:
+        file.write("    收盘价:\n        dtype: f3\n        belong_to: CHDQUOTE_ADJ\n")
+    assert load_catalog(conf_file).get_belong_to("收盘价") == "CHDQUOTE_ADJ"
+
+    with open(conf_file, "a", encoding="utf8") as file:
+        file.write("    开盘价:\n        dtype: f3\n")
+    with pytest.raises(ValueError):
+        load_catalog(conf_file)
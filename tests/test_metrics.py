@@ -0,0 +1,45 @@
+import socket
+
+from cheetah.metrics import MetricsRegistry, MetricsServer
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("cheetah_test_total", "测试计数", ("object", "result"))
+    counter.inc(object="a", result="hit")
+    counter.inc(2, object="a", result="hit")
+    assert registry.counter("cheetah_test_total", "测试计数", ("object", "result")) is counter
+    registry.gauge("cheetah_test_bytes", "测试大小").set(1024)
+    histogram = registry.histogram("cheetah_test_seconds", "测试用时", ("stage",), buckets=(0.1, 1))
+    histogram.observe(0.05, stage="check")
+    histogram.observe(0.5, stage="check")
+    histogram.observe(5, stage="check")
+    text = registry.render()
+    assert '# TYPE cheetah_test_total counter\ncheetah_test_total{object="a",result="hit"} 3\n' in text
+    assert "cheetah_test_bytes 1024\n" in text
+    assert 'cheetah_test_seconds_bucket{stage="check",le="0.1"} 1\n' in text
+    assert 'cheetah_test_seconds_bucket{stage="check",le="1.0"} 2\n' in text
+    assert 'cheetah_test_seconds_bucket{stage="check",le="+Inf"} 3\n' in text
+    assert 'cheetah_test_seconds_count{stage="check"} 3\n' in text
+
+
+def test_metrics_server(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("cheetah_test_total", "测试计数").inc()
+    server = MetricsServer(str(tmp_path / "metrics.sock"), registry)
+    server.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(tmp_path / "metrics.sock"))
+            client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+            response = b""
+            while True:
+                chunk = client.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+        assert response.startswith(b"HTTP/1.0 200 OK")
+        assert response.endswith(b"cheetah_test_total 1\n")
+    finally:
+        server.stop()
+        server.join()
@@ -0,0 +1,29 @@
+from pyarrow import plasma
+
+from cheetah.object_cache import ObjectCache
+from cheetah.plasma_store import generation_object_id
+
+
+def test_generation_invalidation_and_lru():
+    cache = ObjectCache(max_bytes=100)
+    a1, a2, b1, c1 = (generation_object_id("a", 1), generation_object_id("a", 2), generation_object_id("b", 1), generation_object_id("c", 1))
+    value = {"x": 1}
+    cache.put("a", a1, value, 40)
+    assert cache.get("a", a1) is value
+    # 发布了新的一代，旧一代的缓存作废
+    assert cache.get("a", a2) is plasma.ObjectNotAvailable
+    assert cache.get("a", a1) is plasma.ObjectNotAvailable
+    assert cache.used_bytes == 0
+
+    cache.put("a", a1, "a", 40)
+    cache.put("b", b1, "b", 40)
+    cache.get("a", a1)  # a比b更近被使用
+    cache.put("c", c1, "c", 40)
+    assert cache.get("b", b1) is plasma.ObjectNotAvailable
+    assert cache.get("a", a1) == "a" and cache.get("c", c1) == "c"
+    assert cache.used_bytes == 80
+
+    cache.put("b", b1, "too big", 101)  # 超过预算的对象不缓存
+    assert cache.get("b", b1) is plasma.ObjectNotAvailable
+    cache.invalidate()
+    assert cache.cached() == [] and cache.used_bytes == 0
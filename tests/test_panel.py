@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cheetah.panel import Panel
+
+
+def make_frame():
+    index = pd.MultiIndex.from_product([pd.bdate_range("2020-01-01", "2020-01-10"), ["600000.CNSESH", "000001.CNSESZ"]], names=["tdate", "symbol"])
+    df = pd.DataFrame({"收盘价": np.arange(len(index), dtype="float32"), "成交量": np.arange(len(index)), "证券名称": ["浦发银行", "平安银行"] * 8}, index=index)
+    return df.drop(index=(pd.Timestamp("2020-01-03"), "600000.CNSESH")).sort_index()  # 停牌一天
+
+
+def test_panel_round_trip():
+    df = make_frame()
+    panel = Panel(pd.bdate_range("2020-01-01", "2020-01-10"))
+    panel.set_index(df.index.get_level_values(0).values, df.index.get_level_values(1).values)
+    for col in df.columns:
+        panel.add_factor(col, df[col].values)
+    assert panel.shape == (8, 2)
+    assert list(panel.symbols) == ["000001.CNSESZ", "600000.CNSESH"]
+
+    result = panel.get(list(df.columns), datetime(2020, 1, 2), datetime(2020, 1, 6))
+    expected = df.loc["2020-01-02":"2020-01-06"]
+    pd.testing.assert_frame_equal(expected, result, check_dtype=False)
+    assert result["成交量"].dtype == "float64"  # 有缺失时整数转为浮点
+
+    wide = panel.frame("收盘价", datetime(2020, 1, 3), datetime(2020, 1, 3), ["600000.CNSESH", "000001.CNSESZ", "不存在"])
+    assert list(wide.columns) == ["600000.CNSESH", "000001.CNSESZ"]
+    assert np.isnan(wide.iloc[0, 0]) and wide.iloc[0, 1] == df.loc[("2020-01-03", "000001.CNSESZ"), "收盘价"]
+    assert np.shares_memory(panel.values("收盘价", datetime(2020, 1, 2)), panel.factors["收盘价"])
+    assert panel.get(["收盘价"], datetime(2021, 1, 1)).empty
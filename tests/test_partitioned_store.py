@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pyarrow import plasma
+
+from cheetah.partitioned_store import PartitionedData, PARTITION_MONTH, partition_name, partition_object_id
+from cheetah.service import DataMan, STORAGE_ARROW
+
+
+class PriceMan(DataMan):
+    storage_format = STORAGE_ARROW
+    partition_freq = PARTITION_MONTH
+
+    def __init__(self):
+        super().__init__("price", "价格", datetime(2020, 1, 1))
+
+    def fetch_data(self, start, end):
+        dates = pd.bdate_range(start, end)
+        return pd.DataFrame({"close": np.arange(len(dates), dtype="float64")}, index=pd.Index(dates, name="tdate"))
+
+    @staticmethod
+    def merge_data(old_data, insert_data):
+        merged = pd.concat([old_data, insert_data])
+        return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+    def check_data(self, data):
+        return set()
+
+    @classmethod
+    def get_serialization_context(cls):
+        pass
+
+    @staticmethod
+    def serialize(data):
+        pass
+
+    @staticmethod
+    def deserialize(data):
+        pass
+
+
+def test_partition_name():
+    assert partition_name(datetime(2020, 3, 5), PARTITION_MONTH) == "202003"
+    assert partition_name("20200305", "Y") == "2020"
+
+
+def test_partitioned_update(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    man = PriceMan()
+    history = man.fetch_data(datetime(2020, 1, 1), datetime(2020, 3, 31))
+    first = plasma.ObjectID.from_random()
+    man.store(plasma_client, history, first)
+    assert len(man.object_ids(first)) == 4  # 三个月的分区和清单
+
+    stored = man.load(plasma_client, first)
+    assert stored.names(datetime(2020, 2, 10), datetime(2020, 3, 1)) == ["202002", "202003"]
+    delta = man.fetch_data(datetime(2020, 3, 31), datetime(2020, 4, 2))
+    merged = man.merge(stored, delta)
+    assert sorted(merged.dirty) == ["202003", "202004"]  # 只读取、重写新数据涉及的分区
+
+    second = plasma.ObjectID.from_random()
+    man.数据获取ID = first
+    man.store(plasma_client, merged, second)
+    reused = set(man.object_ids(first)) & set(man.object_ids(second))
+    assert reused == {partition_object_id(first, "202001"), partition_object_id(first, "202002")}
+
+    result = PartitionedData.open(plasma_client, second, lambda object_id: man._load_object(plasma_client, object_id)).materialize(man.combine_partitions)
+    pd.testing.assert_frame_equal(result, man.merge_data(history, delta))
+    plasma_client.disconnect()
@@ -0,0 +1,25 @@
+import os
+
+from cheetah.publication import PublishedPointers
+
+
+def test_generations_survive_unpublish_and_reset(tmp_path):
+    plasma_store_name = os.path.join(tmp_path, "plasma")
+    service = PublishedPointers(plasma_store_name)
+    service.reset()
+    first_instance = service.instance
+    assert [service.next_generation("a") for _ in range(2)] == [1, 2]
+    service.publish("a", 2)
+    client = PublishedPointers(plasma_store_name)
+    assert client.resolve("a") == 2 and client.instance == first_instance
+
+    service.unpublish("a")
+    assert client.resolve("a") is None
+    assert service.next_generation("a") == 3  # 取消发布后不从1重新开始
+
+    restarted = PublishedPointers(plasma_store_name)
+    restarted.reset()  # 服务重新启动
+    assert client.resolve("a") is None and client.instance != first_instance
+    assert restarted.next_generation("a") == 4
+    PublishedPointers(plasma_store_name).publish("b", 1)  # 另一个写入者不覆盖已有的指针
+    assert restarted.next_generation("a") == 5 and client.resolve("b") == 1
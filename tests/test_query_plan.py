@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from cheetah.metadata_catalog import MetadataCatalog
+from cheetah.query_plan import plan_query, align
+
+
+def test_plan_query():
+    catalog = MetadataCatalog(
+        {
+            "收盘价": {"name": "收盘价", "belong_to": "CHDQUOTE_ADJ", "alias": ["TCLOSE"]},
+            "证券名称": {"name": "证券名称", "belong_to": "CHDQUOTE_ADJ", "alias": ["SNAME"]},
+            "风险信号": {"name": "风险信号", "belong_to": "RISK_SIGNAL"},
+        }
+    )
+    plan = plan_query(catalog, ["tclose", "风险信号", "收盘价", "SNAME"])
+    assert plan.names == ["收盘价", "风险信号", "收盘价", "证券名称"]
+    assert [(scan.source, scan.columns, scan.table_columns) for scan in plan.scans] == [
+        ("CHDQUOTE_ADJ", ["收盘价", "证券名称"], ["TCLOSE", "SNAME"]),
+        ("RISK_SIGNAL", ["风险信号"], ["风险信号"]),
+    ]
+    with pytest.raises(KeyError):
+        plan_query(catalog, ["收盘价", "不存在"])
+
+
+def test_align():
+    quote = pd.DataFrame(
+        {"收盘价": [1.0, 2.0, 3.0], "成交量": [10, 20, 30]},
+        index=pd.MultiIndex.from_tuples([("2020-01-02", "A"), ("2020-01-02", "B"), ("2020-01-03", "A")], names=["tdate", "symbol"]),
+    )
+    risk = pd.DataFrame({"风险信号": ["x", "y"]}, index=pd.MultiIndex.from_tuples([("2020-01-03", "C"), ("2020-01-02", "B")], names=["tdate", "symbol"]))
+    for df in (quote, risk):
+        df.index = df.index.set_levels(pd.to_datetime(df.index.levels[0]), level=0)
+    pieces = [(df.index.get_level_values(0).values, df.index.get_level_values(1).values, {col: df[col].values for col in df.columns}) for df in (quote, risk)]
+
+    result = align(pieces)
+    expected = pd.concat([quote, risk], axis=1).sort_index()
+    pd.testing.assert_frame_equal(expected, result, check_dtype=False, check_index_type=False)
+    assert result["成交量"].dtype == "float64"
+    assert align([]).empty
@@ -0,0 +1,61 @@
+from datetime import datetime, time
+
+import pytest
+
+from cheetah.schedule import IntervalPolicy, TradingDayPolicy, AfterClosePolicy, RefreshScheduler, RefreshPolicy
+
+
+class FakeMan(object):
+    def __init__(self, id, refresh_policy=None):
+        self.数据标识符 = id
+        self.refresh_policy = refresh_policy
+
+
+def test_trading_day_policy():
+    policy = TradingDayPolicy(time(15, 30), time(8, 30))
+    # 2020-01-03是周五，下一个交易日是2020-01-06周一
+    assert policy.next_due(datetime(2020, 1, 3, 7)) == datetime(2020, 1, 3, 8, 30)
+    assert policy.next_due(datetime(2020, 1, 3, 8, 30)) == datetime(2020, 1, 3, 15, 30)
+    assert policy.next_due(datetime(2020, 1, 3, 16)) == datetime(2020, 1, 6, 8, 30)
+    assert AfterClosePolicy().next_due(datetime(2020, 1, 4, 10)) == datetime(2020, 1, 6, 15, 30)
+
+
+def test_scheduler_only_pops_due_objects():
+    scheduler = RefreshScheduler(IntervalPolicy(300))
+    daily, fast = FakeMan("daily", AfterClosePolicy()), FakeMan("fast")
+    now = datetime(2020, 1, 3, 10)
+    # 第一次见到的对象立即到期
+    assert sorted(scheduler.pop_due(now, ["daily", "fast"])) == ["daily", "fast"]
+    scheduler.reschedule(daily, now)
+    scheduler.reschedule(fast, now)
+    assert scheduler.next_due_time() == datetime(2020, 1, 3, 10, 5)
+    assert scheduler.pop_due(datetime(2020, 1, 3, 10, 4), ["daily", "fast"]) == []
+    assert scheduler.pop_due(datetime(2020, 1, 3, 10, 5), ["daily", "fast"]) == ["fast"]
+    scheduler.reschedule(fast, datetime(2020, 1, 3, 10, 5))
+    # 重新安排后旧的到期时间作废；已移除的对象不再返回
+    scheduler.schedule_now("fast")
+    assert scheduler.pop_due(datetime(2020, 1, 3, 10, 6), ["fast"]) == ["fast"]
+    assert scheduler.pop_due(datetime(2020, 1, 3, 15, 30), []) == []
+    assert scheduler.next_due_time() is None
+
+
+class WeekdayCalendar(object):
+    @staticmethod
+    def is_tdate(day: datetime) -> bool:
+        return day.weekday() < 5 and day.date() != datetime(2020, 1, 6).date()
+
+
+def test_injected_calendar_and_retry_on_failure():
+    with pytest.raises(TypeError):
+        RefreshPolicy()
+    policy = TradingDayPolicy(time(8, 30), time(15, 30), calendar=WeekdayCalendar())
+    assert policy.next_due(datetime(2020, 1, 3, 16)) == datetime(2020, 1, 7, 8, 30)  # 日历中2020-01-06不是交易日
+
+    scheduler = RefreshScheduler(IntervalPolicy(300), retry_interval=600)
+    hishty = FakeMan("hishty", policy)
+    scheduler.reschedule(hishty, datetime(2020, 1, 3, 8, 31), succeeded=False)
+    assert scheduler.next_due_time() == datetime(2020, 1, 3, 8, 41)  # 失败后不等到15:30
+    scheduler.reschedule(hishty, datetime(2020, 1, 3, 15, 25), succeeded=False)
+    assert scheduler.next_due_time() == datetime(2020, 1, 3, 15, 30)  # 刷新策略的下个时点更早
+    scheduler.reschedule(hishty, datetime(2020, 1, 3, 8, 31))
+    assert scheduler.next_due_time() == datetime(2020, 1, 3, 15, 30)
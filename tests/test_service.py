@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cheetah.arrow_store import get_table
+from cheetah.plasma_store import generation_object_id
+from cheetah.service import DataMan, DataService, STORAGE_ARROW
+
+
+class FrameMan(DataMan):
+    """每次刷新都整体替换为新获取的数据"""
+
+    storage_format = STORAGE_ARROW
+
+    def __init__(self, rows: int = 10000):
+        super().__init__("test_frame__________", "测试数据", datetime(2020, 1, 1))
+        self.rows = rows
+        self.delay = 0
+        self.error = None
+        self.fetching = threading.Event()
+        self.closed = False
+
+    def fetch_data(self, start: datetime, end: datetime) -> pd.DataFrame:
+        self.fetching.set()
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return pd.DataFrame({"value": np.arange(self.rows, dtype="float64")})
+
+    @staticmethod
+    def merge_data(old_data, insert_data):
+        return insert_data
+
+    def check_data(self, data):
+        return {(datetime(2020, 1, 1), datetime(2020, 1, 2))}
+
+    def close(self):
+        self.closed = True
+
+    @classmethod
+    def get_serialization_context(cls):
+        pass
+
+    @staticmethod
+    def serialize(data):
+        pass
+
+    @staticmethod
+    def deserialize(data):
+        pass
+
+
+@pytest.fixture()
+def service(tmp_path):
+    service = DataService(os.path.join(tmp_path, "plasma"), [FrameMan()], plasma_shm_size=10, gc_delay=3600)
+    time.sleep(0.5)
+    yield service
+    service.stop()
+    DataService._instances.pop(DataService, None)
+
+
+def test_retired_generation_does_not_trigger_eviction(service):
+    dataman = service.objects["test_frame__________"]
+    service.deal_object(dataman)
+    service.check_object_list()
+    live = service.capacity.sizes[dataman.数据标识符]
+    service.deal_object(dataman)  # 旧一代退役，gc_delay之内仍占用内存
+    with service.pool.connection() as plasma_client:
+        used, capacity = service._store_usage(plasma_client)
+    assert used >= 2 * live
+    # 只有在用的一代时不超过high_watermark，加上退役的一代就超过了
+    service.capacity.high_watermark = 1.5 * live / capacity
+    service.capacity.low_watermark = 1.2 * live / capacity
+    assert service.relieve_pressure() == []
+    assert dataman.数据获取ID is not None
+
+
+def test_stop_waits_for_refresh(service):
+    dataman = service.objects["test_frame__________"]
+    dataman.delay = 1
+    service.start()
+    assert dataman.fetching.wait(5)
+    service.stop()  # 刷新进行中，等刷新完成后再关闭连接
+    assert not service.is_alive()
+    assert dataman.数据获取ID is not None
+    assert dataman.closed
+
+
+def test_deal_object_reports_failure(service):
+    dataman = service.objects["test_frame__________"]
+    assert service.deal_object(dataman)
+    published = dataman.数据获取ID
+    dataman.error = ConnectionError("数据库连接失败")
+    assert not service.deal_object(dataman)
+    assert dataman.数据获取ID == published  # 继续使用旧数据
+
+
+def test_reload_after_eviction(service):
+    dataman = service.objects["test_frame__________"]
+    assert service.deal_object(dataman) and service.deal_object(dataman)  # 第1代退役，gc_delay之内仍在store中
+    service.evict(dataman.数据标识符)
+    service.capacity.readmit(dataman.数据标识符)
+    assert service.deal_object(dataman)  # 重新加载不与仍在store中的旧一代撞上同一个object_id
+    assert dataman.数据获取ID == generation_object_id(dataman.数据标识符, 3)
+    assert service.pointers.resolve(dataman.数据标识符) == 3
+    with service.pool.connection() as plasma_client:
+        assert get_table(plasma_client, dataman.数据获取ID).num_rows == dataman.rows
+
+
+def test_admit_ignores_retired_generations_and_reloads_after_eviction(service):
+    dataman = service.objects["test_frame__________"]
+    assert service.deal_object(dataman) and service.deal_object(dataman)
+    with service.pool.connection() as plasma_client:
+        used, capacity = service._store_usage(plasma_client)
+        retired = service._retired_size(plasma_client)
+        # 算上退役的一代放不下，不算就放得下；本对象是唯一的对象，没有更冷的数据可以淘汰
+        assert service._admit(plasma_client, dataman, capacity - used + retired // 2)
+    service.capacity.release(capacity - used + retired // 2)
+
+    service.check_object_list()
+    service.capacity.high_watermark = service.capacity.low_watermark = 0.5 * service.capacity.sizes[dataman.数据标识符] / capacity
+    assert service.relieve_pressure() == [dataman.数据标识符]
+    assert dataman.数据获取ID is None and service.pointers.resolve(dataman.数据标识符) is None
+    service.capacity.readmit(dataman.数据标识符)
+    assert service.deal_object(dataman)  # 被淘汰后重新加载
+    assert service.pointers.resolve(dataman.数据标识符) == 3
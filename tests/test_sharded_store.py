@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pyarrow import plasma
+
+from cheetah.object_cache import ObjectCache
+from cheetah.sharded_store import ShardedFrame, ShardedUpdate, write_sharded, sharded_object_ids
+
+
+def make_frame():
+    index = pd.MultiIndex.from_product([pd.bdate_range("2020-01-01", "2020-01-10"), ["000001.CNSESZ", "600000.CNSESH"]], names=["tdate", "symbol"])
+    return pd.DataFrame({"收盘价": np.arange(len(index), dtype="float32"), "证券名称": ["平安银行", "浦发银行"] * 8}, index=index)
+
+
+def test_sharded_round_trip(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    df = make_frame()
+    object_id = plasma.ObjectID.from_random()
+    object_ids = write_sharded(plasma_client, df, object_id)
+    assert set(object_ids) <= set(sharded_object_ids(object_id, df.columns))
+
+    frame = ShardedFrame(plasma_client, object_id)
+    assert frame.columns == ["收盘价", "证券名称"]
+    pd.testing.assert_frame_equal(df, frame.to_dataframe())
+
+    result = frame.get(["收盘价"], datetime(2020, 1, 2), datetime(2020, 1, 3))
+    pd.testing.assert_frame_equal(df.loc["2020-01-02":"2020-01-03", ["收盘价"]], result)
+    assert frame.get(["收盘价"], datetime(2021, 1, 1), datetime(2021, 1, 3)).empty
+    assert ShardedFrame.open(plasma_client, plasma.ObjectID.from_random()) is plasma.ObjectNotAvailable
+    plasma_client.disconnect()
+
+
+def test_sharded_tiered(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    df = make_frame()
+    object_id = plasma.ObjectID.from_random()
+    object_ids = write_sharded(plasma_client, df, object_id, hot_from=datetime(2020, 1, 8))
+    assert len(object_ids) == 2 + 2 * len(df.columns)
+    assert set(object_ids) <= set(sharded_object_ids(object_id, df.columns))
+
+    cache = ObjectCache(1 << 20)
+    frame = ShardedFrame(plasma_client, object_id, cold_cache=cache)
+    assert frame.hot_from == 10
+    pd.testing.assert_frame_equal(df.loc["2020-01-08":, ["收盘价"]], frame.get(["收盘价"], datetime(2020, 1, 8)))
+    assert cache.cached() == []  # 只读取热数据时不解压冷数据
+    pd.testing.assert_frame_equal(df, frame.to_dataframe())
+    pd.testing.assert_frame_equal(df.loc["2020-01-06":"2020-01-09"], frame.get(df.columns, datetime(2020, 1, 6), datetime(2020, 1, 9)))
+    assert len(cache.cached()) == 2
+    plasma_client.disconnect()
+
+
+def test_sharded_update(plasma_store_name):
+    plasma_client = plasma.connect(plasma_store_name)
+    df = make_frame()
+    object_id = plasma.ObjectID.from_random()
+    write_sharded(plasma_client, df.loc[:"2020-01-09"], object_id, hot_from=datetime(2020, 1, 7))
+
+    cache = ObjectCache(1 << 20)
+    update = ShardedUpdate(ShardedFrame(plasma_client, object_id, cold_cache=cache), df.loc["2020-01-10":])
+    assert update.appends
+    appended = plasma.ObjectID.from_random()
+    update.write(plasma_client, appended, hot_from=datetime(2020, 1, 8))
+    assert cache.cached() == []  # 冷数据分片原样复制，不解压
+    frame = ShardedFrame(plasma_client, appended)
+    assert frame.hot_from == 8  # 冷热分界保持不变
+    pd.testing.assert_frame_equal(df, frame.to_dataframe())
+
+    backfill = df.loc["2020-01-02":"2020-01-03"].assign(收盘价=np.float32(-1))  # 中间的交易日，与已有的行重复，以新数据为准
+    merged = plasma.ObjectID.from_random()
+    ShardedUpdate(frame, backfill).write(plasma_client, merged, hot_from=datetime(2020, 1, 8))
+    expected = df.copy()
+    expected.loc["2020-01-02":"2020-01-03", "收盘价"] = np.float32(-1)
+    pd.testing.assert_frame_equal(expected, ShardedFrame(plasma_client, merged).to_dataframe())
+    plasma_client.disconnect()
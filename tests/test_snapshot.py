@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pyarrow import plasma
+
+from cheetah.arrow_store import put_table, get_table, dataframe_to_table
+from cheetah.snapshot import SnapshotStore
+
+
+def test_snapshot_save_and_restore(plasma_store_name, tmp_path):
+    plasma_client = plasma.connect(plasma_store_name)
+    snapshots = SnapshotStore(str(tmp_path / "snapshot"))
+    df = pd.DataFrame({"收盘价": np.arange(3.0)})
+    arrow_id, pickled_id = plasma.ObjectID.from_random(), plasma.ObjectID.from_random()
+    put_table(plasma_client, dataframe_to_table(df), arrow_id)
+    plasma_client.put({"20200102": {}}, object_id=pickled_id)
+    data_range = (datetime(2010, 1, 1), datetime(2020, 1, 2))
+
+    assert snapshots.save(plasma_client, "a/b", 1, [arrow_id, pickled_id], data_range)
+    assert snapshots.watermark("a/b") is None
+    assert snapshots.save(plasma_client, "a/b", 2, [arrow_id, pickled_id], data_range, (datetime(2020, 1, 2), None))
+    assert snapshots.latest("a/b")["generation"] == 2
+    assert snapshots.watermark("a/b") == (datetime(2020, 1, 2), None)
+    assert not snapshots.save(plasma_client, "a/b", 3, [plasma.ObjectID.from_random()], data_range)
+    assert snapshots.latest("a/b")["generation"] == 2
+
+    plasma_client.delete([arrow_id, pickled_id])
+    assert snapshots.restore(plasma_client, "a/b") == (2, data_range)
+    pd.testing.assert_frame_equal(df, get_table(plasma_client, arrow_id).to_pandas())
+    assert plasma_client.get(pickled_id, timeout_ms=0) == {"20200102": {}}
+    assert snapshots.restore(plasma_client, "other") is plasma.ObjectNotAvailable
+    plasma_client.disconnect()
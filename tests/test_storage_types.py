@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from cheetah.storage_types import enforce_dtypes, storage_dtype, DICTIONARY
+
+
+def test_storage_dtype():
+    assert storage_dtype("f3") == np.float32
+    assert storage_dtype("i4") == np.int32
+    assert storage_dtype("S13") == DICTIONARY and storage_dtype("U6") == DICTIONARY
+    assert storage_dtype("不是dtype") is None
+
+
+def test_enforce_dtypes():
+    n = 1000
+    df = pd.DataFrame(
+        {
+            "收盘价": np.linspace(1, 2, n),
+            "成交量": np.arange(n, dtype="float64"),
+            "停牌": np.where(np.arange(n) % 7 == 0, np.nan, 1.0),
+            "证券名称": np.array(["浦发银行", "平安银行"] * (n // 2), dtype=object),
+            "备注": ["x"] * n,
+        }
+    )
+    result, savings = enforce_dtypes(df, {"收盘价": "f3", "成交量": "i4", "停牌": "bool", "证券名称": "U6", "备注": "不是dtype"})
+    assert result.dtypes.to_dict() == {
+        "收盘价": np.float32,
+        "成交量": np.int32,
+        "停牌": np.float32,  # 有缺失值，保留为浮点
+        "证券名称": pd.CategoricalDtype(["平安银行", "浦发银行"]),
+        "备注": np.dtype(object),
+    }
+    assert [saving.column for saving in savings] == ["收盘价", "成交量", "停牌", "证券名称"]
+    assert all(saving.bytes_after < saving.bytes_before for saving in savings)
+    np.testing.assert_array_equal(result["证券名称"].astype(object).values, df["证券名称"].values)
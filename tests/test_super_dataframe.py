@@ -1,6 +1,12 @@
-import logging
 import os
+from datetime import datetime
 
+import numpy as np
+import pandas as pd
+from pyarrow import plasma
+from ruamel.yaml import YAML
+
+from benchmarks.synthetic import SyntheticTables, trade_days
 from cheetah.super_dataframe import SuperDataFrameMan, load_metadata
 
 
@@ -11,3 +17,69 @@ def test_load_metadata(conf_dir):
     assert "证券代码" == sdf_man.sdf.get_table_colname("symbol")
     assert "risk_signal_identity" == sdf_man.sdf.get_table_colname("risk_signal_identity")
     assert "TCLOSE_20" == sdf_man.sdf.get_table_colname("20日前收盘价")
+    # 20日前收盘价仍从数据表获取，示例的计算因子20日涨跌幅由收盘价计算
+    assert "20日前收盘价" not in sdf_man.factor_engine.specs
+    assert ["收盘价"] == sdf_man.factor_engine.specs["20日涨跌幅"].dependencies
+
+
+def make_sdf_man(tmp_path, tables: SyntheticTables, derived: dict = None, factor_workers: int = 0) -> SuperDataFrameMan:
+    """由合成数据表生成元数据，derived为需要计算的Factor：{名称: (calculate_method, dependencies, lookback)}"""
+    metadata_file = os.path.join(tmp_path, "metadata.yaml")
+    tables.write_metadata(metadata_file)
+    if derived:
+        with open(metadata_file, encoding="utf8") as file:
+            metadata = YAML().load(file)
+        for name, (method, dependencies, lookback) in derived.items():
+            metadata["Factors"][name] = {"dtype": "f8", "belong_to": "SYN0", "calculate_method": method, "dependencies": dependencies, "lookback": lookback}
+        with open(metadata_file, "w", encoding="utf8") as file:
+            YAML().dump(metadata, file)
+    return SuperDataFrameMan(metadata_file, start=datetime(2020, 1, 1), table_operator=tables, factor_workers=factor_workers)
+
+
+def test_attach_rebinds_connection(tmp_path, plasma_store_name):
+    tables = SyntheticTables(5, 2)
+    sdf_man = make_sdf_man(tmp_path, tables)
+    days = trade_days(datetime(2020, 1, 31), 10)
+    first, second = plasma.connect(plasma_store_name), plasma.connect(plasma_store_name)
+    object_id = sdf_man.store(first, sdf_man.fetch_data(days[0], days[-1]), plasma.ObjectID.from_random())
+    frame = sdf_man.attach(first, object_id)
+    sdf_man.get(days[0], days[-1], ["因子0"])
+    # 仍是同一代数据时沿用已读取的列，但之后用新借用的连接读取
+    assert sdf_man.attach(second, object_id) is frame and frame.plasma_client is second
+    first.disconnect()
+    result = sdf_man.get(days[0], days[-1], ["因子0", "因子1"])
+    second.disconnect()
+    expected = tables.query("SYN0", days[0], days[-1])
+    pd.testing.assert_frame_equal(result, expected.set_axis(["因子0", "因子1"], axis=1), check_names=False)
+
+
+def test_store_computes_only_new_trading_day(tmp_path, plasma_store_name):
+    tables = SyntheticTables(5, 2)
+    derived = {"前收": (["shift", [1]], ["因子0"], 1), "变化": (["pct_change", [1]], ["因子1"], 1), "均价": (["rolling_mean", [3]], ["前收"], 2)}
+    sdf_man = make_sdf_man(tmp_path, tables, derived, factor_workers=2)
+    days = trade_days(datetime(2020, 1, 31), 10)
+    plasma_client = plasma.connect(plasma_store_name)
+    object_id = sdf_man.store(plasma_client, sdf_man.fetch_data(days[0], days[-2]), plasma.ObjectID.from_random())
+
+    computed = []
+    compute = sdf_man.factor_engine.compute
+
+    def record(panel, start_row=0):
+        computed.append((panel.shape[0], start_row))
+        return compute(panel, start_row)
+
+    sdf_man.factor_engine.compute = record
+    update = sdf_man.merge_data(sdf_man.load(plasma_client, object_id), sdf_man.fetch_data(days[-1], days[-1]))
+    object_id = sdf_man.store(plasma_client, update, plasma.ObjectID.from_random())
+    assert computed == [(3, 2)]  # 只计算新的一个交易日，往前多取lookback个交易日作为输入
+    assert sdf_man.factor_engine._pool is not None  # 同一层有两个Factor，用进程池计算
+    sdf_man.close()
+    assert sdf_man.factor_engine._pool is None
+
+    full = make_sdf_man(tmp_path, tables, derived)
+    full_id = full.store(plasma_client, full.fetch_data(days[0], days[-1]), plasma.ObjectID.from_random())
+    result = sdf_man.load(plasma_client, object_id).to_dataframe()
+    expected = full.load(plasma_client, full_id).to_dataframe()
+    pd.testing.assert_frame_equal(result, expected[result.columns])
+    assert np.isfinite(result["均价"].loc[days[-1]]).all()
+    plasma_client.disconnect()